@@ -14,14 +14,26 @@
 
 
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
 import soundfile as sf
 import librosa
-from scipy.signal import spectrogram, find_peaks
-from scipy.ndimage import gaussian_filter1d
 from sklearn.preprocessing import MinMaxScaler
 
+# Modules partagés avec le système temps réel (moteur spectral, détecteur de cris)
+SYS_AUTOMA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               "..", "..", "7-project_final_apis", "sys_automa_final"))
+if SYS_AUTOMA_DIR not in sys.path:
+    sys.path.append(SYS_AUTOMA_DIR)
+from spectral_engine import SpectralFrameEngine
+from cry_events import detect_cry_events
+from feature_cache import get_feature_cache
+from feature_store import FeatureStore
+
 # =======================
 # Configuration globale
 # =======================
@@ -29,6 +41,7 @@ DOSSIER_SON = "son"
 DUREE_FENETRE = 5  # secondes
 CSV_SORTIE = "resultats_audio_final.csv"
 CSV_RESUME = "resumes_par_fichier.csv"
+STORE_BLOC_LIGNES = 10000  # lignes par fichier Parquet écrit dans le store (partition "real")
 TAUX_ECHANTILLONNAGE = 44100  # Hz
 N_MFCC = 13  # Nombre de coefficients MFCC
 
@@ -38,27 +51,53 @@ SEUIL_CRI_FREQ_MAX = 6000
 SEUIL_CRI_PUISSANCE = 0.3
 MIN_DUREE_CRI = 0.3
 
+# Estimation du nombre de sources (NMF)
+NMF_COMPOSANTES = 3
+SEUIL_SOURCE = 0.1            # amplitude reconstruite au-dessus de laquelle une bande compte
+ESTIMATEUR_SOURCES = "rapide" # "nmf" (référence librosa) ou "rapide"
+NMF_REDUCTION = (1, 8)        # mode rapide : maximum par blocs (fréquences, trames)
+NMF_ITER_RAPIDE = 30          # mode rapide : itérations multiplicatives par tranche
+
+# Construction parallèle du corpus
+N_WORKERS = None              # None : un processus par cœur
+CONTEXTE_INITIAL = ()         # historique de danger au début de chaque fichier
+
+# Version des features : à incrémenter quand l'analyse change (invalide le cache)
+FEATURE_VERSION = 1
+
 class AudioAnalyzer:
-    def __init__(self):
+    def __init__(self, estimateur_sources="nmf"):
         self.danger_history = []
         self.scaler = MinMaxScaler()
+        self.moteur_spectral = SpectralFrameEngine(sample_rate=TAUX_ECHANTILLONNAGE)
+        # Estimateur du nombre de sources : nom ("nmf", "rapide") ou fonction S -> composantes
+        self.estimateurs_sources = {'nmf': self.composantes_nmf, 'rapide': self.composantes_nmf_rapide}
+        self.estimateur_sources = (estimateur_sources if callable(estimateur_sources)
+                                   else self.estimateurs_sources[estimateur_sources])
+        self.nmf_init = None  # gabarits W de la tranche précédente, point de départ du mode rapide
         self.cri_types = {
             'bebe': {'centroid_min': 2500, 'bandwidth_min': 1000, 'mfcc_range': (-300, -100)},
             'enfant': {'centroid_min': 2000, 'bandwidth_min': 800, 'mfcc_range': (-200, -50)},
             'adulte': {'centroid_min': 1500, 'bandwidth_min': 600, 'mfcc_range': (-100, 0)}
         }
         
+    def reinitialiser_contexte(self, danger_history=()):
+        """Repart d'un contexte explicite (mémoire de danger, gabarits NMF) pour un nouveau fichier"""
+        self.danger_history = list(danger_history)
+        self.nmf_init = None
+        
     def normaliser_donnees(self, data):
         """Normalise les données audio entre -1 et 1"""
         return data / np.max(np.abs(data) + 1e-6)
     
-    def extraire_features(self, tranche, sr):
-        """Extrait les caractéristiques audio avancées"""
+    def extraire_features(self, tranche, sr, S=None):
+        """Extrait les caractéristiques audio avancées (S : |STFT| de la tranche normalisée, si déjà calculé)"""
         # Normalisation
         tranche = self.normaliser_donnees(tranche)
         
         # Features spectrales
-        S = np.abs(librosa.stft(tranche))
+        if S is None:
+            S = self.moteur_spectral.magnitude(tranche)
         centroid = librosa.feature.spectral_centroid(S=S, sr=sr)[0]
         bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr)[0]
         flatness = librosa.feature.spectral_flatness(y=tranche)
@@ -93,50 +132,69 @@ class AudioAnalyzer:
                 return cri_type
         return None
     
-    def detecter_cri_avance(self, tranche, sr):
-        """Détection avancée de cris avec classification de type"""
-        # Analyse spectrale de base
-        nperseg = 1024
-        f, t, Sxx = spectrogram(tranche, fs=sr, nperseg=nperseg)
-        
-        # Détection dans les hautes fréquences
-        mask_freq = (f >= SEUIL_CRI_FREQ_MIN) & (f <= SEUIL_CRI_FREQ_MAX)
-        puissance_cri = np.mean(Sxx[mask_freq, :], axis=0)
-        puissance_tot = np.mean(Sxx, axis=0)
-        puissance_tot[puissance_tot == 0] = 1e-6
-        ratio_cri = puissance_cri / puissance_tot
-        ratio_cri = gaussian_filter1d(ratio_cri, sigma=2)
+    def detecter_cri_avance(self, tranche, sr, features=None, S=None):
+        """Détection avancée de cris avec classification de type
+
+        Ratio d'énergie 1.5-6 kHz par trame sur le spectre partagé, puis
+        détecteur d'événements commun (hystérésis entre le seuil adaptatif et
+        sa moitié, durée minimale MIN_DUREE_CRI).
+        """
+        if S is None:
+            S = self.moteur_spectral.magnitude(self.normaliser_donnees(tranche))
+        ratio_cri = self.moteur_spectral.cry_ratio(S ** 2)
         
         # Extraction des caractéristiques
-        features = self.extraire_features(tranche, sr)
+        if features is None:
+            features = self.extraire_features(tranche, sr, S=S)
         cri_type = self.detecter_type_cri(features)
         
         # Détection temporelle des cris
         seuil_adaptatif = max(SEUIL_CRI_PUISSANCE, float(np.percentile(ratio_cri, 90)))
-        peaks, _ = find_peaks(ratio_cri, height=seuil_adaptatif, distance=5)
-        
-        for peak in peaks:
-            start = max(0, t[peak] - 0.2)
-            end = min(t[-1], t[peak] + 0.2)
-            
-            while start > 0 and ratio_cri[int(start * sr / nperseg)] > seuil_adaptatif/2:
-                start -= 0.1
-            while end < t[-1] and ratio_cri[int(end * sr / nperseg)] > seuil_adaptatif/2:
-                end += 0.1
-                
-            if (end - start) >= MIN_DUREE_CRI:
-                return True, cri_type
-        
+        evenements = detect_cry_events(ratio_cri, self.moteur_spectral.frame_duration,
+                                       seuil_haut=seuil_adaptatif, seuil_bas=seuil_adaptatif / 2,
+                                       duree_min=MIN_DUREE_CRI, cri_type=cri_type)
+        if evenements:
+            return True, cri_type
         return False, None
     
-    def estimer_nbr_sources(self, tranche):
-        """Estimation du nombre de sources sonores"""
+    def composantes_nmf(self, S):
+        """Reconstruction NMF de référence (librosa, 3 composantes, jusqu'à convergence)"""
+        W, H = librosa.decompose.decompose(S, n_components=NMF_COMPOSANTES, sort=True)
+        return W @ H
+    
+    def composantes_nmf_rapide(self, S):
+        """Reconstruction NMF sur un spectre réduit, itérations plafonnées
+
+        Le spectre est réduit par maximum sur des blocs NMF_REDUCTION (le critère
+        porte sur le maximum par bande), puis NMF_ITER_RAPIDE mises à jour
+        multiplicatives partent des facteurs de la tranche précédente.
+        """
+        V = _reduire_max(S, NMF_REDUCTION)
+        if self.nmf_init is not None and self.nmf_init.shape[0] == V.shape[0]:
+            # Gabarits spectraux de la tranche précédente, ramenés à un maximum de 1 ;
+            # le plancher laisse une composante éteinte se rallumer
+            W = self.nmf_init / (self.nmf_init.max(axis=0, keepdims=True) + 1e-12)
+            W = np.maximum(W, 1e-3)
+        else:
+            W = np.random.default_rng(0).random((V.shape[0], NMF_COMPOSANTES))
+        # Activations initiales : projection de V sur les gabarits (échelle de la tranche)
+        H = np.maximum(W.T @ V / (W ** 2).sum(axis=0)[:, None], 1e-10)
+        for _ in range(NMF_ITER_RAPIDE):
+            H *= (W.T @ V) / (W.T @ W @ H + 1e-10)
+            W *= (V @ H.T) / (W @ (H @ H.T) + 1e-10)
+        self.nmf_init = W
+        return W @ H
+    
+    def estimer_nbr_sources(self, tranche, S=None):
+        """Estimation du nombre de sources sonores (S : |STFT| de la tranche normalisée, si déjà calculé)"""
         try:
-            # Séparation de sources par NMF
-            S = np.abs(librosa.stft(tranche))
-            W, H = librosa.decompose.decompose(S, n_components=3, sort=True)
-            components = W @ H
-            n_components = np.sum(np.max(components, axis=1) > 0.1)
+            # Séparation de sources par NMF sur le spectre non normalisé
+            if S is None:
+                S = np.abs(librosa.stft(tranche))
+            else:
+                S = S * (np.max(np.abs(tranche)) + 1e-6)
+            components = self.estimateur_sources(S)
+            n_components = np.sum(np.max(components, axis=1) > SEUIL_SOURCE)
             return min(3, max(1, n_components))
         except Exception as e:
             print(f"Erreur séparation sources: {str(e)}")
@@ -201,12 +259,15 @@ class AudioAnalyzer:
         peak = np.max(np.abs(tranche))
         dB = 20 * np.log10(rms + 1e-6)
         
+        # Spectre partagé par les features et la détection de cris
+        S = self.moteur_spectral.magnitude(self.normaliser_donnees(tranche))
+        features = self.extraire_features(tranche, sr, S=S)
+        
         # Détection avancée
-        cri_detecte, cri_type = self.detecter_cri_avance(tranche, sr)
-        n_sources = self.estimer_nbr_sources(tranche)
+        cri_detecte, cri_type = self.detecter_cri_avance(tranche, sr, features=features, S=S)
+        n_sources = self.estimer_nbr_sources(tranche, S=S)
         
         # Extraction des caractéristiques avancées
-        features = self.extraire_features(tranche, sr)
         features.update({'rms': rms, 'peak': peak, 'dB': dB})
         
         # Calcul du danger
@@ -228,6 +289,14 @@ class AudioAnalyzer:
             **features
         }
 
+def _reduire_max(S, facteurs):
+    """Maximum de S par blocs (fréquences, trames), bords complétés par des zéros"""
+    f, t = facteurs
+    n_f, n_t = -(-S.shape[0] // f), -(-S.shape[1] // t)
+    padded = np.zeros((n_f * f, n_t * t))
+    padded[:S.shape[0], :S.shape[1]] = S
+    return padded.reshape(n_f, f, n_t, t).max(axis=(1, 3))
+
 def traiter_fichier_audio(chemin, titre, id_debut, analyzer):
     """Traite un fichier audio complet"""
     try:
@@ -320,58 +389,201 @@ def traiter_fichier_audio(chemin, titre, id_debut, analyzer):
         print(f"Erreur traitement {titre}: {str(e)}")
         return [], id_debut, None
 
-def analyser_dossier_son():
-    """Analyse tous les fichiers audio du dossier"""
-    analyzer = AudioAnalyzer()
-    toutes_les_lignes = []
+# Colonnes du CSV détaillé (ordre)
+COLONNES_SORTIE = [
+    "id", "titre", "amplitude", "rms", "dB", "Peak", "Score",
+    "Danger%", "env", "cri", "cri_type", "moy_danger",
+    # Caractéristiques avancées
+    "centroid_mean", "bandwidth_mean", "flatness_mean",
+    "mfcc_mean", "pcen_mean", "zcr_mean"
+]
+
+_analyzer_worker = None  # AudioAnalyzer propre à chaque processus du pool
+_params_worker = None    # paramètres de l'analyse, partie de la clé du cache
+
+def _init_worker(estimateur_sources, limiter_threads):
+    global _analyzer_worker, _params_worker
+    if limiter_threads:
+        # Un seul thread BLAS par processus : les cœurs sont déjà occupés par le pool
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _analyzer_worker = AudioAnalyzer(estimateur_sources=estimateur_sources)
+    _params_worker = {
+        'sample_rate': TAUX_ECHANTILLONNAGE, 'window_size': DUREE_FENETRE,
+        'estimateur_sources': estimateur_sources if isinstance(estimateur_sources, str)
+                              else getattr(estimateur_sources, '__qualname__', repr(estimateur_sources)),
+        'contexte_initial': list(CONTEXTE_INITIAL)
+    }
+
+def _analyser_fichier(chemin, titre):
+    _analyzer_worker.reinitialiser_contexte(CONTEXTE_INITIAL)
+    return traiter_fichier_audio(chemin, titre, 0, _analyzer_worker)
+
+def _traiter_fichier_isole(chemin, titre):
+    """Traite un fichier depuis CONTEXTE_INITIAL (ids locaux à partir de 0)
+
+    Le résultat ne dépend que du contenu du fichier : il est repris du cache
+    de features quand ce contenu a déjà été analysé avec les mêmes paramètres.
+    """
+    cache = get_feature_cache()
+    if cache is None:
+        return _analyser_fichier(chemin, titre)
+    try:
+        lignes, n_tranches, resume = cache.get_or_compute(
+            chemin, 'analyse_audio_zeta', FEATURE_VERSION, _params_worker,
+            lambda: _analyser_fichier(chemin, titre), keep=lambda r: bool(r[0]))
+    except OSError as e:
+        print(f"Cache de features indisponible: {str(e)}")
+        return _analyser_fichier(chemin, titre)
+    for ligne in lignes:
+        ligne["titre"] = titre
+    if resume is not None:
+        resume["titre"] = titre
+    return lignes, n_tranches, resume
+
+def _ajout_store(store, table, reecrire):
+    """Fonction d'ajout à la partition "real" : réécriture complète ou nouveaux fichiers Parquet"""
+    if reecrire:
+        return store.rewrite(table, 'real')
+    return nullcontext(lambda df: store.append(table, 'real', df))
+
+def analyser_dossier_son(estimateur_sources=ESTIMATEUR_SOURCES, n_workers=N_WORKERS, reecrire=False):
+    """Analyse tous les fichiers audio du dossier
+
+    Les fichiers sont répartis sur n_workers processus ; chacun part du même
+    contexte initial (CONTEXTE_INITIAL), donc les CSV ne dépendent ni du
+    nombre de workers ni de l'ordre de traitement. Les lignes sont écrites au
+    fil de l'eau, dans l'ordre des fichiers, dans le CSV (complet) et dans la
+    partition "real" du store de features.
+
+    Seuls les fichiers dont le titre n'est pas encore dans le store y sont
+    ajoutés (nouveaux fichiers Parquet) : l'entraînement incrémental ne voit
+    que ces lignes. Un fichier modifié sous le même nom, supprimé du dossier,
+    ou un changement de FEATURE_VERSION demande reecrire=True (--reecrire),
+    qui remplace la partition et relance donc l'entraînement complet.
+    """
+    store = FeatureStore()
+    fichiers = sorted([f for f in os.listdir(DOSSIER_SON) if f.endswith('.wav')])
+    stockes = {table: set() if reecrire else set(store.read(table, ('real',), columns=['titre'])['titre'])
+               for table in ('details', 'summary')}
+    absents = stockes['details'] - set(fichiers)
+    if absents:
+        print(f"⚠️ {len(absents)} fichier(s) du store absents de '{DOSSIER_SON}' : --reecrire pour les retirer")
+    chemins = [os.path.join(DOSSIER_SON, f) for f in fichiers]
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(fichiers) or 1))
+
     resumes = []
     id_courant = 1
+    n_lignes, somme_danger = 0, 0.0
+    danger_max, danger_min = -np.inf, np.inf
+    tmp_sortie = f"{CSV_SORTIE}.tmp"
+    bloc = []
 
-    # Parcours des fichiers triés
-    fichiers = sorted([f for f in os.listdir(DOSSIER_SON) if f.endswith('.wav')])
-    
-    for fichier in fichiers:
-        chemin = os.path.join(DOSSIER_SON, fichier)
-        lignes, id_courant, resume = traiter_fichier_audio(chemin, fichier, id_courant, analyzer)
-        toutes_les_lignes.extend(lignes)
-        if resume is not None:
-            resumes.append(resume)
-
-    # Création du DataFrame des résultats détaillés
-    if toutes_les_lignes:
-        df = pd.DataFrame(toutes_les_lignes)
-        
-        # Sélection et ordre des colonnes
-        colonnes_principales = [
-            "id", "titre", "amplitude", "rms", "dB", "Peak", "Score", 
-            "Danger%", "env", "cri", "cri_type", "moy_danger"
-        ]
-        
-        # Ajout des caractéristiques avancées
-        colonnes_features = [
-            "centroid_mean", "bandwidth_mean", "flatness_mean",
-            "mfcc_mean", "pcen_mean", "zcr_mean"
-        ]
-        
-        colonnes = colonnes_principales + colonnes_features
-        
-        # Enregistrement des résultats
-        df.to_csv(CSV_SORTIE, index=False, columns=colonnes)
-        print(f"\n✅ Analyse terminée. {len(df)} tranches analysées.")
-        print(f"📊 Statistiques Danger%: Moy={df['Danger%'].mean():.1f} Max={df['Danger%'].max():.1f} Min={df['Danger%'].min():.1f}")
-        print(f"💾 Résultats détaillés enregistrés dans '{CSV_SORTIE}'")
+    if n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                   initargs=(estimateur_sources, True))
+        resultats = pool.map(_traiter_fichier_isole, chemins, fichiers)
+    else:
+        pool = None
+        _init_worker(estimateur_sources, False)
+        resultats = map(_traiter_fichier_isole, chemins, fichiers)
+
+    try:
+        with open(tmp_sortie, 'w', newline='', encoding='utf-8') as sortie, \
+                _ajout_store(store, 'details', reecrire) as ajouter_details:
+            for lignes, n_tranches, resume in resultats:
+                # Ids globaux : décalage des ids locaux par les fichiers précédents
+                for ligne in lignes:
+                    ligne["id"] += id_courant
+                id_courant += n_tranches
+                if resume is not None:
+                    resumes.append(resume)
+                if not lignes:
+                    continue
+                df_fichier = pd.DataFrame(lignes)
+                df_fichier.to_csv(sortie, index=False, columns=COLONNES_SORTIE, header=n_lignes == 0)
+                n_lignes += len(df_fichier)
+                somme_danger += df_fichier['Danger%'].sum()
+                danger_max = max(danger_max, df_fichier['Danger%'].max())
+                danger_min = min(danger_min, df_fichier['Danger%'].min())
+                if df_fichier['titre'].iloc[0] in stockes['details']:
+                    continue
+                bloc.append(df_fichier)
+                if sum(len(df) for df in bloc) >= STORE_BLOC_LIGNES:
+                    ajouter_details(pd.concat(bloc, ignore_index=True))
+                    bloc = []
+            if bloc:
+                ajouter_details(pd.concat(bloc, ignore_index=True))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Enregistrement des résultats détaillés
+    if n_lignes:
+        os.replace(tmp_sortie, CSV_SORTIE)
+        print(f"\n✅ Analyse terminée. {n_lignes} tranches analysées ({n_workers} worker(s)).")
+        print(f"📊 Statistiques Danger%: Moy={somme_danger / n_lignes:.1f} Max={danger_max:.1f} Min={danger_min:.1f}")
+        print(f"💾 Résultats détaillés enregistrés dans '{CSV_SORTIE}' et '{store.directory}'")
     else:
+        os.remove(tmp_sortie)
         print("Aucune donnée détaillée à enregistrer!")
 
     # Création du DataFrame des résumés
     if resumes:
         df_resume = pd.DataFrame(resumes)
         df_resume.to_csv(CSV_RESUME, index=False)
+        with _ajout_store(store, 'summary', reecrire) as ajouter_resumes:
+            ajouter_resumes(df_resume[~df_resume['titre'].isin(stockes['summary'])])
         print(f"\n📊 Résumés par fichier:")
         print(df_resume)
         print(f"💾 Résumés globaux enregistrés dans '{CSV_RESUME}'")
     else:
         print("Aucun résumé à enregistrer!")
 
+def comparer_estimateurs_sources(dossier=DOSSIER_SON, gains=(1.0, 0.05, 0.01)):
+    """Benchmark : temps et accord du mode rapide avec la NMF de référence
+
+    Chaque tranche est aussi évaluée atténuée (gains) pour couvrir les cas
+    proches de SEUIL_SOURCE, où le nombre de sources descend sous 3.
+    """
+    reference = AudioAnalyzer(estimateur_sources="nmf")
+    rapide = AudioAnalyzer(estimateur_sources="rapide")
+    n_samples = TAUX_ECHANTILLONNAGE * DUREE_FENETRE
+    temps = {'nmf': 0.0, 'rapide': 0.0}
+    resultats = []
+    for fichier in sorted(f for f in os.listdir(dossier) if f.endswith('.wav')):
+        data, sr_orig = sf.read(os.path.join(dossier, fichier))
+        if data.ndim > 1:
+            data = np.mean(data, axis=1)
+        if sr_orig != TAUX_ECHANTILLONNAGE:
+            data = librosa.resample(data, orig_sr=sr_orig, target_sr=TAUX_ECHANTILLONNAGE)
+        for i in range(len(data) // n_samples):
+            tranche = data[i * n_samples:(i + 1) * n_samples]
+            for gain in gains:
+                t = tranche * gain
+                S = reference.moteur_spectral.magnitude(reference.normaliser_donnees(t))
+                n = {}
+                for nom, analyzer in (('nmf', reference), ('rapide', rapide)):
+                    t0 = time.perf_counter()
+                    n[nom] = analyzer.estimer_nbr_sources(t, S=S)
+                    temps[nom] += time.perf_counter() - t0
+                resultats.append((fichier, i, gain, n['nmf'], n['rapide']))
+
+    if not resultats:
+        print("Aucune tranche à comparer!")
+        return None
+    df = pd.DataFrame(resultats, columns=['titre', 'tranche', 'gain', 'nmf', 'rapide'])
+    accord = (df['nmf'] == df['rapide']).mean() * 100
+    print(f"⏱️ NMF: {temps['nmf'] / len(df) * 1e3:.1f} ms/tranche | "
+          f"rapide: {temps['rapide'] / len(df) * 1e3:.1f} ms/tranche "
+          f"(x{temps['nmf'] / max(temps['rapide'], 1e-9):.0f})")
+    print(f"🎯 Accord sur le nombre de sources: {accord:.1f}% ({len(df)} tranches)")
+    print(pd.crosstab(df['nmf'], df['rapide'], rownames=['nmf'], colnames=['rapide']))
+    return df
+
 if __name__ == "__main__":
-    analyser_dossier_son()
\ No newline at end of file
+    if "--benchmark-sources" in sys.argv:
+        comparer_estimateurs_sources()
+    else:
+        n_workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else N_WORKERS
+        analyser_dossier_son(n_workers=n_workers, reecrire="--reecrire" in sys.argv)
\ No newline at end of file
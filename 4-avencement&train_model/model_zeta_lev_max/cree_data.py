@@ -2,11 +2,23 @@ import numpy as np
 import pandas as pd
 import librosa
 import os
+import sys
 import soundfile as sf
 from scipy.signal import spectrogram, find_peaks
 from scipy.ndimage import gaussian_filter1d
 import warnings
 
+# Cache de features partagé avec le système temps réel
+SYS_AUTOMA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               "..", "..", "7-project_final_apis", "sys_automa_final"))
+if SYS_AUTOMA_DIR not in sys.path:
+    sys.path.append(SYS_AUTOMA_DIR)
+from feature_cache import get_feature_cache
+from feature_store import FeatureStore
+
+# Version des features : à incrémenter quand l'extraction change (invalide le cache)
+FEATURE_VERSION = 1
+
 class AudioFeatureExtractor:
     def __init__(self, sample_rate=44100, window_size=5):
         self.sample_rate = sample_rate
@@ -14,6 +26,24 @@ class AudioFeatureExtractor:
         self.samples_per_window = sample_rate * window_size
         
     def process_audio_file(self, audio_path):
+        """Traite un fichier audio, résultat repris du cache si ce contenu a déjà été analysé"""
+        cache = get_feature_cache()
+        if cache is None:
+            return self.analyze_file(audio_path)
+        try:
+            detail_df, summary_df = cache.get_or_compute(
+                audio_path, 'cree_data', FEATURE_VERSION,
+                {'sample_rate': self.sample_rate, 'window_size': self.window_size},
+                lambda: self.analyze_file(audio_path), keep=lambda r: not r[0].empty)
+        except OSError as e:
+            print(f"Cache de features indisponible: {str(e)}")
+            return self.analyze_file(audio_path)
+        if not detail_df.empty:
+            detail_df['titre'] = os.path.basename(audio_path)
+            summary_df['titre'] = os.path.basename(audio_path)
+        return detail_df, summary_df
+    
+    def analyze_file(self, audio_path):
         """Traite un fichier audio avec gestion robuste des erreurs"""
         try:
             # Charger le fichier audio
@@ -197,6 +227,14 @@ if __name__ == "__main__":
         final_summary.to_csv(output_summary, index=False)
         print(f"✅ {output_summary} sauvegardé ({len(final_summary)} fichiers)")
         
+        # Partition "test" du store de features
+        store = FeatureStore()
+        with store.rewrite('details', 'test') as ajouter:
+            ajouter(final_detail)
+        with store.rewrite('summary', 'test') as ajouter:
+            ajouter(final_summary)
+        print(f"✅ Partition test du store '{store.directory}' mise à jour")
+        
         print("\nStructure des fichiers créés:")
         print("Détails:", final_detail.columns.tolist())
         print("Résumé:", final_summary.columns.tolist())
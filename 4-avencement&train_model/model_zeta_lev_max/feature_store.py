@@ -0,0 +1,232 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Store de features en colonnes (Parquet) pour l'entraînement
+
+Deux tables, "details" (une ligne par tranche) et "summary" (une ligne par
+fichier), partitionnées par source :
+
+    feature_store/<table>/source=<real|synthetic|test>/part-00000.parquet
+
+Les schémas sont typés (cri booléen, cri_type chaîne, cibles nullables pour
+la source test) : plus d'inférence de types ni de nettoyage à chaque lecture.
+Une partition ne fait que recevoir de nouveaux fichiers (append) ou est
+remplacée d'un bloc (rewrite) ; la lecture ne charge que les colonnes
+demandées, partition par partition, dans l'ordre d'écriture.
+
+snapshot() relève les fichiers présents (nom, taille, date) : new_parts()
+rend ensuite seulement les fichiers ajoutés depuis, pour l'entraînement
+incrémental, ou None si la partition a été réécrite entre-temps.
+"""
+import os
+import shutil
+from contextlib import contextmanager
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORE_DIR = "feature_store"
+SOURCES = ('real', 'synthetic', 'test')
+
+# Colonnes d'entrée des modèles (13 tranche / 10 fichier) et cibles
+SLICE_FEATURES = ['amplitude', 'rms', 'dB', 'Peak', 'Score', 'env',
+                  'centroid_mean', 'bandwidth_mean', 'flatness_mean',
+                  'mfcc_mean', 'pcen_mean', 'zcr_mean', 'cri_type']
+SLICE_TARGETS = ['Danger%', 'moy_danger']
+FILE_FEATURES = ['nb_tranches', 'nb_cris', 'env_moy', 'rms_moy',
+                 'peak_moy', 'centroid_moy', 'bandwidth_moy',
+                 'mfcc_moy', 'pcen_moy', 'cri_type_dom']
+FILE_TARGETS = ['danger_max', 'danger_moy', 'danger_std']
+
+SCHEMAS = {
+    'details': pa.schema([
+        ('id', pa.int64()), ('titre', pa.string()),
+        ('amplitude', pa.float64()), ('rms', pa.float64()), ('dB', pa.float64()),
+        ('Peak', pa.float64()), ('Score', pa.float64()),
+        ('Danger%', pa.float64()), ('env', pa.int64()),
+        ('cri', pa.bool_()), ('cri_type', pa.string()), ('moy_danger', pa.float64()),
+        ('centroid_mean', pa.float64()), ('bandwidth_mean', pa.float64()),
+        ('flatness_mean', pa.float64()), ('mfcc_mean', pa.float64()),
+        ('pcen_mean', pa.float64()), ('zcr_mean', pa.float64()),
+        ('tranche_id', pa.int64())
+    ]),
+    'summary': pa.schema([
+        ('titre', pa.string()), ('nb_tranches', pa.int64()), ('nb_cris', pa.int64()),
+        ('cri_type_dom', pa.string()),
+        ('danger_max', pa.float64()), ('danger_moy', pa.float64()), ('danger_std', pa.float64()),
+        ('env_moy', pa.float64()), ('rms_moy', pa.float64()), ('peak_moy', pa.float64()),
+        ('centroid_moy', pa.float64()), ('bandwidth_moy', pa.float64()),
+        ('mfcc_moy', pa.float64()), ('pcen_moy', pa.float64())
+    ])
+}
+CATEGORY_DEFAULTS = {'details': {'cri_type': 'aucun'}, 'summary': {'cri_type_dom': 'aucun'}}
+
+# CSV historiques : (table, source) -> fichier, pour l'import initial
+LEGACY_CSV = {
+    ('details', 'real'): "resultats_audio_final.csv",
+    ('summary', 'real'): "resumes_par_fichier.csv",
+    ('details', 'synthetic'): "synthetic_audio_details.csv",
+    ('summary', 'synthetic'): "synthetic_audio_summary.csv",
+    ('details', 'test'): "data_son_test_detail.csv",
+    ('summary', 'test'): "data_test_summary.csv"
+}
+
+
+def to_table(df, table):
+    """DataFrame -> table Arrow au schéma de la table (colonnes absentes : nulles)"""
+    schema = SCHEMAS[table]
+    df = df.copy()
+    for column, default in CATEGORY_DEFAULTS[table].items():
+        if column in df:
+            df[column] = df[column].fillna(default)
+    if 'cri' in df and table == 'details':
+        df['cri'] = df['cri'].astype(str).str.lower().isin(['true', '1', '1.0'])
+    for field in schema:
+        if field.name not in df:
+            df[field.name] = None
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+class FeatureStore:
+    """Tables details/summary partitionnées par source, en Parquet"""
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+
+    def partition_dir(self, table, source):
+        if table not in SCHEMAS:
+            raise ValueError(f"Table inconnue: {table}")
+        if source not in SOURCES:
+            raise ValueError(f"Source inconnue: {source} (attendu: {', '.join(SOURCES)})")
+        return os.path.join(self.directory, table, f"source={source}")
+
+    def parts(self, table, source):
+        directory = self.partition_dir(table, source)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet'))
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+
+    def snapshot(self, table, sources=SOURCES):
+        """source -> signatures des fichiers de la partition (état sérialisable en JSON)"""
+        return {source: [self._signature(path) for path in self.parts(table, source)]
+                for source in sources}
+
+    def new_parts(self, table, seen, sources=SOURCES):
+        """source -> fichiers absents de seen (snapshot antérieur)
+
+        None si un fichier relevé a disparu ou changé : partition réécrite,
+        les nouvelles lignes ne peuvent plus être isolées.
+        """
+        new = {}
+        for source in sources:
+            known = {tuple(signature) for signature in seen.get(source, [])}
+            current = {tuple(self._signature(path)): path for path in self.parts(table, source)}
+            if not known <= set(current):
+                return None
+            new[source] = [path for signature, path in current.items() if signature not in known]
+        return new
+
+    def exists(self, table, source=None):
+        sources = SOURCES if source is None else (source,)
+        return any(self.parts(table, s) for s in sources)
+
+    @staticmethod
+    def _write_part(directory, index, df, table):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{index:05d}.parquet")
+        tmp_path = f"{path}.tmp"
+        pq.write_table(to_table(df, table), tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def append(self, table, source, df):
+        """Ajoute df comme nouveau fichier de la partition (rien si df est vide)"""
+        if df is None or len(df) == 0:
+            return None
+        return self._write_part(self.partition_dir(table, source), len(self.parts(table, source)), df, table)
+
+    @contextmanager
+    def rewrite(self, table, source):
+        """Remplace la partition : les blocs ajoutés via la fonction rendue
+        sont écrits à part puis échangés d'un coup avec l'ancienne partition
+        en fin de bloc with (rien n'est remplacé en cas d'exception)."""
+        final_dir = self.partition_dir(table, source)
+        new_dir = final_dir + ".new"
+        shutil.rmtree(new_dir, ignore_errors=True)
+        count = [0]
+
+        def add(df):
+            if df is not None and len(df):
+                self._write_part(new_dir, count[0], df, table)
+                count[0] += 1
+
+        try:
+            yield add
+        except BaseException:
+            shutil.rmtree(new_dir, ignore_errors=True)
+            raise
+        old_dir = final_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(final_dir):
+            os.replace(final_dir, old_dir)
+        if count[0]:
+            os.replace(new_dir, final_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def read(self, table, sources=SOURCES, columns=None):
+        """DataFrame des partitions demandées, seulement les colonnes demandées
+
+        La colonne "source" est ajoutée si elle figure dans columns.
+        """
+        return self.read_parts(table, {source: self.parts(table, source) for source in sources}, columns)
+
+    def read_parts(self, table, parts, columns=None):
+        """Comme read, limité aux fichiers donnés (source -> chemins, cf. new_parts)"""
+        with_source = columns is not None and 'source' in columns
+        wanted = [c for c in columns if c != 'source'] if columns is not None else None
+        tables = []
+        for source, paths in parts.items():
+            for path in paths:
+                part = pq.read_table(path, columns=wanted)
+                if with_source:
+                    part = part.append_column('source', pa.array([source] * part.num_rows, pa.string()))
+                tables.append(part)
+        if not tables:
+            names = wanted if wanted is not None else SCHEMAS[table].names
+            return pd.DataFrame(columns=names + (['source'] if with_source else []))
+        return pa.concat_tables(tables).to_pandas()
+
+    def import_csv(self, base_dir="."):
+        """Importe les CSV historiques (LEGACY_CSV) en remplaçant les partitions"""
+        for (table, source), filename in LEGACY_CSV.items():
+            path = os.path.join(base_dir, filename)
+            if not os.path.exists(path):
+                print(f"⚠️ {filename} introuvable, partition {table}/{source} ignorée")
+                continue
+            df = pd.read_csv(path)
+            with self.rewrite(table, source) as add:
+                add(df)
+            print(f"📦 {filename} -> {table}/source={source} ({len(df)} lignes)")
+
+
+if __name__ == "__main__":
+    FeatureStore().import_csv()
@@ -1,15 +1,11 @@
+import argparse
+import time
 import numpy as np
 import pandas as pd
 import librosa
 from scipy import signal
 from faker import Faker
-import random
-from sklearn.preprocessing import MinMaxScaler
-
-# Initialisation
-fake = Faker()
-np.random.seed(42)
-random.seed(42)
+from feature_store import FeatureStore
 
 # Configuration
 NUM_FILES = 30  # Nombre de fichiers synthétiques à générer
@@ -18,11 +14,36 @@ OUTPUT_DETAILS = "synthetic_audio_details.csv"
 OUTPUT_SUMMARY = "synthetic_audio_summary.csv"
 SAMPLE_RATE = 44100
 DURATION = 5  # secondes par tranche
+SEED = 42
+
+# Tirages des types de cri
+PROBA_FICHIER_CRI = 0.7                     # fichier avec cri dominant (sinon bruit)
+PROBAS_CRI_DOMINANT = {'bebe': 0.2, 'enfant': 0.3, 'adulte': 0.5}
+PROBA_TRANCHE_DOMINANTE = 0.8               # tranche d'un fichier à cri : type dominant
+PROBAS_CRI_AUTRE = {'bebe': 0.1, 'enfant': 0.2, 'adulte': 0.6, None: 0.1}
+
+# Codes des types de tranche, dans l'ordre alphabétique des libellés
+# (départage des égalités du type dominant comme Series.mode)
+CRI_LABELS = np.array(['adulte', 'aucun', 'bebe', 'enfant'])
+AUCUN = 1
+
+DETAILS_COLS = [
+    'id', 'titre', 'amplitude', 'rms', 'dB', 'Peak', 'Score', 'Danger%',
+    'env', 'cri', 'cri_type', 'moy_danger', 'centroid_mean', 'bandwidth_mean',
+    'flatness_mean', 'mfcc_mean', 'pcen_mean', 'zcr_mean'
+]
+SUMMARY_COLS = [
+    'titre', 'nb_tranches', 'nb_cris', 'cri_type_dom', 'danger_max',
+    'danger_moy', 'danger_std', 'env_moy', 'rms_moy', 'peak_moy',
+    'centroid_moy', 'bandwidth_moy', 'mfcc_moy', 'pcen_moy'
+]
 
 # Modèles statistiques basés sur vos données
 class AudioFeatureGenerator:
-    def __init__(self):
-        self.scaler = MinMaxScaler()
+    """Tirage vectorisé des features : un tableau NumPy par colonne, n tranches à la fois"""
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng(SEED)
         self.cri_types = {
             'bebe': {
                 'centroid': (4500, 6000), 
@@ -43,36 +64,36 @@ class AudioFeatureGenerator:
                 'danger_mult': 1.2
             }
         }
-        
-    def generate_audio_features(self, cri_type=None):
-        if cri_type is None:
-            # Génération de bruit de fond
-            rms = np.random.uniform(0.01, 0.1)
-            peak = rms * np.random.uniform(3, 8)
-            centroid = np.random.uniform(1000, 3000)
-            bandwidth = np.random.uniform(1000, 2500)
-            mfcc = np.random.uniform(-60, 20)
-            flatness = np.random.uniform(0.001, 0.1)
-            pcen = np.random.uniform(0.05, 0.3)
-            zcr = np.random.uniform(0.02, 0.1)
-            env = random.randint(1, 3)
-        else:
-            # Génération avec type de cri spécifique
-            params = self.cri_types[cri_type]
-            rms = np.random.uniform(0.05, 0.25)
-            peak = np.clip(rms * np.random.uniform(4, 10), 0.3, 1.0)
-            centroid = np.random.uniform(*params['centroid'])
-            bandwidth = np.random.uniform(*params['bandwidth'])
-            mfcc = np.random.uniform(*params['mfcc'])
-            flatness = np.random.uniform(0.001, 0.05)
-            pcen = np.random.uniform(0.1, 0.4)
-            zcr = np.random.uniform(0.03, 0.08)
-            env = random.randint(2, 3)
-            
+        # Bornes par code de CRI_LABELS ("aucun" : bruit de fond)
+        self._range = {
+            name: np.array([self.cri_types[label][name] if label != 'aucun' else bruit
+                            for label in CRI_LABELS], dtype=float)
+            for name, bruit in (('centroid', (1000, 3000)), ('bandwidth', (1000, 2500)),
+                                ('mfcc', (-60, 20)))
+        }
+        self._danger_mult = np.array([self.cri_types[label]['danger_mult'] if label != 'aucun' else 1.0
+                                      for label in CRI_LABELS])
+
+    def _uniform(self, bounds, codes):
+        low, high = bounds[codes, 0], bounds[codes, 1]
+        return self.rng.uniform(low, high)
+
+    def _choose(self, bruit, cri, is_cri):
+        """bruit (low, high) si pas de cri, sinon cri (low, high), tranche par tranche"""
+        return self._uniform(np.array([bruit, cri], dtype=float), is_cri.astype(int))
+
+    def generate_audio_features(self, codes):
+        """Features de len(codes) tranches (codes : indices dans CRI_LABELS)"""
+        is_cri = codes != AUCUN
+        rms = self._choose((0.01, 0.1), (0.05, 0.25), is_cri)
+        peak_ratio = self._choose((3, 8), (4, 10), is_cri)
+        peak = np.where(is_cri, np.clip(rms * peak_ratio, 0.3, 1.0), rms * peak_ratio)
+        env = np.where(is_cri, self.rng.integers(2, 4, len(codes)), self.rng.integers(1, 4, len(codes)))
+
         # Calcul des dérivés
         db = 20 * np.log10(rms + 1e-6)
-        score = min(100, (rms * 80 + peak * 15 + db * 0.5))
-        
+        score = np.minimum(100, rms * 80 + peak * 15 + db * 0.5)
+
         return {
             'amplitude': rms,
             'rms': rms,
@@ -80,16 +101,16 @@ class AudioFeatureGenerator:
             'Peak': peak,
             'Score': score,
             'env': env,
-            'centroid_mean': centroid,
-            'bandwidth_mean': bandwidth,
-            'flatness_mean': flatness,
-            'mfcc_mean': mfcc,
-            'pcen_mean': pcen,
-            'zcr_mean': zcr
+            'centroid_mean': self._uniform(self._range['centroid'], codes),
+            'bandwidth_mean': self._uniform(self._range['bandwidth'], codes),
+            'flatness_mean': self._choose((0.001, 0.1), (0.001, 0.05), is_cri),
+            'mfcc_mean': self._uniform(self._range['mfcc'], codes),
+            'pcen_mean': self._choose((0.05, 0.3), (0.1, 0.4), is_cri),
+            'zcr_mean': self._choose((0.02, 0.1), (0.03, 0.08), is_cri)
         }
     
-    def calculate_danger(self, features, cri_type=None):
-        base_danger = min(100, (
+    def calculate_danger(self, features, codes):
+        base_danger = np.minimum(100, (
             0.3 * features['rms'] * 100 +
             0.2 * features['Peak'] * 100 +
             0.15 * (features['centroid_mean'] / 100) +
@@ -99,137 +120,143 @@ class AudioFeatureGenerator:
             0.05 * features['zcr_mean'] * 500
         ))
         
-        if cri_type is not None:
-            base_danger *= self.cri_types[cri_type]['danger_mult']
-            base_danger = min(100, base_danger)
+        # Majoration des cris
+        base_danger = np.minimum(100, base_danger * self._danger_mult[codes])
             
         # Ajout de variation aléatoire
-        base_danger *= np.random.uniform(0.9, 1.1)
+        base_danger *= self.rng.uniform(0.9, 1.1, len(codes))
         
         return np.clip(base_danger, 10, 100)
 
+
+def _codes(labels):
+    return np.array([AUCUN if label is None else int(np.flatnonzero(CRI_LABELS == label)[0])
+                     for label in labels])
+
+def _file_titles(rng, num_files):
+    """synth_<mot>_<n>.wav, mots tirés du vocabulaire de Faker"""
+    words = np.array(Faker().get_words_list())
+    chosen = words[rng.integers(0, len(words), num_files)]
+    return np.char.add(np.char.add(np.char.add('synth_', chosen), '_'),
+                       np.char.add(np.arange(num_files).astype(str), '.wav'))
+
 # Génération des données synthétiques
-def generate_synthetic_data():
-    generator = AudioFeatureGenerator()
-    details_data = []
-    summary_data = []
-    current_id = 1
-    
-    for file_num in range(NUM_FILES):
-        # Déterminer le type de fichier (avec ou sans cris)
-        file_type = random.choices(['cri', 'bruit'], weights=[0.7, 0.3])[0]
-        
-        if file_type == 'cri':
-            dominant_cri_type = random.choices(
-                ['bebe', 'enfant', 'adulte'], 
-                weights=[0.2, 0.3, 0.5]
-            )[0]
-        else:
-            dominant_cri_type = None
-        
-        # Générer les tranches
-        num_chunks = random.randint(*CHUNKS_PER_FILE)
-        file_dangers = []
-        file_title = f"synth_{fake.word()}_{file_num}.wav"
-        
-        for chunk in range(num_chunks):
-            # Déterminer si cette tranche contient un cri
-            if file_type == 'cri':
-                if random.random() < 0.8:  # 80% de chance d'avoir le cri dominant
-                    current_cri_type = dominant_cri_type
-                else:
-                    current_cri_type = random.choices(
-                        ['bebe', 'enfant', 'adulte', None], 
-                        weights=[0.1, 0.2, 0.6, 0.1]
-                    )[0]
-            else:
-                current_cri_type = None
-                
-            # Générer les caractéristiques
-            features = generator.generate_audio_features(current_cri_type)
-            
-            # Calculer le danger
-            danger = generator.calculate_danger(features, current_cri_type)
-            file_dangers.append(danger)
-            
-            # Ajouter aux données détaillées
-            details_data.append({
-                'id': current_id,
-                'titre': file_title,
-                **features,
-                'Danger%': danger,
-                'cri': current_cri_type is not None,
-                'cri_type': current_cri_type if current_cri_type else "aucun",
-                'moy_danger': 0  # Temporaire, sera mis à jour plus tard
-            })
-            
-            current_id += 1
-        
-        # Calculer les statistiques globales du fichier
-        if file_dangers:
-            danger_max = max(file_dangers)
-            danger_moy = np.mean(file_dangers)
-            danger_std = np.std(file_dangers)
-            moy_danger = 0.7 * danger_max + 0.3 * danger_moy
-            
-            # Mettre à jour le moy_danger dans les tranches
-            for i in range(len(details_data)-num_chunks, len(details_data)):
-                details_data[i]['moy_danger'] = round(moy_danger, 2)
-            
-            # Extraire les features moyennes
-            file_df = pd.DataFrame(details_data[-num_chunks:])
-            summary_data.append({
-                'titre': file_title,
-                'nb_tranches': num_chunks,
-                'nb_cris': file_df['cri'].sum(),
-                'cri_type_dom': file_df['cri_type'].mode()[0] if file_df['cri'].any() else "aucun",
-                'danger_max': danger_max,
-                'danger_moy': danger_moy,
-                'danger_std': danger_std,
-                'env_moy': file_df['env'].mean(),
-                'rms_moy': file_df['rms'].mean(),
-                'peak_moy': file_df['Peak'].mean(),
-                'centroid_moy': file_df['centroid_mean'].mean(),
-                'bandwidth_moy': file_df['bandwidth_mean'].mean(),
-                'mfcc_moy': file_df['mfcc_mean'].mean(),
-                'pcen_moy': file_df['pcen_mean'].mean()
-            })
-    
-    # Création des DataFrames
-    df_details = pd.DataFrame(details_data)
-    df_summary = pd.DataFrame(summary_data)
-    
-    # Réorganisation des colonnes
-    details_cols = [
-        'id', 'titre', 'amplitude', 'rms', 'dB', 'Peak', 'Score', 'Danger%',
-        'env', 'cri', 'cri_type', 'moy_danger', 'centroid_mean', 'bandwidth_mean',
-        'flatness_mean', 'mfcc_mean', 'pcen_mean', 'zcr_mean'
-    ]
-    
-    summary_cols = [
-        'titre', 'nb_tranches', 'nb_cris', 'cri_type_dom', 'danger_max',
-        'danger_moy', 'danger_std', 'env_moy', 'rms_moy', 'peak_moy',
-        'centroid_moy', 'bandwidth_moy', 'mfcc_moy', 'pcen_moy'
-    ]
-    
-    return df_details[details_cols], df_summary[summary_cols]
+def generate_synthetic_data(num_files=NUM_FILES, seed=SEED, store=None, chunks_per_file=CHUNKS_PER_FILE):
+    """(df_details, df_summary) de num_files fichiers synthétiques
+
+    Tous les tirages sont faits par tableaux (une seule graine, résultat
+    reproductible) et les résumés par réductions groupées sur les tranches
+    de chaque fichier, contiguës. store (FeatureStore) : la partition
+    "synthetic" est remplacée par le résultat. num_files=0 donne deux
+    tables vides ; chaque fichier a au moins une tranche.
+    """
+    if num_files < 0:
+        raise ValueError(f"num_files doit être positif ou nul: {num_files}")
+    if not 1 <= chunks_per_file[0] <= chunks_per_file[1]:
+        raise ValueError(f"chunks_per_file doit vérifier 1 <= min <= max: {chunks_per_file}")
+    rng = np.random.default_rng(seed)
+    generator = AudioFeatureGenerator(rng)
+
+    # Fichiers : type (cri dominant ou bruit) et nombre de tranches
+    dominant_labels = list(PROBAS_CRI_DOMINANT)
+    dominant = _codes(dominant_labels)[rng.choice(len(dominant_labels), num_files,
+                                                  p=list(PROBAS_CRI_DOMINANT.values()))]
+    dominant = np.where(rng.random(num_files) < PROBA_FICHIER_CRI, dominant, AUCUN)
+    num_chunks = rng.integers(chunks_per_file[0], chunks_per_file[1] + 1, num_files)
+    titles = _file_titles(rng, num_files)
+
+    # Tranches : type de cri (dominant à 80 %, sinon tirage) pour les fichiers à cri
+    file_index = np.repeat(np.arange(num_files), num_chunks)
+    n = len(file_index)
+    other_labels = list(PROBAS_CRI_AUTRE)
+    other = _codes(other_labels)[rng.choice(len(other_labels), n, p=list(PROBAS_CRI_AUTRE.values()))]
+    codes = dominant[file_index]
+    codes = np.where((codes != AUCUN) & (rng.random(n) >= PROBA_TRANCHE_DOMINANTE), other, codes)
+
+    features = generator.generate_audio_features(codes)
+    danger = generator.calculate_danger(features, codes)
+
+    # Réductions par fichier (tranches contiguës : reduceat / bincount)
+    starts = np.concatenate([[0], np.cumsum(num_chunks)[:-1]])
+    def file_mean(values):
+        return np.bincount(file_index, weights=values, minlength=num_files) / num_chunks
+    danger_max = np.maximum.reduceat(danger, starts) if num_files else np.empty(0)
+    danger_moy = file_mean(danger)
+    danger_std = np.sqrt(file_mean((danger - danger_moy[file_index]) ** 2))
+    moy_danger = np.round(0.7 * danger_max + 0.3 * danger_moy, 2)
+
+    is_cri = codes != AUCUN
+    counts = np.bincount(file_index * len(CRI_LABELS) + codes,
+                         minlength=num_files * len(CRI_LABELS)).reshape(num_files, len(CRI_LABELS))
+    nb_cris = counts.sum(axis=1) - counts[:, AUCUN]
+    cri_type_dom = np.where(nb_cris > 0, CRI_LABELS[counts.argmax(axis=1)], 'aucun')
+
+    df_details = pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'titre': titles[file_index],
+        **features,
+        'Danger%': danger,
+        'cri': is_cri,
+        'cri_type': CRI_LABELS[codes],
+        'moy_danger': moy_danger[file_index]
+    })[DETAILS_COLS]
+    df_summary = pd.DataFrame({
+        'titre': titles,
+        'nb_tranches': num_chunks,
+        'nb_cris': nb_cris,
+        'cri_type_dom': cri_type_dom,
+        'danger_max': danger_max,
+        'danger_moy': danger_moy,
+        'danger_std': danger_std,
+        'env_moy': file_mean(features['env'].astype(float)),
+        'rms_moy': file_mean(features['rms']),
+        'peak_moy': file_mean(features['Peak']),
+        'centroid_moy': file_mean(features['centroid_mean']),
+        'bandwidth_moy': file_mean(features['bandwidth_mean']),
+        'mfcc_moy': file_mean(features['mfcc_mean']),
+        'pcen_moy': file_mean(features['pcen_mean'])
+    })[SUMMARY_COLS]
+
+    if store is not None:
+        with store.rewrite('details', 'synthetic') as ajouter:
+            ajouter(df_details)
+        with store.rewrite('summary', 'synthetic') as ajouter:
+            ajouter(df_summary)
+    return df_details, df_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération de données synthétiques")
+    parser.add_argument('--files', type=int, default=NUM_FILES, help="nombre de fichiers synthétiques")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--no-csv', action='store_true', help="n'écrire que le store de features")
+    args = parser.parse_args()
+
+    # Génération et sauvegarde des données
+    store = FeatureStore()
+    t0 = time.perf_counter()
+    df_details, df_summary = generate_synthetic_data(args.files, seed=args.seed, store=store)
 
-# Génération et sauvegarde des données
-df_details, df_summary = generate_synthetic_data()
+    # Sauvegarde des fichiers
+    if not args.no_csv:
+        df_details.to_csv(OUTPUT_DETAILS, index=False)
+        df_summary.to_csv(OUTPUT_SUMMARY, index=False)
 
-# Sauvegarde des fichiers
-df_details.to_csv(OUTPUT_DETAILS, index=False)
-df_summary.to_csv(OUTPUT_SUMMARY, index=False)
+    # Affichage des statistiques
+    print(f"✅ Données synthétiques générées ({len(df_details)} tranches, {len(df_summary)} fichiers) "
+          f"en {time.perf_counter() - t0:.1f} s")
+    if not args.no_csv:
+        print(f"📊 Fichier détaillé : {OUTPUT_DETAILS}")
+        print(f"📈 Fichier récapitulatif : {OUTPUT_SUMMARY}")
+    print(f"📦 Partition synthetic du store : {store.directory}")
 
-# Affichage des statistiques
-print(f"✅ Données synthétiques générées ({len(df_details)} tranches, {len(df_summary)} fichiers)")
-print(f"📊 Fichier détaillé : {OUTPUT_DETAILS}")
-print(f"📈 Fichier récapitulatif : {OUTPUT_SUMMARY}")
+    print("\n📌 Statistiques Danger% :")
+    print(f"- Moyenne : {df_details['Danger%'].mean():.1f}")
+    print(f"- Max : {df_details['Danger%'].max():.1f}")
+    print(f"- Min : {df_details['Danger%'].min():.1f}")
 
-print("\n📌 Statistiques Danger% :")
-print(f"- Moyenne : {df_details['Danger%'].mean():.1f}")
-print(f"- Max : {df_details['Danger%'].max():.1f}")
-print(f"- Min : {df_details['Danger%'].min():.1f}")
+    print("\n🔊 Répartition des types de cris :")
+    print(df_details['cri_type'].value_counts())
 
-print("\n🔊 Répartition des types de cris :")
-print(df_details['cri_type'].value_counts())
\ No newline at end of file
+if __name__ == "__main__":
+    main()
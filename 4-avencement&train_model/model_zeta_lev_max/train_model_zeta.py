@@ -3,31 +3,56 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, ExtraTreesRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
-from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import GridSearchCV, KFold
+from sklearn.base import clone
+import os
+import sys
+import json
+import argparse
 import joblib
+from joblib import Parallel, delayed
 import warnings
+from feature_store import FeatureStore, SLICE_FEATURES, SLICE_TARGETS, FILE_FEATURES, FILE_TARGETS
 warnings.filterwarnings('ignore')
 
-# 1. Chargement et nettoyage des données
-def load_and_prepare_data(details_path, summary_path):
-    details = pd.read_csv(details_path)
-    summary = pd.read_csv(summary_path)
-    
-    # Nettoyage des données
-    details['cri'] = details['cri'].astype(int)
-    details['cri_type'] = details['cri_type'].fillna('aucun')
-    summary['cri_type_dom'] = summary['cri_type_dom'].fillna('aucun')
-    
+# Publication des versions (artefacts .dmodel) : moteur d'inférence de l'API
+SYS_AUTOMA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               "..", "..", "7-project_final_apis", "sys_automa_final"))
+MODEL_REGISTRY = os.path.join(SYS_AUTOMA_DIR, "model_registry")
+
+# 1. Chargement des données (store Parquet : types fixés à l'écriture)
+TRAIN_SOURCES = ('real', 'synthetic')
+TRAINING_STATE = "training_state.json"   # fichiers du store déjà vus par les modèles sauvegardés
+
+def load_and_prepare_data(store=None, sources=TRAIN_SOURCES):
+    store = store or FeatureStore()
+    # Seules les colonnes utiles sont lues (features + cibles)
+    details = store.read('details', sources, columns=SLICE_FEATURES + SLICE_TARGETS)
+    summary = store.read('summary', sources, columns=FILE_FEATURES + FILE_TARGETS)
+    return prepare_data(details, summary)
+
+def load_new_data(store, state, sources=TRAIN_SOURCES):
+    """Données ajoutées au store depuis l'état d'entraînement (None si partition réécrite)"""
+    details_parts = store.new_parts('details', state['details'], sources)
+    summary_parts = store.new_parts('summary', state['summary'], sources)
+    if details_parts is None or summary_parts is None:
+        return None
+    details = store.read_parts('details', details_parts, columns=SLICE_FEATURES + SLICE_TARGETS)
+    summary = store.read_parts('summary', summary_parts, columns=FILE_FEATURES + FILE_TARGETS)
+    return prepare_data(details, summary)
+
+def prepare_data(details, summary):
     # Suppression des NaN dans les targets
-    summary = summary.dropna(subset=['danger_max', 'danger_moy', 'danger_std'])
+    details = details.dropna(subset=SLICE_TARGETS).reset_index(drop=True)
+    summary = summary.dropna(subset=FILE_TARGETS).reset_index(drop=True)
     
     return {
-        'slice_data': (details.drop(['Danger%', 'moy_danger', 'id', 'titre'], axis=1), 
+        'slice_data': (details[SLICE_FEATURES], 
                        details['Danger%'], 
                        details['moy_danger']),
-        'file_data': (summary.drop(['titre', 'danger_max', 'danger_moy', 'danger_std'], axis=1),
+        'file_data': (summary[FILE_FEATURES],
                       summary['danger_max'],
                       summary['danger_moy'],
                       summary['danger_std'])
@@ -48,35 +73,98 @@ class AudioPreprocessor:
         return self.preprocessor.transform(X)
 
 # 3. Modèles de base
+# Recherche de modèle : validation croisée en parallèle, plis mis en cache disque
+CV_FOLDS = 5
+N_JOBS = -1                          # un worker joblib par cœur
+MODEL_SEARCH_CACHE = "model_search_cache"
+memory = joblib.Memory(MODEL_SEARCH_CACHE, verbose=0)
+
+def candidate_models(multi_output=False):
+    if multi_output:
+        # Ensembles d'arbres natifs multi-sorties : un parcours d'arbre pour toutes les cibles
+        return [
+            ('RandomForest', RandomForestRegressor(
+                n_estimators=100, max_depth=10, random_state=42)),
+            ('ExtraTrees', ExtraTreesRegressor(
+                n_estimators=100, max_depth=10, random_state=42))
+        ]
+    return [
+        ('GradientBoosting', GradientBoostingRegressor(
+            n_estimators=200, learning_rate=0.1, max_depth=5, random_state=42)),
+        ('RandomForest', RandomForestRegressor(
+            n_estimators=100, max_depth=10, random_state=42))
+    ]
+
+@memory.cache
+def fit_fold(estimator, X, y, train_idx, test_idx):
+    """Entraîne une copie d'estimator sur un pli, scores sur le pli tenu à part"""
+    model = clone(estimator).fit(X[train_idx], y[train_idx])
+    y_pred = model.predict(X[test_idx])
+    return r2_score(y[test_idx], y_pred), mean_absolute_error(y[test_idx], y_pred)
+
+@memory.cache
+def fit_full(estimator, X, y):
+    return clone(estimator).fit(X, y)
+
+# Entraînement incrémental : arbres (ou étapes de boosting) ajoutés par mise à jour
+INCREMENTAL_TREES = 20
+
+def add_trees(model, X, y, n_trees=INCREMENTAL_TREES):
+    """Ajoute n_trees arbres entraînés sur (X, y) seulement (warm_start), les anciens sont gardés
+
+    RandomForest/ExtraTrees : les nouveaux arbres entrent dans la moyenne.
+    GradientBoosting : les nouvelles étapes corrigent les résidus sur (X, y).
+    """
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + n_trees)
+    model.fit(X, y)
+    model.set_params(warm_start=False)
+    return model
+
 class BaseModel:
     def __init__(self, preprocessor):
         self.preprocessor = preprocessor
         self.model = None
+        self.cv_scores = {}
     
     def train(self, X, y):
-        X_processed = self.preprocessor.fit_transform(X)
+        return self.train_processed(self.preprocessor.fit_transform(X), y)
+    
+    def train_processed(self, X_processed, y, n_jobs=N_JOBS):
+        """Choisit le meilleur candidat par validation croisée (X déjà transformé par le préprocesseur)
+
+        y à deux dimensions (une colonne par cible) : candidats multi-sorties,
+        r2 et mae moyennés sur les cibles.
+        """
+        y = np.asarray(y, dtype=float)
+        models = candidate_models(multi_output=y.ndim > 1)
+        folds = list(KFold(n_splits=min(CV_FOLDS, len(y)), shuffle=True, random_state=42).split(X_processed))
         
-        # Configuration simplifiée
-        models = [
-            ('GradientBoosting', GradientBoostingRegressor(
-                n_estimators=200, learning_rate=0.1, max_depth=5, random_state=42)),
-            ('RandomForest', RandomForestRegressor(
-                n_estimators=100, max_depth=10, random_state=42))
-        ]
+        # Tous les (candidat, pli) en parallèle ; les plis déjà calculés viennent du cache
+        scores = Parallel(n_jobs=n_jobs)(
+            delayed(fit_fold)(model, X_processed, y, train_idx, test_idx)
+            for _, model in models for train_idx, test_idx in folds
+        )
         
         best_score = -np.inf
         best_model = None
         
-        for name, model in models:
-            model.fit(X_processed, y)
-            y_pred = model.predict(X_processed)
-            score = r2_score(y, y_pred)
+        for i, (name, model) in enumerate(models):
+            fold_scores = np.array(scores[i * len(folds):(i + 1) * len(folds)])
+            self.cv_scores[name] = {'r2': float(fold_scores[:, 0].mean()), 'mae': float(fold_scores[:, 1].mean())}
+            print(f"  {name}: CV r2={self.cv_scores[name]['r2']:.3f} mae={self.cv_scores[name]['mae']:.2f}")
             
-            if score > best_score:
-                best_score = score
+            if self.cv_scores[name]['r2'] > best_score:
+                best_score = self.cv_scores[name]['r2']
                 best_model = model
         
-        self.model = best_model
+        self.model = fit_full(best_model, X_processed, y)
+        return self
+    
+    def update_processed(self, X_processed, y, n_trees=INCREMENTAL_TREES):
+        """Mise à jour incrémentale du modèle sauvegardé sur les nouvelles lignes seulement"""
+        if self.model is None:
+            raise ValueError("Model is not trained yet.")
+        self.model = add_trees(self.model, X_processed, np.asarray(y, dtype=float), n_trees)
         return self
     
     def predict(self, X):
@@ -92,9 +180,20 @@ class BaseModel:
             'mae': mean_absolute_error(y, y_pred)
         }
 
+def output_scores(y_true, y_pred, targets):
+    """Performance par cible d'une prédiction multi-sorties"""
+    y_true = np.asarray(y_true, dtype=float)
+    return {target: {'r2': r2_score(y_true[:, k], y_pred[:, k]),
+                     'mae': mean_absolute_error(y_true[:, k], y_pred[:, k])}
+            for k, target in enumerate(targets)}
+
 # 4. Modèles pour tranches audio
 class SliceModels:
-    def __init__(self):
+    # Noms des modèles sauvegardés, dans l'ordre des colonnes du modèle multi-sorties
+    OUTPUTS = ['danger_model', 'moy_danger_model']
+    
+    def __init__(self, multi_output=False):
+        self.multi_output = multi_output
         self.preprocessor = AudioPreprocessor(
             numeric_features=['amplitude', 'rms', 'dB', 'Peak', 'Score', 'env',
                             'centroid_mean', 'bandwidth_mean', 'flatness_mean',
@@ -103,41 +202,82 @@ class SliceModels:
         )
         self.danger_model = BaseModel(self.preprocessor)
         self.moy_danger_model = BaseModel(self.preprocessor)
+        self.multi_model = BaseModel(self.preprocessor)
     
     def train(self, X, y_danger, y_moy):
+        # Préprocesseur ajusté une fois pour les deux cibles
+        X_processed = self.preprocessor.fit_transform(X)
+        
+        if self.multi_output:
+            print("\nEntraînement modèle multi-sorties Danger% + moy_danger...")
+            y = np.column_stack([y_danger, y_moy])
+            self.multi_model.train_processed(X_processed, y)
+            print(f"Performance: {output_scores(y, self.multi_model.predict(X), ['Danger%', 'moy_danger'])}")
+            return
+        
         print("\nEntraînement modèle Danger%...")
-        self.danger_model.train(X, y_danger)
+        self.danger_model.train_processed(X_processed, y_danger)
         print(f"Performance: {self.danger_model.evaluate(X, y_danger)}")
         
         print("\nEntraînement modèle moy_danger...")
-        self.moy_danger_model.train(X, y_moy)
+        self.moy_danger_model.train_processed(X_processed, y_moy)
         print(f"Performance: {self.moy_danger_model.evaluate(X, y_moy)}")
     
+    def update(self, X, y_danger, y_moy, n_trees=INCREMENTAL_TREES):
+        # Préprocesseur figé : les arbres existants restent valides
+        X_processed = self.preprocessor.transform(X)
+        if self.multi_output:
+            self.multi_model.update_processed(X_processed, np.column_stack([y_danger, y_moy]), n_trees)
+            return
+        self.danger_model.update_processed(X_processed, y_danger, n_trees)
+        self.moy_danger_model.update_processed(X_processed, y_moy, n_trees)
+    
     def predict(self, X):
+        if self.multi_output:
+            y_pred = self.multi_model.predict(X)
+            return {'Danger%': y_pred[:, 0], 'moy_danger': y_pred[:, 1]}
         return {
             'Danger%': self.danger_model.predict(X),
             'moy_danger': self.moy_danger_model.predict(X)
         }
     
-    def save(self, path):
-        joblib.dump({
+    def to_dict(self):
+        if self.multi_output:
+            return {
+                'preprocessor': self.preprocessor,
+                'multi_output_model': self.multi_model.model,
+                'outputs': self.OUTPUTS
+            }
+        return {
             'preprocessor': self.preprocessor,
             'danger_model': self.danger_model.model,
             'moy_danger_model': self.moy_danger_model.model
-        }, path)
+        }
+    
+    def save(self, path):
+        joblib.dump(self.to_dict(), path)
     
     @classmethod
     def load(cls, path):
         data = joblib.load(path)
-        instance = cls()
+        instance = cls(multi_output='multi_output_model' in data)
         instance.preprocessor = data['preprocessor']
+        for model in (instance.danger_model, instance.moy_danger_model, instance.multi_model):
+            model.preprocessor = instance.preprocessor
+        if instance.multi_output:
+            instance.multi_model.model = data['multi_output_model']
+            return instance
         instance.danger_model.model = data['danger_model']
         instance.moy_danger_model.model = data['moy_danger_model']
         return instance
 
 # 5. Modèles pour fichiers audio
 class FileModels:
-    def __init__(self):
+    # Noms des modèles sauvegardés, dans l'ordre des colonnes du modèle multi-sorties
+    OUTPUTS = ['max_model', 'moy_model', 'std_model']
+    
+    def __init__(self, multi_output=False):
+        self.multi_output = multi_output
         self.preprocessor = AudioPreprocessor(
             numeric_features=['nb_tranches', 'nb_cris', 'env_moy', 'rms_moy', 
                             'peak_moy', 'centroid_moy', 'bandwidth_moy', 
@@ -147,62 +287,167 @@ class FileModels:
         self.max_model = BaseModel(self.preprocessor)
         self.moy_model = BaseModel(self.preprocessor)
         self.std_model = BaseModel(self.preprocessor)
+        self.multi_model = BaseModel(self.preprocessor)
     
     def train(self, X, y_max, y_moy, y_std):
+        # Préprocesseur ajusté une fois pour les trois cibles
+        X_processed = self.preprocessor.fit_transform(X)
+        
+        if self.multi_output:
+            print("\nEntraînement modèle multi-sorties danger_max + danger_moy + danger_std...")
+            y = np.column_stack([y_max, y_moy, y_std])
+            self.multi_model.train_processed(X_processed, y)
+            print(f"Performance: {output_scores(y, self.multi_model.predict(X), ['danger_max', 'danger_moy', 'danger_std'])}")
+            return
+        
         print("\nEntraînement modèle danger_max...")
-        self.max_model.train(X, y_max)
+        self.max_model.train_processed(X_processed, y_max)
         print(f"Performance: {self.max_model.evaluate(X, y_max)}")
         
         print("\nEntraînement modèle danger_moy...")
-        self.moy_model.train(X, y_moy)
+        self.moy_model.train_processed(X_processed, y_moy)
         print(f"Performance: {self.moy_model.evaluate(X, y_moy)}")
         
         print("\nEntraînement modèle danger_std...")
-        self.std_model.train(X, y_std)
+        self.std_model.train_processed(X_processed, y_std)
         print(f"Performance: {self.std_model.evaluate(X, y_std)}")
     
+    def update(self, X, y_max, y_moy, y_std, n_trees=INCREMENTAL_TREES):
+        # Préprocesseur figé : les arbres existants restent valides
+        X_processed = self.preprocessor.transform(X)
+        if self.multi_output:
+            self.multi_model.update_processed(X_processed, np.column_stack([y_max, y_moy, y_std]), n_trees)
+            return
+        self.max_model.update_processed(X_processed, y_max, n_trees)
+        self.moy_model.update_processed(X_processed, y_moy, n_trees)
+        self.std_model.update_processed(X_processed, y_std, n_trees)
+    
     def predict(self, X):
+        if self.multi_output:
+            y_pred = self.multi_model.predict(X)
+            return {'danger_max': y_pred[:, 0], 'danger_moy': y_pred[:, 1], 'danger_std': y_pred[:, 2]}
         return {
             'danger_max': self.max_model.predict(X),
             'danger_moy': self.moy_model.predict(X),
             'danger_std': self.std_model.predict(X)
         }
     
-    def save(self, path):
-        joblib.dump({
+    def to_dict(self):
+        if self.multi_output:
+            return {
+                'preprocessor': self.preprocessor,
+                'multi_output_model': self.multi_model.model,
+                'outputs': self.OUTPUTS
+            }
+        return {
             'preprocessor': self.preprocessor,
             'max_model': self.max_model.model,
             'moy_model': self.moy_model.model,
             'std_model': self.std_model.model
-        }, path)
+        }
+    
+    def save(self, path):
+        joblib.dump(self.to_dict(), path)
     
     @classmethod
     def load(cls, path):
         data = joblib.load(path)
-        instance = cls()
+        instance = cls(multi_output='multi_output_model' in data)
         instance.preprocessor = data['preprocessor']
+        for model in (instance.max_model, instance.moy_model, instance.std_model, instance.multi_model):
+            model.preprocessor = instance.preprocessor
+        if instance.multi_output:
+            instance.multi_model.model = data['multi_output_model']
+            return instance
         instance.max_model.model = data['max_model']
         instance.moy_model.model = data['moy_model']
         instance.std_model.model = data['std_model']
         return instance
 
 # 6. Pipeline principal
-def main():
-    # Chargement des données
-    print("Chargement des données...")
-    data = load_and_prepare_data('data_details.csv', 'data_summary.csv')
+def save_training_state(snapshot, path=TRAINING_STATE):
+    """Mémorise les fichiers du store couverts par les modèles sauvegardés"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+def load_training_state(path=TRAINING_STATE):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def store_snapshot(store, sources=TRAIN_SOURCES):
+    return {table: store.snapshot(table, sources) for table in ('details', 'summary')}
+
+def append_labelled(store, source, details_csv=None, summary_csv=None):
+    """Ajoute au store des enregistrements nouvellement annotés (CSV de analyse_audio_zeta)"""
+    for table, path in (('details', details_csv), ('summary', summary_csv)):
+        if path:
+            df = pd.read_csv(path)
+            store.append(table, source, df)
+            print(f"📦 {path} -> {table}/source={source} (+{len(df)} lignes)")
+
+def publish(slice_models, file_models, registry_dir):
+    """Écrit une version .dmodel dans le registre de l'API (moteur d'inférence)"""
+    if SYS_AUTOMA_DIR not in sys.path:
+        sys.path.append(SYS_AUTOMA_DIR)
+    from inference_engine import publish_version
+    return publish_version(slice_models.to_dict(), file_models.to_dict(), registry_dir)
+
+def train_incremental(store, n_trees=INCREMENTAL_TREES):
+    """Met à jour les modèles sauvegardés avec les seules lignes ajoutées au store
+
+    Retourne (slice_models, file_models, mis à jour ?), ou None si un
+    entraînement complet est nécessaire (pas d'état, ou partition réécrite).
+    """
+    state = load_training_state()
+    if state is None or not (os.path.exists('slice_models.pkl') and os.path.exists('file_models.pkl')):
+        print("⚠️ Aucun entraînement précédent : entraînement complet")
+        return None
+    snapshot = store_snapshot(store)
+    data = load_new_data(store, state)
+    if data is None:
+        print("⚠️ Partition du store réécrite depuis le dernier entraînement : entraînement complet")
+        return None
+    
+    slice_models = SliceModels.load('slice_models.pkl')
+    file_models = FileModels.load('file_models.pkl')
+    X_slice = data['slice_data'][0]
+    X_file = data['file_data'][0]
+    print(f"Nouvelles lignes : {len(X_slice)} tranches, {len(X_file)} fichiers")
+    if not len(X_slice) and not len(X_file):
+        print("✅ Aucune nouvelle donnée : modèles inchangés")
+        return slice_models, file_models, False
+    if len(X_slice):
+        print(f"\n=== MISE À JOUR MODÈLES TRANCHES (+{n_trees} arbres) ===")
+        slice_models.update(*data['slice_data'], n_trees=n_trees)
+        slice_models.save('slice_models.pkl')
+    if len(X_file):
+        print(f"\n=== MISE À JOUR MODÈLES FICHIERS (+{n_trees} arbres) ===")
+        file_models.update(*data['file_data'], n_trees=n_trees)
+        file_models.save('file_models.pkl')
+    save_training_state(snapshot)
+    return slice_models, file_models, True
+
+def train_full(store, multi_output=False):
+    # Relevé avant lecture : un fichier ajouté pendant l'entraînement sera vu par la prochaine mise à jour
+    snapshot = store_snapshot(store)
+    data = load_and_prepare_data(store)
     
     # Entraînement modèles tranches
     print("\n=== ENTRAÎNEMENT MODÈLES TRANCHES ===")
-    slice_models = SliceModels()
+    slice_models = SliceModels(multi_output=multi_output)
     slice_models.train(*data['slice_data'])
     slice_models.save('slice_models.pkl')
     
     # Entraînement modèles fichiers
     print("\n=== ENTRAÎNEMENT MODÈLES FICHIERS ===")
-    file_models = FileModels()
+    file_models = FileModels(multi_output=multi_output)
     file_models.train(*data['file_data'])
     file_models.save('file_models.pkl')
+    save_training_state(snapshot)
     
     # Exemple de prédiction
     print("\n=== EXEMPLE DE PRÉDICTION ===")
@@ -211,6 +456,39 @@ def main():
     
     sample_file = data['file_data'][0].iloc[0:1]
     print("Prédiction fichier:", file_models.predict(sample_file))
+    return slice_models, file_models, True
+
+def main():
+    parser = argparse.ArgumentParser(description="Entraînement des modèles de danger (tranches et fichiers)")
+    parser.add_argument('--multi-output', action='store_true',
+                        help="un seul ensemble d'arbres multi-sorties par niveau au lieu d'un modèle par cible")
+    parser.add_argument('--incremental', action='store_true',
+                        help="met à jour les modèles sauvegardés avec les seules lignes ajoutées au store")
+    parser.add_argument('--trees', type=int, default=INCREMENTAL_TREES,
+                        help="arbres ajoutés par modèle en mode incrémental")
+    parser.add_argument('--append-details', help="CSV de tranches annotées à ajouter au store")
+    parser.add_argument('--append-summary', help="CSV de résumés annotés à ajouter au store")
+    parser.add_argument('--source', default='real', help="partition des données ajoutées")
+    parser.add_argument('--publish', metavar='REGISTRE',
+                        help="publie les modèles entraînés comme nouvelle version .dmodel dans ce registre "
+                             f"(mode incrémental : {MODEL_REGISTRY} par défaut)")
+    args = parser.parse_args()
+    
+    # Chargement des données
+    print("Chargement des données...")
+    store = FeatureStore()
+    if not store.exists('details'):
+        print("📦 Store de features vide : import des CSV existants")
+        store.import_csv()
+    append_labelled(store, args.source, args.append_details, args.append_summary)
+    
+    models = train_incremental(store, args.trees) if args.incremental else None
+    if models is None:
+        models = train_full(store, multi_output=args.multi_output)
+    slice_models, file_models, updated = models
+    registry = args.publish or (MODEL_REGISTRY if args.incremental else None)
+    if registry and updated:
+        publish(slice_models, file_models, registry)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
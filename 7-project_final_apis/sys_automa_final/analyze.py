@@ -24,14 +24,53 @@ import soundfile as sf
 from scipy.signal import spectrogram, find_peaks
 from scipy.ndimage import gaussian_filter1d
 import warnings
+from math import gcd
+from spectral_engine import SpectralFrameEngine
+from cry_events import SEUIL_CRI_HAUT, cry_type_from_centroid, dominant_event
+from feature_cache import get_feature_cache
+
+# Version des features : à incrémenter quand l'extraction change (invalide le cache)
+FEATURE_VERSION = 2
 
 class AudioFeatureExtractor:
-    def __init__(self, sample_rate=44100, window_size=5):
+    def __init__(self, sample_rate=44100, window_size=5, batched=True, max_batch_slices=32, hop_size=None,
+                 use_cache=True):
         self.sample_rate = sample_rate
         self.window_size = window_size
-        self.samples_per_window = sample_rate * window_size
+        self.samples_per_window = int(round(sample_rate * window_size))
+        # Mode fenêtres glissantes (hop_size en secondes, ex. 2s / 0.5s) ; None : tranches disjointes
+        self.hop_size = hop_size
+        self.samples_per_hop = int(round(sample_rate * hop_size)) if hop_size else self.samples_per_window
+        self.batched = batched
+        self.max_batch_slices = max_batch_slices  # borne la mémoire des spectres en mode batch
+        self.engine = SpectralFrameEngine(sample_rate=sample_rate)
+        self.use_cache = use_cache  # cache disque par contenu (feature_cache)
         
+    def cache_params(self):
+        """Paramètres qui changent le résultat de process_audio_file"""
+        return {'sample_rate': self.sample_rate, 'window_size': self.window_size, 'hop_size': self.hop_size}
+    
     def process_audio_file(self, audio_path):
+        """Traite un fichier audio, résultat repris du cache si ce contenu a déjà été analysé"""
+        cache = get_feature_cache() if self.use_cache else None
+        if cache is None:
+            return self.analyze_file(audio_path)
+        try:
+            result = cache.get_or_compute(audio_path, 'analyze', FEATURE_VERSION, self.cache_params(),
+                                          lambda: self.analyze_file(audio_path),
+                                          keep=lambda r: bool(r["detail"]))
+        except OSError as e:
+            print(f"⚠️ Cache de features indisponible: {str(e)}")
+            return self.analyze_file(audio_path)
+        # Même contenu sous un autre nom : le titre suit le fichier demandé
+        titre = os.path.basename(audio_path)
+        for slice_info in result["detail"]:
+            slice_info['titre'] = titre
+        if result["summary"]:
+            result["summary"]['titre'] = titre
+        return result
+    
+    def analyze_file(self, audio_path):
         """Traite un fichier audio avec gestion robuste des erreurs"""
         try:
             # Charger le fichier audio
@@ -53,14 +92,19 @@ class AudioFeatureExtractor:
                 return {"detail": [], "summary": {}}
             
             # Découpage et extraction
-            slices = []
-            for i in range(0, len(audio_data), self.samples_per_window):
-                slice_data = audio_data[i:i+self.samples_per_window]
-                if len(slice_data) == self.samples_per_window:
-                    features = self.extract_slice_features(slice_data)
-                    if features:  # Vérifier que l'extraction a réussi
-                        features['tranche_id'] = len(slices) + 1
-                        slices.append(features)
+            if self.hop_size:
+                slices = self.extract_sliding_features(audio_data)
+            elif self.batched:
+                slices = self.extract_file_features(audio_data)
+            else:
+                slices = []
+                for i in range(0, len(audio_data), self.samples_per_window):
+                    slice_data = audio_data[i:i+self.samples_per_window]
+                    if len(slice_data) == self.samples_per_window:
+                        features = self.extract_slice_features(slice_data)
+                        if features:  # Vérifier que l'extraction a réussi
+                            features['tranche_id'] = len(slices) + 1
+                            slices.append(features)
             
             if not slices:
                 return {"detail": [], "summary": {}}
@@ -78,6 +122,118 @@ class AudioFeatureExtractor:
             print(f"Erreur avec {os.path.basename(audio_path)}: {str(e)}")
             return {"detail": [], "summary": {}}
     
+    def slice_view(self, audio_data):
+        """Vue (n_tranches, samples_per_window) sur le signal, sans copie"""
+        n_slices = len(audio_data) // self.samples_per_window
+        if n_slices == 0:
+            return np.empty((0, self.samples_per_window), dtype=audio_data.dtype)
+        windows = np.lib.stride_tricks.sliding_window_view(audio_data, self.samples_per_window)
+        return windows[::self.samples_per_window][:n_slices]
+    
+    def extract_file_features(self, audio_data):
+        """Extrait toutes les tranches complètes d'un signal en mode batch"""
+        windows = self.slice_view(np.ascontiguousarray(audio_data))
+        slices = []
+        for start in range(0, len(windows), self.max_batch_slices):
+            try:
+                batch = self.extract_batch_features(windows[start:start + self.max_batch_slices])
+            except Exception as e:
+                print(f"Erreur extraction batch, repli tranche par tranche: {str(e)}")
+                batch = [self.extract_slice_features(w) for w in windows[start:start + self.max_batch_slices]]
+            for features in batch:
+                if features:
+                    features['tranche_id'] = len(slices) + 1
+                    slices.append(features)
+        return slices
+    
+    def extract_batch_features(self, windows, pcen_state=None):
+        """Extrait les features de n tranches (n, samples_per_window) en appels vectorisés
+        
+        pcen_state (StreamingPCEN) : PCEN continu entre appels successifs (capture en direct),
+        ajouté sous 'pcen_mean_warm' ; 'pcen_mean' reste celui de la tranche seule
+        """
+        # Normalisation par tranche appliquée comme un gain (pas de copie du signal)
+        abs_max = np.max(np.abs(windows), axis=1)
+        gain = 1.0 / (abs_max + 1e-6)
+        
+        # Caractéristiques de base
+        amplitude = np.mean(np.abs(windows), axis=1) * gain
+        rms = np.sqrt(np.mean(windows ** 2, axis=1)) * gain
+        peak = abs_max * gain
+        env = np.where(np.std(windows, axis=1) * gain < 0.05, 1, 2)
+        
+        # Analyse spectrale sur toutes les tranches en une passe
+        spectral = self.engine.slice_features_batch(windows, gain, pcen_state=pcen_state)
+        return self.build_slices(amplitude, rms, peak, env, spectral)
+    
+    def build_slices(self, amplitude, rms, peak, env, spectral):
+        """Dicts de features par tranche à partir des tableaux (une valeur par tranche)"""
+        slices = []
+        for i in range(len(amplitude)):
+            cri_detecte, cri_type = self.classify_events(spectral['cry_events'][i])
+            features = {
+                'amplitude': float(amplitude[i]),
+                'rms': float(rms[i]),
+                'dB': float(20 * np.log10(rms[i] + 1e-6)),
+                'Peak': float(peak[i]),
+                'Score': float(min(100, rms[i] * 100)),
+                'env': int(env[i]),
+                'centroid_mean': float(spectral['centroid_mean'][i]),
+                'bandwidth_mean': float(spectral['bandwidth_mean'][i]),
+                'flatness_mean': float(spectral['flatness_mean'][i]),
+                'mfcc_mean': float(spectral['mfcc_mean'][i]),
+                'pcen_mean': float(spectral['pcen_mean'][i]),
+                'zcr_mean': float(spectral['zcr_mean'][i]),
+                'cri': bool(cri_detecte),
+                'cri_type': cri_type if cri_detecte else "aucun"
+            }
+            if spectral.get('pcen_warm_mean') is not None:
+                features['pcen_mean_warm'] = float(spectral['pcen_warm_mean'][i])
+            slices.append(features)
+        return slices
+    
+    def extract_sliding_features(self, audio_data):
+        """Fenêtres glissantes (samples_per_window, pas samples_per_hop) sur tout le signal
+        
+        Chaque fenêtre est normalisée par son propre pic, comme une tranche
+        disjointe : ses features sont celles d'extract_slice_features, et un pas
+        égal à la fenêtre redonne extract_file_features. Amplitude, rms, Peak et
+        env viennent de sommes cumulées ; les STFT sont partagées entre fenêtres
+        (voir SpectralFrameEngine.window_features).
+        """
+        audio_data = np.ascontiguousarray(audio_data, dtype=np.float64)
+        length, hop = self.samples_per_window, self.samples_per_hop
+        n_windows = 1 + (len(audio_data) - length) // hop
+        if n_windows <= 0:
+            return []
+        starts = np.arange(n_windows) * hop
+        
+        def window_sums(values):
+            cumulative = np.concatenate([[0.0], np.cumsum(values)])
+            return cumulative[starts + length] - cumulative[starts]
+        
+        # Pic par fenêtre : maxima de blocs de pgcd(longueur, pas) échantillons
+        magnitude = np.abs(audio_data)
+        block = gcd(length, hop)
+        n_blocks = len(audio_data) // block
+        block_max = magnitude[:n_blocks * block].reshape(n_blocks, block).max(axis=1)
+        abs_max = np.lib.stride_tricks.sliding_window_view(block_max, length // block)[::hop // block][:n_windows].max(axis=1)
+        gain = 1.0 / (abs_max + 1e-6)
+        
+        mean = window_sums(audio_data) / length
+        mean_sq = window_sums(audio_data ** 2) / length
+        amplitude = window_sums(magnitude) / length * gain
+        rms = np.sqrt(mean_sq) * gain
+        peak = abs_max * gain
+        env = np.where(np.sqrt(np.maximum(mean_sq - mean ** 2, 0.0)) * gain < 0.05, 1, 2)
+        
+        spectral = self.engine.window_features(audio_data, length, hop, gain, self.max_batch_slices)
+        slices = self.build_slices(amplitude, rms, peak, env, spectral)
+        for i, features in enumerate(slices):
+            features['tranche_id'] = i + 1
+            features['start_time'] = round(starts[i] / self.sample_rate, 3)
+        return slices
+    
     def extract_slice_features(self, slice_data):
         """Extrait les features d'une tranche audio"""
         try:
@@ -96,19 +252,14 @@ class AudioFeatureExtractor:
                 'env': self.estimate_sources(slice_data)
             }
             
-            # Analyse spectrale
-            S = np.abs(librosa.stft(slice_data))
-            features.update({
-                'centroid_mean': float(np.mean(librosa.feature.spectral_centroid(S=S, sr=self.sample_rate))),
-                'bandwidth_mean': float(np.mean(librosa.feature.spectral_bandwidth(S=S, sr=self.sample_rate))),
-                'flatness_mean': float(np.mean(librosa.feature.spectral_flatness(y=slice_data))),
-                'mfcc_mean': float(np.mean(librosa.feature.mfcc(y=slice_data, sr=self.sample_rate, n_mfcc=13))),
-                'pcen_mean': float(np.mean(librosa.pcen(librosa.feature.melspectrogram(y=slice_data, sr=self.sample_rate), sr=self.sample_rate))),
-                'zcr_mean': float(np.mean(librosa.feature.zero_crossing_rate(slice_data)))
-            })
+            # Analyse spectrale (une seule STFT partagée par toutes les features)
+            spectral = self.engine.slice_features(slice_data)
+            spectral.pop('cry_ratio_max')
+            events = spectral.pop('cry_events')
+            features.update(spectral)
             
             # Détection de cris
-            cri_detecte, cri_type = self.detect_cry(slice_data)
+            cri_detecte, cri_type = self.classify_events(events)
             features.update({
                 'cri': bool(cri_detecte),
                 'cri_type': cri_type if cri_detecte else "aucun"
@@ -122,23 +273,24 @@ class AudioFeatureExtractor:
     def detect_cry(self, audio_data):
         """Détection de cris avec gestion d'erreurs"""
         try:
-            f, t, Sxx = spectrogram(audio_data, fs=self.sample_rate, nperseg=1024)
-            mask = (f >= 1500) & (f <= 6000)
-            ratio = np.mean(Sxx[mask, :], axis=0) / (np.mean(Sxx, axis=0) + 1e-6)
-            ratio = gaussian_filter1d(ratio, sigma=2)
-            
-            if np.max(ratio) > 0.3:
-                centroid = np.mean(librosa.feature.spectral_centroid(y=audio_data, sr=self.sample_rate))
-                if centroid > 2500:
-                    return True, "bebe"
-                elif centroid > 2000:
-                    return True, "enfant"
-                else:
-                    return True, "adulte"
-            return False, None
+            spectral = self.engine.slice_features(audio_data)
+            return self.classify_events(spectral['cry_events'])
         except:
             return False, None
     
+    def classify_events(self, events):
+        """Décision de cri à partir des événements détectés : type de l'événement le plus long"""
+        event = dominant_event(events)
+        if event is None:
+            return False, None
+        return True, event.type
+    
+    def classify_cry(self, cry_ratio_max, centroid):
+        """Décision de cri à partir du seul maximum du ratio 1.5-6 kHz et du centroid"""
+        if cry_ratio_max > SEUIL_CRI_HAUT:
+            return True, cry_type_from_centroid(centroid)
+        return False, None
+    
     def estimate_sources(self, audio_data):
         """Estimation du nombre de sources"""
         try:
@@ -14,11 +14,20 @@
 
 
 
-from fastapi import FastAPI
-from record import start_recording
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from contextlib import aclosing
+import asyncio
+import json
+from record import start_recording, chunk_duration, chunk_dir, WavFileSource
 from analyze import analyze_directory, extract_amplitudes, AudioFeatureExtractor
 import os
 from logic_controller_advanced import start_analysis_cycle_advanced, start_analysis_cycle
+from inference_engine import score_analysis, loaded_engine
+from job_queue import JobQueue, QueueFullError
+from live_stream import LiveDangerStream
+from feature_cache import get_feature_cache
 import requests
 
 
@@ -28,6 +37,19 @@ app = FastAPI()
 
 rec_status = {"rec": False}
 
+# Jobs d'enregistrement + analyse : un seul micro, donc un worker ; file bornée
+RECORDING_WORKERS = 1
+MAX_PENDING_JOBS = 8
+JOB_WAIT_MAX = 60  # sec, attente maximale d'un GET /jobs/{job_id}?wait=...
+jobs = JobQueue(max_workers=RECORDING_WORKERS, max_pending=MAX_PENDING_JOBS)
+
+# Flux de danger en direct (micro partagé entre tous les abonnés)
+live_stream = LiveDangerStream()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    jobs.shutdown()
+
 @app.get("/run_cycle_advanced")
 def run_full_cycle_advanced():
     """Lance le cycle d'analyse avancé avec IA et modèles ML"""
@@ -56,9 +78,8 @@ def trigger_Ndetection():
     rec_status["rec"] = False
     return {"message": "Détection stoppée."}
 
-@app.get("/check_and_record_advanced")
-def check_and_record_advanced():
-    """Enregistrement et analyse avancée avec IA"""
+def record_and_analyze_advanced():
+    """Enregistrement et analyse avancée avec IA (bloquant, exécuté dans un job)"""
     rec_status["rec"] = True
     if rec_status["rec"]:
         print("🎙️ Enregistrement avancé démarré...")
@@ -84,16 +105,10 @@ def check_and_record_advanced():
             
             print(f"✅ Analyse avancée réussie: {len(analysis_result['detail'])} tranches analysées")
             
-            # 4. Envoi à l'IA pour détection de danger avancée
-            try:
-                r3 = requests.post("http://localhost:8001/danger-alert-advanced", json=analysis_result)
-                if r3.status_code == 200:
-                    ai_result = r3.json()
-                    print(f"🤖 Analyse IA terminée: {ai_result['percent']}% de danger")
-                else:
-                    ai_result = {"error": f"Erreur API IA: {r3.status_code}"}
-            except Exception as e:
-                ai_result = {"error": f"Erreur connexion IA: {str(e)}"}
+            # 4. Détection de danger avancée (moteur en mémoire, repli HTTP)
+            ai_result = score_analysis(analysis_result, ai_url="http://localhost:8001")
+            if "percent" in ai_result and "error" not in ai_result:
+                print(f"🤖 Analyse IA terminée: {ai_result['percent']}% de danger")
 
             rec_status["rec"] = False
 
@@ -115,9 +130,8 @@ def check_and_record_advanced():
     else:
         return {"status": "waiting"}
 
-@app.get("/check_and_record")
-def check_and_record():
-    """Enregistrement et analyse simple (compatibilité)"""
+def record_and_analyze():
+    """Enregistrement et analyse simple (bloquant, exécuté dans un job)"""
     rec_status["rec"] = True
     if rec_status["rec"]:
         print("🎙️ Enregistrement simple démarré...")
@@ -157,6 +171,99 @@ def check_and_record():
     else:
         return {"status": "waiting"}
 
+JOB_TASKS = {
+    "record_advanced": record_and_analyze_advanced,
+    "record": record_and_analyze
+}
+
+def submit_job(kind):
+    """Crée un job ; 429 si la file est pleine (le client réessaie plus tard)"""
+    try:
+        return jobs.submit(kind, JOB_TASKS[kind])
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"File de jobs pleine: {str(e)}",
+                            headers={"Retry-After": str(chunk_duration)})
+
+def job_response(job):
+    if job.status == "error":
+        return {"status": "error", "message": f"Erreur du job: {job.error}"}
+    return job.result
+
+@app.post("/jobs/{kind}", status_code=202)
+async def create_job(kind: str):
+    """Démarre un job d'enregistrement + analyse ('record_advanced' ou 'record')"""
+    if kind not in JOB_TASKS:
+        raise HTTPException(status_code=404, detail=f"Type de job inconnu: {kind}")
+    job = submit_job(kind)
+    return {"job_id": job.id, "status": job.status, "position": jobs.position(job),
+            "poll": f"/jobs/{job.id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """État d'un job ; wait > 0 attend sa fin jusqu'à wait secondes (long polling)"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inconnu")
+    await jobs.wait(job, min(max(wait, 0), JOB_WAIT_MAX))
+    return {**job.snapshot(), "position": jobs.position(job)}
+
+@app.get("/jobs")
+async def get_jobs_stats():
+    """Compteurs de la file de jobs"""
+    return jobs.stats()
+
+@app.get("/check_and_record_advanced")
+async def check_and_record_advanced():
+    """Enregistrement et analyse avancée avec IA (attend le job, sans bloquer le serveur)"""
+    job = await jobs.wait(submit_job("record_advanced"), None)
+    return job_response(job)
+
+@app.get("/check_and_record")
+async def check_and_record():
+    """Enregistrement et analyse simple (compatibilité)"""
+    job = await jobs.wait(submit_job("record"), None)
+    return job_response(job)
+
+def select_stream(file):
+    """Flux du micro, ou rejeu en temps réel d'un fichier de audio_chunks"""
+    if file is None:
+        return live_stream
+    path = os.path.join(chunk_dir, os.path.basename(file))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Fichier audio non trouvé: {file}")
+    return LiveDangerStream(source_factory=lambda: WavFileSource(path, realtime=True))
+
+@app.get("/stream/danger")
+async def stream_danger(file: Optional[str] = None):
+    """Server-Sent Events : un événement 'window' (features + danger) par fenêtre analysée"""
+    stream = select_stream(file)
+
+    async def sse():
+        async with aclosing(stream.events()) as events:
+            async for event in events:
+                yield f"event: window\ndata: {json.dumps(event)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/danger")
+async def websocket_danger(websocket: WebSocket, file: Optional[str] = None):
+    """WebSocket : même contenu que /stream/danger, un message JSON par fenêtre"""
+    await websocket.accept()
+    try:
+        stream = select_stream(file)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    try:
+        async with aclosing(stream.events()) as events:
+            async for event in events:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 
 @app.get("/analyse_advanced")
 def get_advanced_analysis():
@@ -207,37 +314,44 @@ def get_system_status():
         if os.path.exists("audio_chunks"):
             audio_files = sorted(f for f in os.listdir("audio_chunks") if f.endswith(".wav"))
         
-        # Vérifier la connexion à l'API IA
+        # Vérifier le moteur IA embarqué (sans le charger), puis l'API IA
         ia_status = "unknown"
-        try:
-            response = requests.get("http://localhost:8001/models-status", timeout=2)
-            if response.status_code == 200:
-                ia_data = response.json()
-                ia_status = "connected" if ia_data.get("models_available", False) else "models_not_loaded"
-            else:
-                ia_status = "error"
-        except:
-            ia_status = "disconnected"
+        engine = loaded_engine()
+        if engine is not None and engine.models_loaded:
+            ia_status = "connected"
+        else:
+            try:
+                response = requests.get("http://localhost:8001/models-status", timeout=2)
+                if response.status_code == 200:
+                    ia_data = response.json()
+                    ia_status = "connected" if ia_data.get("models_available", False) else "models_not_loaded"
+                else:
+                    ia_status = "error"
+            except:
+                ia_status = "disconnected"
         
+        feature_cache = get_feature_cache()
         return {
             "recording_status": rec_status["rec"],
             "audio_files_count": len(audio_files),
             "latest_file": audio_files[-1] if audio_files else None,
             "ia_api_status": ia_status,
-            "system_ready": len(audio_files) > 0 and ia_status == "connected"
+            "system_ready": len(audio_files) > 0 and ia_status == "connected",
+            "jobs": jobs.stats(),
+            "feature_cache": feature_cache.stats() if feature_cache else None
         }
         
     except Exception as e:
         return {"error": f"Erreur lors de la vérification du statut: {str(e)}"}
 
 @app.get("/test_full_system")
-def test_full_system():
+async def test_full_system():
     """Test complet du système : enregistrement → analyse → IA"""
     try:
         print("🧪 Test complet du système démarré...")
         
         # 1. Test d'enregistrement
-        record_result = check_and_record_advanced()
+        record_result = await check_and_record_advanced()
         if record_result.get("status") != "done":
             return {"error": "Échec du test d'enregistrement", "details": record_result}
         
@@ -245,7 +359,7 @@ def test_full_system():
         
         # 2. Test de connexion IA
         try:
-            ia_status = requests.get("http://localhost:8001/models-status", timeout=5)
+            ia_status = await asyncio.to_thread(requests.get, "http://localhost:8001/models-status", timeout=5)
             if ia_status.status_code != 200:
                 return {"error": "API IA non accessible", "status_code": ia_status.status_code}
         except Exception as e:
@@ -0,0 +1,77 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Détection d'événements de cri sur le ratio d'énergie 1.5-6 kHz par trame
+
+Partagé par l'extracteur temps réel (analyze.py) et l'extracteur
+d'entraînement (analyse_audio_zeta.py). Hystérésis : une trame au-dessus du
+seuil bas prolonge un événement, mais il faut au moins une trame au-dessus
+du seuil haut pour le déclencher ; les segments sont obtenus par codage par
+plages (run-length) en O(trames), puis filtrés par durée minimale.
+"""
+from collections import namedtuple
+import numpy as np
+
+SEUIL_CRI_HAUT = 0.3          # ratio déclenchant un cri
+FACTEUR_SEUIL_BAS = 0.5       # seuil bas = seuil haut * facteur (prolongation)
+DUREE_MIN_CRI = 0.3           # secondes
+
+# Centroïde moyen (Hz) au-dessus duquel le cri est attribué à chaque type
+CENTROID_BEBE = 2500
+CENTROID_ENFANT = 2000
+
+CryEvent = namedtuple('CryEvent', ['onset', 'duration', 'type'])
+
+
+def cry_type_from_centroid(centroid):
+    """Type de cri d'après le centroïde spectral moyen"""
+    if centroid > CENTROID_BEBE:
+        return "bebe"
+    if centroid > CENTROID_ENFANT:
+        return "enfant"
+    return "adulte"
+
+def cry_segments(ratio, seuil_haut=SEUIL_CRI_HAUT, seuil_bas=None, min_frames=1):
+    """(débuts, fins) en trames des segments retenus (fin exclue)"""
+    ratio = np.asarray(ratio)
+    if seuil_bas is None:
+        seuil_bas = seuil_haut * FACTEUR_SEUIL_BAS
+    # Plages contiguës au-dessus du seuil bas
+    above = np.concatenate([[False], ratio > seuil_bas, [False]])
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    # Au moins une trame au-dessus du seuil haut dans la plage
+    high = np.concatenate([[0], np.cumsum(ratio > seuil_haut)])
+    keep = (high[ends] - high[starts] > 0) & (ends - starts >= min_frames)
+    return starts[keep], ends[keep]
+
+def detect_cry_events(ratio, frame_duration, seuil_haut=SEUIL_CRI_HAUT, seuil_bas=None,
+                      duree_min=DUREE_MIN_CRI, cri_type=None, offset=0.0):
+    """Liste de CryEvent(onset, duration, type), onset en secondes (+ offset)
+
+    Le type est fixé par l'appelant (cri_type), d'après le centroïde moyen de
+    toute la tranche comme à l'entraînement, et non celui de l'événement seul.
+    """
+    min_frames = max(1, int(np.ceil(duree_min / frame_duration - 1e-9)))
+    starts, ends = cry_segments(ratio, seuil_haut, seuil_bas, min_frames)
+    return [CryEvent(round(offset + start * frame_duration, 3),
+                     round((end - start) * frame_duration, 3), cri_type)
+            for start, end in zip(starts, ends)]
+
+def dominant_event(events):
+    """Événement le plus long (None si aucun)"""
+    return max(events, key=lambda e: e.duration) if events else None
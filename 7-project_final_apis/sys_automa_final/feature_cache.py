@@ -0,0 +1,185 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Cache disque des features par contenu audio (empreinte -> features)
+
+La clé combine l'empreinte SHA-256 du fichier, le nom et la version de
+l'extracteur et ses paramètres (sample_rate, window_size...) : un fichier
+renommé ou copié est retrouvé, une modification du signal ou de l'extracteur
+donne une nouvelle clé. Une entrée = un fichier pickle écrit atomiquement ;
+au-delà de max_bytes, les entrées les moins récemment utilisées (date de
+modification, rafraîchie à chaque lecture) sont supprimées.
+
+Partagé par analyze.py (API) et les scripts d'entraînement (cree_data.py,
+analyse_audio_zeta.py).
+"""
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+FEATURE_CACHE_DIR = os.environ.get("FEATURE_CACHE_DIR", "feature_cache")
+FEATURE_CACHE_MAX_BYTES = int(os.environ.get("FEATURE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+FEATURE_CACHE_ENABLED = os.environ.get("FEATURE_CACHE", "1") != "0"
+ENTRY_EXTENSION = '.pkl'
+HASH_BLOCK_SIZE = 1 << 20
+HASH_MEMO_SIZE = 4096  # empreintes de fichiers gardées en mémoire (les moins récemment utilisées sortent)
+
+
+class FeatureCache:
+    """Store disque clé -> objet, éviction LRU bornée en taille"""
+
+    def __init__(self, directory=FEATURE_CACHE_DIR, max_bytes=FEATURE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # (chemin, taille, mtime) -> empreinte : évite de relire un fichier inchangé (LRU)
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()  # mémo, compteurs et éviction
+        os.makedirs(directory, exist_ok=True)
+
+    def file_hash(self, path):
+        """Empreinte SHA-256 du contenu du fichier"""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(memo_key)
+            if digest is not None:
+                self._hashes.move_to_end(memo_key)
+                return digest
+        # Lecture hors verrou : deux threads peuvent hacher le même fichier, le résultat est identique
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        with self._lock:
+            self._hashes[memo_key] = digest
+            while len(self._hashes) > HASH_MEMO_SIZE:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def key(self, path, extractor, version, params):
+        """Clé d'entrée : empreinte du fichier + extracteur, version, paramètres"""
+        description = json.dumps({'audio': self.file_hash(path), 'extractor': extractor,
+                                  'version': version, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    def get(self, key):
+        """Objet en cache ou None (entrée illisible : considérée absente)"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # récemment utilisé
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        except Exception as e:
+            print(f"⚠️ Entrée de cache illisible {key[:12]}: {str(e)}")
+            self._remove(path)
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        return value
+
+    def put(self, key, value):
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_compute(self, path, extractor, version, params, compute, keep=None):
+        """Features du fichier depuis le cache, sinon compute() puis mise en cache
+
+        keep(valeur) décide si un résultat calculé est conservé (ex. pas les échecs).
+        """
+        key = self.key(path, extractor, version, params)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if keep is None or keep(value):
+                self.put(key, value)
+        return value
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_EXTENSION):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes"""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            hits, misses, memo = self.hits, self.misses, len(self._hashes)
+        return {"directory": self.directory, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                "hits": hits, "misses": misses, "hashes_memo": memo}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_feature_cache():
+    """Cache partagé du processus (None si désactivé par FEATURE_CACHE=0)"""
+    global _cache
+    if not FEATURE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FeatureCache()
+    return _cache
@@ -0,0 +1,276 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Features de la fenêtre courante mises à jour bloc par bloc (capture en direct)
+
+La fenêtre est faite des window_steps derniers pas complets de hop_length
+échantillons ; features() rend le dict de extract_slice_features sur ces
+mêmes échantillons (aux arrondis près, voir test_incremental_features.py).
+
+ingest(bloc) coûte O(bloc) : chaque pas produit une trame causale (FFT des
+n_fft derniers échantillons), qui est exactement une trame intérieure (sans
+padding) de la STFT centrée d'une tranche isolée. Ses statistiques entrent
+dans des sommes glissantes ; son mel et ses énergies de bande sont gardés en
+anneau pour les features qui dépendent de toute la fenêtre.
+
+features() ne refait ni FFT ni mel sur la fenêtre :
+  - amplitude, rms, Peak, env, centroid, bandwidth, flatness, zcr : sommes
+    glissantes, plus les trames de bord (padding de la tranche isolée)
+    recalculées sur les n_fft + pas échantillons de chaque extrémité
+  - mfcc (plancher top_db au maximum de la fenêtre), pcen (lisseur repartant
+    à froid au début de la fenêtre) et ratio de cri (epsilon au gain de la
+    fenêtre) ne se décomposent pas en sommes : une passe vectorisée sur les
+    mel et énergies de bande déjà calculés, avec les fonctions du moteur
+  - pcen_mean_warm : PCEN continu (StreamingPCEN), somme glissante, hors modèle
+
+flatness des trames intérieures est calculée au gain courant au moment de
+l'ingestion (le seuil amin de librosa n'est pas invariant d'échelle).
+"""
+import numpy as np
+import librosa
+from collections import deque
+from scipy.ndimage import gaussian_filter1d
+from spectral_engine import SpectralFrameEngine, StreamingPCEN
+from cry_events import dominant_event
+
+# Sommes glissantes par pas (échantillons) et par trame intérieure (spectre)
+SAMPLE_COLUMNS = ['sum', 'sum_sq', 'sum_abs']
+FRAME_COLUMNS = ['centroid', 'bandwidth', 'flatness', 'zcr', 'pcen_warm']
+ZCR_THRESHOLD = 1e-10  # valeurs ramenées à zéro par librosa.feature.zero_crossing_rate
+
+
+class SlidingMax:
+    """Maximum glissant sur les `size` dernières valeurs (file monotone, O(1) amorti)"""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = deque()  # (indice, valeur) à valeurs décroissantes
+        self._count = 0
+
+    def push(self, value):
+        while self._items and self._items[-1][1] <= value:
+            self._items.pop()
+        self._items.append((self._count, value))
+        self._count += 1
+        while self._items[0][0] <= self._count - 1 - self.size:
+            self._items.popleft()
+
+    @property
+    def value(self):
+        return self._items[0][1] if self._items else 0.0
+
+
+class Ring:
+    """Les `size` dernières lignes d'un flux, dans un tableau circulaire"""
+
+    def __init__(self, size, shape=()):
+        self.size = size
+        self.rows = np.zeros((size, *shape))
+        self.count = 0
+
+    def _slots(self, n):
+        return (self.count + np.arange(n)) % self.size
+
+    def push(self, rows):
+        kept = rows[-self.size:]
+        self.count += len(rows) - len(kept)
+        self.rows[self._slots(len(kept))] = kept
+        self.count += len(kept)
+
+    def take(self, offset, n):
+        """n lignes à partir de offset (0 : la plus ancienne gardée)"""
+        return self.rows[(self.count + offset + np.arange(n)) % self.size]
+
+    def ordered(self):
+        return self.take(0, self.size)
+
+
+class RunningSums(Ring):
+    """Ring + somme par colonne des lignes gardées, O(largeur) par ligne"""
+
+    def __init__(self, size, width):
+        super().__init__(size, (width,))
+        self.total = np.zeros(width)
+
+    def push(self, rows):
+        previous = self.count
+        if len(rows) < self.size:
+            self.total += rows.sum(axis=0) - self.rows[self._slots(len(rows))].sum(axis=0)
+        super().push(rows)
+        if len(rows) >= self.size or self.count // self.size != previous // self.size:
+            self.total = self.rows.sum(axis=0)  # recalage à chaque tour (dérive flottante)
+
+
+class IncrementalFeatureState:
+    """État de features en direct : ingest(bloc) en O(bloc), features() sans FFT ni mel"""
+
+    def __init__(self, sample_rate=44100, window_seconds=5, engine=None):
+        self.engine = engine or SpectralFrameEngine(sample_rate=sample_rate)
+        self.sample_rate = sample_rate
+        self.hop = self.engine.hop_length
+        self.n_fft = self.engine.n_fft
+        self.window_steps = max(1, int(window_seconds * sample_rate // self.hop))
+        # Trames de la STFT centrée d'une tranche de window_steps pas : window_steps + 1,
+        # dont edge_frames à chaque bord touchent le padding (n_fft/2 multiple de hop)
+        self.edge_frames = self.n_fft // 2 // self.hop
+        self.inner_frames = self.window_steps + 1 - 2 * self.edge_frames
+        self._frame_steps = self.n_fft // self.hop
+        self._edge_samples = self.edge_frames * self.hop + self.n_fft
+
+        self._fft_window = librosa.filters.get_window('hann', self.n_fft)
+        self._history = np.zeros(self.n_fft - self.hop)      # fin du signal déjà traité
+        self._pending = np.zeros(0)                           # échantillons d'un pas incomplet
+        self._last_negative = False
+        self._crossings = np.zeros((self._frame_steps - 1, 2))  # passages par zéro des derniers pas
+
+        self.n_steps = 0
+        self._samples = Ring(self.window_steps * self.hop)   # pour les trames de bord
+        self._sample_sums = RunningSums(self.window_steps, len(SAMPLE_COLUMNS))
+        self._peak = SlidingMax(self.window_steps)
+        self._frame_sums = RunningSums(self.inner_frames, len(FRAME_COLUMNS))
+        self._mel = Ring(self.inner_frames, (self.engine.mel_basis.shape[0],))
+        self._cry_energy = Ring(self.inner_frames, (2,))     # (bande cri, totale) par trame
+
+        # PCEN continu (pcen_mean_warm), état conservé d'un bloc à l'autre
+        self._pcen = StreamingPCEN(sample_rate=sample_rate, hop_length=self.hop)
+
+    @property
+    def window_ready(self):
+        """Vrai quand la fenêtre complète (window_seconds) a été reçue"""
+        return self.n_steps >= self.window_steps
+
+    def ingest(self, block):
+        """Ajoute un bloc d'échantillons (taille quelconque)"""
+        block = np.asarray(block, dtype=np.float64).reshape(-1)
+        samples = np.concatenate([self._pending, block])
+        n_new = len(samples) // self.hop
+        if n_new == 0:
+            self._pending = samples
+            return
+        chunks = samples[:n_new * self.hop].reshape(n_new, self.hop)
+        self._pending = samples[n_new * self.hop:]
+
+        # Trames : les n_fft derniers échantillons à la fin de chaque pas
+        signal = np.concatenate([self._history, chunks.reshape(-1)])
+        frames = np.lib.stride_tricks.sliding_window_view(signal, self.n_fft)[::self.hop][:n_new]
+        self._history = signal[-(self.n_fft - self.hop):]
+        S = np.abs(np.fft.rfft(frames * self._fft_window, axis=-1)).T
+
+        chunk_peaks = np.max(np.abs(chunks), axis=1)
+        for peak in chunk_peaks:
+            self._peak.push(peak)
+        gain = 1.0 / (self._peak.value + 1e-6)  # gain courant (fenêtre se terminant sur ce bloc)
+
+        mel = self.engine.mel(S ** 2)
+        pcen_warm = np.mean(self._pcen.process(mel * gain ** 2, gain), axis=0)
+        self._samples.push(chunks.reshape(-1))
+        self._sample_sums.push(np.column_stack([chunks.sum(axis=1), (chunks ** 2).sum(axis=1),
+                                                np.abs(chunks).sum(axis=1)]))
+        self._frame_sums.push(np.column_stack([*self._spectral_stats(S, gain),
+                                               self._zcr(chunks), pcen_warm]))
+        self._mel.push(mel.T)
+        self._cry_energy.push(self._band_energy(S).T)
+        self.n_steps += n_new
+
+    def _spectral_stats(self, S, gain):
+        """centroid, bandwidth et flatness de chaque trame (S : fréquences x trames)"""
+        freqs = self.engine.freqs
+        return (librosa.feature.spectral_centroid(S=S, sr=self.sample_rate, freq=freqs)[0],
+                librosa.feature.spectral_bandwidth(S=S, sr=self.sample_rate, freq=freqs)[0],
+                librosa.feature.spectral_flatness(S=S * gain)[0])
+
+    def _zcr(self, chunks):
+        """Taux de passage par zéro de chaque trame causale (comme librosa, trame de n_fft)"""
+        negative = chunks.reshape(-1) < -ZCR_THRESHOLD
+        flips = negative != np.concatenate([[self._last_negative], negative[:-1]])
+        self._last_negative = negative[-1]
+        flips = flips.reshape(chunks.shape)
+        # par pas : passages (paire finissant dans le pas), et celui de sa première paire
+        steps = np.concatenate([self._crossings, np.column_stack([flips.sum(axis=1), flips[:, 0]])])
+        self._crossings = steps[-(self._frame_steps - 1):]
+        cumulative = np.concatenate([[0.0], np.cumsum(steps[:, 0])])
+        # trame = frame_steps pas, sans la paire qui la relie au pas précédent
+        counts = cumulative[self._frame_steps:] - cumulative[:-self._frame_steps] - steps[:len(chunks), 1]
+        return counts / self.n_fft
+
+    def _band_energy(self, S):
+        """Énergies moyennes (bande cri, totale) de chaque trame, à l'échelle brute"""
+        density = S ** 2 * self.engine.density_scale[:, None]
+        return np.stack([np.mean(density[self.engine.cry_mask], axis=0), np.mean(density, axis=0)])
+
+    def _edges(self, gain):
+        """Spectre et ZCR des trames de bord de la fenêtre, padding compris (tranche isolée)"""
+        ends = np.stack([self._samples.take(0, self._edge_samples),
+                         self._samples.take(self._samples.size - self._edge_samples, self._edge_samples)]) * gain
+        k = self.edge_frames
+        S = self.engine.magnitude(ends)
+        zcr = librosa.feature.zero_crossing_rate(ends, frame_length=self.n_fft, hop_length=self.hop)[:, 0]
+        return (np.concatenate([S[0, :, :k], S[1, :, -k:]], axis=1),
+                np.concatenate([zcr[0, :k], zcr[1, -k:]]))
+
+    def features(self):
+        """Dict de features de la fenêtre courante (mêmes clés que extract_slice_features)
+
+        None tant que la fenêtre complète n'a pas été reçue.
+        """
+        if not self.window_ready:
+            return None
+        peak = self._peak.value
+        gain = 1.0 / (peak + 1e-6)
+        n_samples = self.window_steps * self.hop
+        n_frames = self.window_steps + 1
+        k = self.edge_frames
+
+        samples = dict(zip(SAMPLE_COLUMNS, self._sample_sums.total))
+        mean = samples['sum'] / n_samples
+        mean_sq = samples['sum_sq'] / n_samples
+        rms = np.sqrt(max(mean_sq, 0.0)) * gain
+        std = np.sqrt(max(mean_sq - mean ** 2, 0.0)) * gain
+
+        # Trames de bord (normalisées) + sommes des trames intérieures (brutes)
+        S_edges, zcr_edges = self._edges(gain)
+        frames = dict(zip(FRAME_COLUMNS, self._frame_sums.total))
+        centroid_edges, bandwidth_edges, flatness_edges = self._spectral_stats(S_edges, 1.0)
+        centroid = (frames['centroid'] + np.sum(centroid_edges)) / n_frames
+
+        # Features de toute la fenêtre : mel et énergies gardés, au gain de la fenêtre
+        mel_edges = self.engine.mel(S_edges ** 2)
+        mel = np.concatenate([mel_edges[:, :k], self._mel.ordered().T * gain ** 2, mel_edges[:, k:]], axis=1)
+        energy_edges = self._band_energy(S_edges)
+        energy = np.concatenate([energy_edges[:, :k], self._cry_energy.ordered().T * gain ** 2,
+                                 energy_edges[:, k:]], axis=1)
+        cry_ratio = gaussian_filter1d(energy[0] / (energy[1] + 1e-6), sigma=self.engine.cry_sigma)
+        event = dominant_event(self.engine.cry_events(cry_ratio, centroid))
+
+        return {
+            'amplitude': float(samples['sum_abs'] / n_samples * gain),
+            'rms': float(rms),
+            'dB': float(20 * np.log10(rms + 1e-6)),
+            'Peak': float(peak * gain),
+            'Score': float(min(100, rms * 100)),
+            'env': 1 if std < 0.05 else 2,
+            'centroid_mean': float(centroid),
+            'bandwidth_mean': float((frames['bandwidth'] + np.sum(bandwidth_edges)) / n_frames),
+            'flatness_mean': float((frames['flatness'] + np.sum(flatness_edges)) / n_frames),
+            'mfcc_mean': float(np.mean(self.engine.mfcc(mel))),
+            'pcen_mean': float(np.mean(self.engine.pcen(mel))),
+            'pcen_mean_warm': float(frames['pcen_warm'] / self.inner_frames),
+            'zcr_mean': float((frames['zcr'] + np.sum(zcr_edges)) / n_frames),
+            'cry_ratio_max': float(np.max(cry_ratio)),
+            'cri': event is not None,
+            'cri_type': event.type if event is not None else "aucun"
+        }
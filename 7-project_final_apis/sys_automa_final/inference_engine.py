@@ -0,0 +1,681 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Moteur d'inférence danger embarquable
+
+Utilisé directement (en mémoire) par audio_api_system et logic_controller_advanced,
+et exposé en HTTP par danger_alert.py qui n'est plus qu'une fine couche autour.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+import joblib
+import requests
+from model_classes import AudioPreprocessor, ModelContainer
+from tree_compiler import compile_verified, CompiledTreeEnsemble
+from model_artifact import write_artifact, read_artifact, read_header, new_version, file_sha256, ARTIFACT_EXTENSION
+
+SLICE_MODELS_PATH = 'slice_models.pkl'
+FILE_MODELS_PATH = 'file_models.pkl'
+SLICE_ARTIFACT_PATH = 'slice_models' + ARTIFACT_EXTENSION
+FILE_ARTIFACT_PATH = 'file_models' + ARTIFACT_EXTENSION
+USE_COMPILED_TREES = True  # arbres compilés (tree_compiler) à la place de predict sklearn
+# Registre des versions publiées : <registre>/<version>/{slice,file}_models.dmodel
+MODEL_REGISTRY_DIR = os.environ.get("DANGER_MODEL_REGISTRY", "model_registry")
+
+# ORDRE EXACT selon le modèle entraîné
+REQUIRED_SLICE_FEATURES = [
+    'amplitude', 'rms', 'dB', 'Peak', 'Score', 'env',
+    'centroid_mean', 'bandwidth_mean', 'flatness_mean',
+    'mfcc_mean', 'pcen_mean', 'zcr_mean', 'cri_type'
+]
+
+REQUIRED_FILE_FEATURES = [
+    'nb_tranches', 'nb_cris', 'env_moy', 'rms_moy',
+    'peak_moy', 'centroid_moy', 'bandwidth_moy',
+    'mfcc_moy', 'pcen_moy', 'cri_type_dom'
+]
+
+GROUP_MODELS = {
+    'slice': ('danger_model', 'moy_danger_model'),
+    'file': ('max_model', 'moy_model', 'std_model')
+}
+GROUP_FEATURES = {'slice': REQUIRED_SLICE_FEATURES, 'file': REQUIRED_FILE_FEATURES}
+CATEGORICAL_FEATURES = ('cri_type', 'cri_type_dom')
+# Clé d'un pickle de niveau entraîné en un seul ensemble multi-sorties
+# (data['outputs'] : noms des cibles de GROUP_MODELS, dans l'ordre des colonnes)
+MULTI_OUTPUT_MODEL = 'multi_output_model'
+
+
+def numeric_values(rows, features, out=None):
+    """Valeurs numériques des lignes en float64, vérifiées comme check_array de sklearn
+
+    Une clé absente ou None donne NaN : refusé comme par sklearn, au lieu
+    d'être envoyé aux arbres compilés.
+    """
+    values = np.empty((len(rows), len(features))) if out is None else out
+    try:
+        for i, row in enumerate(rows):
+            for j, name in enumerate(features):
+                values[i, j] = row.get(name, np.nan)
+    except (TypeError, ValueError) as e:
+        raise ValueError(str(e)) from None
+    if np.isnan(values).any():
+        raise ValueError("Input X contains NaN.")
+    if not np.isfinite(values).all():
+        raise ValueError("Input X contains infinity or a value too large for dtype('float64').")
+    return values
+
+
+class CompiledPreprocessor:
+    """Équivalent figé du ColumnTransformer (StandardScaler + OneHotEncoder)
+
+    Les moyennes/écarts-types et les catégories sont extraits une fois ; une
+    requête remplit directement une matrice float32 à disposition fixe
+    [numériques standardisées | one-hot], sans DataFrame. Le calcul est fait en
+    float64 comme sklearn puis converti en float32, le type que les arbres
+    sklearn utilisent en interne : les prédictions sont identiques.
+    """
+
+    def __init__(self, numeric_features, categorical_feature, mean, scale, categories):
+        self.numeric_features = list(numeric_features)
+        self.categorical_feature = categorical_feature
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.categories = [str(c) for c in categories]
+        self._category_index = {c: i for i, c in enumerate(categories)}
+        self.n_numeric = len(self.numeric_features)
+        self.n_features = self.n_numeric + len(self.categories)
+        self._buffers = threading.local()
+
+    @classmethod
+    def from_audio_preprocessor(cls, preprocessor):
+        """Extrait les paramètres d'un AudioPreprocessor entraîné"""
+        ct = preprocessor.preprocessor
+        transformers = {name: columns for name, _, columns in ct.transformers_}
+        scaler = ct.named_transformers_['num']
+        encoder = ct.named_transformers_['cat']
+        if len(transformers['cat']) != 1 or encoder.drop is not None or encoder.handle_unknown != 'ignore':
+            raise ValueError("Préprocesseur non supporté (une seule colonne catégorielle, drop=None, handle_unknown='ignore')")
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(len(transformers['num']))
+        scale = scaler.scale_ if scaler.with_std else np.ones(len(transformers['num']))
+        return cls(transformers['num'], transformers['cat'][0], mean, scale, encoder.categories_[0])
+
+    @property
+    def feature_order(self):
+        return self.numeric_features + [self.categorical_feature]
+
+    def _scratch(self, n_rows):
+        """Tampons réutilisés par thread (réalloués seulement s'ils sont trop petits)"""
+        buffers = self._buffers
+        if getattr(buffers, 'capacity', 0) < n_rows:
+            buffers.capacity = max(n_rows, 2 * getattr(buffers, 'capacity', 0), 8)
+            buffers.numeric = np.empty((buffers.capacity, self.n_numeric), dtype=np.float64)
+            buffers.out = np.empty((buffers.capacity, self.n_features), dtype=np.float32)
+        return buffers.numeric[:n_rows], buffers.out[:n_rows]
+
+    def transform_rows(self, rows, values=None):
+        """Liste de dicts -> matrice float32 (n, n_features) ; vue sur un tampon réutilisé
+
+        ValueError (même message que sklearn) si une valeur numérique est
+        absente, non numérique ou non finie. values : colonnes numériques déjà
+        extraites par numeric_values (dans l'ordre de numeric_features).
+        """
+        numeric, out = self._scratch(len(rows))
+        if values is None:
+            numeric_values(rows, self.numeric_features, out=numeric)
+        else:
+            numeric[:] = values
+        numeric -= self.mean
+        numeric /= self.scale
+        out[:, :self.n_numeric] = numeric
+        out[:, self.n_numeric:] = 0.0
+        for i, row in enumerate(rows):
+            k = self._category_index.get(row.get(self.categorical_feature))
+            if k is not None:
+                out[i, self.n_numeric + k] = 1.0
+        return out
+
+    def to_arrays(self):
+        arrays = {'mean': self.mean, 'scale': self.scale,
+                  'categories': np.array(self.categories, dtype=np.str_)}
+        meta = {'numeric_features': self.numeric_features,
+                'categorical_feature': self.categorical_feature}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        return cls(meta['numeric_features'], meta['categorical_feature'],
+                   arrays['mean'], arrays['scale'], arrays['categories'].tolist())
+
+    def matches(self, preprocessor, rows):
+        """Vérifie l'égalité avec le préprocesseur sklearn sur des lignes de contrôle"""
+        reference = preprocessor.transform(pd.DataFrame(rows)[self.feature_order]).astype(np.float32)
+        return np.array_equal(reference, self.transform_rows(rows))
+
+    def probe_rows(self):
+        """Lignes de contrôle : moyenne ± écart-type pour chaque catégorie (+ une inconnue)"""
+        rows = []
+        for k, category in enumerate(self.categories + ['__inconnue__']):
+            values = self.mean + (1 if k % 2 else -1) * self.scale
+            row = dict(zip(self.numeric_features, values.tolist()))
+            row[self.categorical_feature] = category
+            rows.append(row)
+        return rows
+
+
+class DangerInferenceEngine:
+    """Charge les modèles tranches/fichier et calcule le danger d'une analyse audio"""
+
+    def __init__(self, slice_models_path=SLICE_MODELS_PATH, file_models_path=FILE_MODELS_PATH,
+                 compiled_trees=USE_COMPILED_TREES, slice_artifact_path=SLICE_ARTIFACT_PATH,
+                 file_artifact_path=FILE_ARTIFACT_PATH):
+        self.slice_models_path = slice_models_path
+        self.file_models_path = file_models_path
+        self.slice_artifact_path = slice_artifact_path
+        self.file_artifact_path = file_artifact_path
+        self.compiled_trees = compiled_trees
+        self.slice_models = None
+        self.file_models = None
+        self.slice_features = None  # CompiledPreprocessor des tranches
+        self.file_features = None   # CompiledPreprocessor du résumé fichier
+        self.predictors = {}        # nom du modèle -> objet exposant predict(X)
+        self.outputs = {}           # cible (GROUP_MODELS) -> (nom du modèle, colonne ou None)
+        self.model_version = None   # version de l'artefact chargé (None : pickles)
+
+    def load_models(self):
+        """Charge les modèles : artefacts .dmodel s'ils sont à jour, sinon les pickles"""
+        if self.compiled_trees and self._artifacts_current():
+            if self.load_artifacts(self.slice_artifact_path, self.file_artifact_path):
+                return True
+            print("💡 Repli sur les pickles")
+        return self._load_pickles()
+
+    def _artifacts_current(self):
+        """Vrai si les deux artefacts existent et ont été exportés des pickles actuels
+
+        L'empreinte du pickle source est enregistrée à l'export : une copie,
+        un checkout ou une restauration qui change les dates n'est pas prise
+        pour une mise à jour, et un pickle réécrit est toujours détecté.
+        """
+        for artifact, pkl in ((self.slice_artifact_path, self.slice_models_path),
+                              (self.file_artifact_path, self.file_models_path)):
+            if not os.path.exists(artifact):
+                return False
+            if not os.path.exists(pkl):
+                continue
+            try:
+                source_sha256 = read_header(artifact).get('source_sha256')
+            except (OSError, ValueError) as e:
+                print(f"⚠️ '{artifact}' illisible ({str(e)}), artefact ignoré")
+                return False
+            if source_sha256 != file_sha256(pkl):
+                print(f"⚠️ '{artifact}' n'a pas été exporté depuis '{pkl}' actuel, artefact ignoré")
+                return False
+        return True
+
+    def _load_pickles(self):
+        """Charge les modèles pré-entraînés (pickles joblib)"""
+        try:
+            print("🔄 Chargement des modèles...")
+
+            slice_data = load_model_pickle(self.slice_models_path)
+            file_data = load_model_pickle(self.file_models_path)
+
+            print(f"Clés dans slice_data: {list(slice_data.keys())}")
+            print(f"Clés dans file_data: {list(file_data.keys())}")
+
+            slice_trees, slice_outputs = group_models(slice_data, 'slice')
+            file_trees, file_outputs = group_models(file_data, 'file')
+            self.slice_models = {**slice_trees, 'preprocessor': slice_data['preprocessor']}
+            self.file_models = {**file_trees, 'preprocessor': file_data['preprocessor']}
+            self.outputs = {**slice_outputs, **file_outputs}
+
+            self.slice_features = self._compile_preprocessor(self.slice_models['preprocessor'])
+            self.file_features = self._compile_preprocessor(self.file_models['preprocessor'])
+            self.predictors = self._build_predictors()
+            self.model_version = None
+
+            print("✅ Modèles chargés avec succès")
+            return True
+
+        except Exception as e:
+            print(f"❌ Erreur lors du chargement des modèles: {str(e)}")
+            print("💡 Les fichiers de modèles nécessitent peut-être d'être re-générés")
+            return False
+
+    def load_artifacts(self, slice_path, file_path):
+        """Charge les artefacts .dmodel (np.memmap, sans pickle ni classes __main__)"""
+        try:
+            print(f"🔄 Chargement des artefacts '{slice_path}' / '{file_path}'...")
+            slice_header, slice_features, slice_trees, slice_outputs = read_group_artifact(slice_path, 'slice')
+            file_header, file_features, file_trees, file_outputs = read_group_artifact(file_path, 'file')
+
+            self.slice_features, self.file_features = slice_features, file_features
+            self.slice_models = {**slice_trees, 'preprocessor': slice_features}
+            self.file_models = {**file_trees, 'preprocessor': file_features}
+            self.predictors = {**slice_trees, **file_trees}
+            self.outputs = {**slice_outputs, **file_outputs}
+            self.model_version = slice_header['version']
+            if file_header['version'] != slice_header['version']:
+                self.model_version = f"{slice_header['version']}/{file_header['version']}"
+            print(f"✅ Artefacts chargés (version {self.model_version})")
+            return True
+
+        except Exception as e:
+            print(f"❌ Erreur lors du chargement des artefacts: {str(e)}")
+            return False
+
+    def export_artifacts(self, slice_path, file_path, version=None):
+        """Écrit les modèles compilés au format .dmodel (exige des arbres compilés)"""
+        version = version or new_version()
+        write_group_artifact(slice_path, 'slice', self.slice_features, self.predictors, version,
+                             outputs=self.outputs)
+        write_group_artifact(file_path, 'file', self.file_features, self.predictors, version,
+                             outputs=self.outputs)
+        print(f"💾 Artefacts exportés: '{slice_path}', '{file_path}' (version {version})")
+        return version
+
+    def export_shared(self, directory):
+        """Exporte les artefacts dans directory, pour des workers qui les ouvrent en mmap
+
+        Les workers qui chargent ce répertoire avec load_shared() partagent les
+        mêmes pages mémoire (cache du système) au lieu d'une copie par processus.
+        """
+        os.makedirs(directory, exist_ok=True)
+        return self.export_artifacts(*shared_artifact_paths(directory))
+
+    def load_shared(self, directory):
+        return self.load_artifacts(*shared_artifact_paths(directory))
+
+    def _compile_preprocessor(self, preprocessor):
+        """Précompile le préprocesseur ; None (chemin sklearn) s'il n'est pas identique"""
+        try:
+            compiled = CompiledPreprocessor.from_audio_preprocessor(preprocessor)
+            if compiled.matches(preprocessor, compiled.probe_rows()):
+                return compiled
+            print("⚠️ Préprocesseur compilé différent de sklearn, chemin DataFrame conservé")
+        except Exception as e:
+            print(f"⚠️ Préprocesseur non compilable ({str(e)}), chemin DataFrame conservé")
+        return None
+
+    def _build_predictors(self):
+        """Sélectionne pour chaque modèle l'ensemble compilé (vérifié) ou le predict sklearn"""
+        predictors = {}
+        for group in (self.slice_models, self.file_models):
+            for name, model in group.items():
+                if name == 'preprocessor':
+                    continue
+                compiled = compile_verified(model) if self.compiled_trees else None
+                predictors[name] = compiled if compiled is not None else model
+        n_compiled = sum(1 for name, p in predictors.items() if p is not self._model(name))
+        print(f"🌲 Arbres compilés: {n_compiled}/{len(predictors)} modèles")
+        return predictors
+
+    def _model(self, name):
+        return self.slice_models[name] if name in self.slice_models else self.file_models[name]
+
+    def _predict(self, name, X):
+        return self.predictors.get(name, self._model(name)).predict(X)
+
+    def _predict_outputs(self, targets, X):
+        """Prédictions des cibles ; un modèle multi-sorties n'est évalué qu'une fois"""
+        evaluated = {}
+        results = []
+        for target in targets:
+            name, column = self.outputs[target]
+            if name not in evaluated:
+                evaluated[name] = self._predict(name, X)
+            results.append(evaluated[name] if column is None else evaluated[name][:, column])
+        return results
+
+    def multi_output_groups(self):
+        """Niveaux ('slice', 'file') servis par un seul ensemble multi-sorties"""
+        return [group for group, targets in GROUP_MODELS.items()
+                if targets[0] in self.outputs and self.outputs[targets[0]][1] is not None]
+
+    def _transform(self, compiled, preprocessor, rows, feature_order, values=None):
+        """Matrice de features : chemin précompilé, ou ColumnTransformer sklearn en repli"""
+        if compiled is not None:
+            return compiled.transform_rows(rows, values)
+        return preprocessor.transform(pd.DataFrame(rows)[feature_order])
+
+    def _group_loaded(self, group):
+        models = self.slice_models if group == 'slice' else self.file_models
+        return models is not None and all(
+            target in self.outputs and self.outputs[target][0] in models for target in GROUP_MODELS[group])
+
+    @property
+    def models_loaded(self):
+        return self._group_loaded('slice') and self._group_loaded('file')
+
+    def status(self):
+        """Statut des modèles chargés"""
+        slice_loaded = self._group_loaded('slice')
+        file_loaded = self._group_loaded('file')
+        return {
+            "slice_models_loaded": slice_loaded,
+            "file_models_loaded": file_loaded,
+            "models_available": slice_loaded and file_loaded,
+            "model_version": self.model_version,
+            "multi_output": self.multi_output_groups(),
+            "slice_models_keys": list(self.slice_models.keys()) if self.slice_models else [],
+            "file_models_keys": list(self.file_models.keys()) if self.file_models else []
+        }
+
+    def analyze(self, detail, summary):
+        """Analyse avancée avec modèles ML sur les données d'analyse audio complète"""
+        return self.analyze_batch([{"detail": detail, "summary": summary}])[0]
+
+    def _numeric_features(self, group):
+        """Colonnes numériques du niveau, dans l'ordre du préprocesseur compilé s'il existe"""
+        compiled = self.slice_features if group == 'slice' else self.file_features
+        if compiled is not None:
+            return compiled.numeric_features
+        return [f for f in GROUP_FEATURES[group] if f not in CATEGORICAL_FEATURES]
+
+    def _check_detail(self, detail):
+        """Message d'erreur si les tranches ne sont pas exploitables, sinon None"""
+        if not detail:
+            return "Aucune donnée de tranche fournie"
+        columns = set().union(*detail)
+        missing_features = [f for f in REQUIRED_SLICE_FEATURES if f not in columns]
+        if missing_features:
+            print(f"Features manquantes: {missing_features}")
+            return f"Features manquantes: {missing_features}"
+        return None
+
+    def analyze_batch(self, analyses):
+        """Analyse de N fichiers : toutes les tranches dans une matrice, chaque modèle appelé une fois
+
+        analyses : liste de {"detail": [...], "summary": {...}} ; retourne une
+        réponse par fichier, au format de analyze().
+        """
+        if not self.models_loaded:
+            return [{"error": "Modèles non chargés correctement", "percent": 0} for _ in analyses]
+
+        results = [None] * len(analyses)
+        try:
+            # Regroupement des tranches et des résumés valides ; les valeurs sont
+            # vérifiées fichier par fichier : un fichier invalide n'a que sa propre erreur
+            slice_rows, slice_values, spans = [], [], {}
+            file_rows, file_values, file_owners = [], [], []
+            file_predictions = {}
+            for i, analysis in enumerate(analyses):
+                detail = analysis.get("detail") or []
+                summary = analysis.get("summary") or {}
+                error = self._check_detail(detail)
+                if error:
+                    results[i] = {"error": error, "percent": 0}
+                    continue
+                try:
+                    slice_values.append(numeric_values(detail, self._numeric_features('slice')))
+                except ValueError as e:
+                    print(f"Erreur lors des prédictions sur les tranches: {str(e)}")
+                    results[i] = {"error": f"Erreur prédictions tranches: {str(e)}", "percent": 0}
+                    continue
+                spans[i] = (len(slice_rows), len(slice_rows) + len(detail))
+                slice_rows.extend(detail)
+                file_predictions[i] = {}
+                if all(k in summary for k in REQUIRED_FILE_FEATURES):
+                    try:
+                        file_values.append(numeric_values([summary], self._numeric_features('file')))
+                    except ValueError as e:
+                        print(f"Erreur lors des prédictions sur le fichier: {str(e)}")
+                        file_predictions[i] = {"error": f"Erreur prédictions fichier: {str(e)}"}
+                        continue
+                    file_rows.append(summary)
+                    file_owners.append(i)
+                else:
+                    missing_summary_keys = [k for k in REQUIRED_FILE_FEATURES if k not in summary]
+                    print(f"Données de résumé insuffisantes. Clés manquantes: {missing_summary_keys}")
+
+            if not spans:
+                return results
+
+            # Prédictions sur les tranches (une passe par modèle)
+            try:
+                danger, moy_danger = self.predict_slices(slice_rows, np.concatenate(slice_values))
+            except Exception as e:
+                print(f"Erreur lors des prédictions sur les tranches: {str(e)}")
+                if len(spans) > 1:
+                    return self._score_separately(analyses, spans, results)
+                for i in spans:
+                    results[i] = {"error": f"Erreur prédictions tranches: {str(e)}", "percent": 0}
+                return results
+
+            # Prédictions sur les fichiers (si données de résumé disponibles)
+            if file_rows:
+                try:
+                    X_file_processed = self._transform(self.file_features, self.file_models['preprocessor'],
+                                                       file_rows, REQUIRED_FILE_FEATURES,
+                                                       np.concatenate(file_values))
+                    danger_max, danger_moy, danger_std = self._predict_outputs(
+                        GROUP_MODELS['file'], X_file_processed)
+                    for k, i in enumerate(file_owners):
+                        file_predictions[i] = {
+                            'danger_max': float(danger_max[k]),
+                            'danger_moy': float(danger_moy[k]),
+                            'danger_std': float(danger_std[k])
+                        }
+                except Exception as e:
+                    print(f"Erreur lors des prédictions sur le fichier: {str(e)}")
+                    if len(file_owners) > 1:
+                        return self._score_separately(analyses, spans, results)
+                    for i in file_owners:
+                        file_predictions[i] = {"error": f"Erreur prédictions fichier: {str(e)}"}
+
+            for i, (start, end) in spans.items():
+                slice_predictions = {'Danger%': danger[start:end], 'moy_danger': moy_danger[start:end]}
+                results[i] = self._format_result(analyses[i]["detail"], slice_predictions, file_predictions[i])
+            return results
+
+        except Exception as e:
+            print(f"Erreur dans l'analyse avancée: {str(e)}")
+            return [r if r is not None else {"error": f"Erreur d'analyse: {str(e)}", "percent": 0} for r in results]
+
+    def _score_separately(self, analyses, indices, results):
+        """Repli quand la matrice commune échoue : chaque fichier est évalué seul"""
+        for i in indices:
+            results[i] = self.analyze_batch([analyses[i]])[0]
+        return results
+
+    def predict_slices(self, rows, values=None):
+        """(danger, moy_danger) des modèles tranches pour une liste de tranches"""
+        X_slice_processed = self._transform(self.slice_features, self.slice_models['preprocessor'],
+                                            rows, REQUIRED_SLICE_FEATURES, values)
+        danger, moy_danger = self._predict_outputs(GROUP_MODELS['slice'], X_slice_processed)
+        return danger, moy_danger
+
+    def _format_result(self, detail, slice_predictions, file_predictions):
+        """Réponse au format historique de /danger-alert-advanced"""
+        danger = slice_predictions['Danger%']
+        return {
+            "percent": int(np.mean(danger)),
+            "slice_predictions": {
+                "danger_percentages": [float(x) for x in danger],
+                "moy_danger": [float(x) for x in slice_predictions['moy_danger']],
+                "average_danger": float(np.mean(danger)),
+                "max_danger": float(np.max(danger)),
+                "min_danger": float(np.min(danger))
+            },
+            "file_predictions": file_predictions,
+            "analysis_summary": {
+                "nb_tranches": len(detail),
+                "nb_cris_detectes": sum(1 for d in detail if d.get('cri', False)),
+                "cri_types": list(set(d.get('cri_type', 'aucun') for d in detail if d.get('cri', False)))
+            }
+        }
+
+
+def load_model_pickle(path):
+    """joblib.load d'un pickle SliceModels/FileModels (classes attendues dans __main__)"""
+    import __main__
+    setattr(__main__, 'AudioPreprocessor', AudioPreprocessor)
+    setattr(__main__, 'ModelContainer', ModelContainer)
+    return joblib.load(path)
+
+def group_models(data, group):
+    """(nom -> modèle, cible -> (nom du modèle, colonne)) d'un pickle de niveau
+
+    Niveau classique : un modèle par cible de GROUP_MODELS (colonne None).
+    Niveau multi-sorties : un seul ensemble, chaque cible lit sa colonne.
+    """
+    if MULTI_OUTPUT_MODEL in data:
+        name = f"{group}_{MULTI_OUTPUT_MODEL}"
+        outputs = {target: (name, k) for k, target in enumerate(data['outputs'])}
+        models = {name: data[MULTI_OUTPUT_MODEL]}
+    else:
+        outputs = {target: (target, None) for target in GROUP_MODELS[group]}
+        models = {target: data[target] for target in GROUP_MODELS[group]}
+    missing = [target for target in GROUP_MODELS[group] if target not in outputs]
+    if missing:
+        raise KeyError(f"Cibles absentes du niveau '{group}': {missing}")
+    return models, outputs
+
+def shared_artifact_paths(directory):
+    return (os.path.join(directory, SLICE_ARTIFACT_PATH),
+            os.path.join(directory, FILE_ARTIFACT_PATH))
+
+def write_group_artifact(path, group, preprocessor, predictors, version=None, source=None, outputs=None,
+                         source_sha256=None):
+    """Écrit le préprocesseur et les arbres compilés d'un groupe ('slice' ou 'file')
+
+    outputs : cible -> (modèle, colonne) ; par défaut un modèle par cible.
+    source_sha256 : empreinte du pickle exporté (voir _artifacts_current).
+    """
+    if not isinstance(preprocessor, CompiledPreprocessor):
+        raise ValueError(f"Préprocesseur '{group}' non compilé, export impossible")
+    outputs = {target: tuple((outputs or {}).get(target, (target, None))) for target in GROUP_MODELS[group]}
+    pre_arrays, pre_meta = preprocessor.to_arrays()
+    arrays = {f"preprocessor.{key}": a for key, a in pre_arrays.items()}
+    models = {}
+    for name in dict.fromkeys(name for name, _ in outputs.values()):
+        compiled = predictors.get(name)
+        if not isinstance(compiled, CompiledTreeEnsemble):
+            raise ValueError(f"Modèle '{name}' non compilé, export impossible")
+        tree_arrays, models[name] = compiled.to_arrays()
+        arrays.update({f"{name}.{key}": a for key, a in tree_arrays.items()})
+    header = {
+        'kind': 'danger_models',
+        'group': group,
+        'feature_order': preprocessor.feature_order,
+        'preprocessor': pre_meta,
+        'models': models,
+        'outputs': {target: list(output) for target, output in outputs.items()},
+        'version': version or new_version(),
+        'source': source,
+        'source_sha256': source_sha256
+    }
+    return write_artifact(path, header, arrays)
+
+def read_group_artifact(path, group):
+    """(en-tête, CompiledPreprocessor, nom -> CompiledTreeEnsemble, cible -> (modèle, colonne)) depuis un .dmodel"""
+    header, arrays = read_artifact(path)
+    if header.get('kind') != 'danger_models' or header.get('group') != group:
+        raise ValueError(f"'{path}' ne contient pas les modèles '{group}'")
+    if header['feature_order'] != GROUP_FEATURES[group]:
+        raise ValueError(f"Features de '{path}' incompatibles: {header['feature_order']}")
+
+    def section(prefix):
+        return {name[len(prefix) + 1:]: a for name, a in arrays.items() if name.startswith(prefix + '.')}
+
+    preprocessor = CompiledPreprocessor.from_arrays(section('preprocessor'), header['preprocessor'])
+    trees = {name: CompiledTreeEnsemble.from_arrays(section(name), meta)
+             for name, meta in header['models'].items()}
+    # Artefacts antérieurs aux niveaux multi-sorties : un modèle par cible
+    outputs = {target: tuple(output) for target, output in
+               header.get('outputs', {t: (t, None) for t in GROUP_MODELS[group]}).items()}
+    return header, preprocessor, trees, outputs
+
+def export_pickle_artifacts(pkl_path, out_path, version=None):
+    """Convertit une sortie SliceModels.save / FileModels.save en artefact .dmodel
+
+    Préprocesseur et arbres sont compilés puis vérifiés contre sklearn ; l'export
+    échoue si l'un d'eux ne peut pas être reproduit à l'identique.
+    """
+    source_sha256 = file_sha256(pkl_path)  # avant lecture : un pickle réécrit entre-temps sera réexporté
+    return export_group_artifact(load_model_pickle(pkl_path), out_path, version,
+                                 source=os.path.basename(pkl_path), source_sha256=source_sha256)
+
+def export_group_artifact(data, out_path, version=None, source=None, source_sha256=None):
+    """Comme export_pickle_artifacts, depuis le dict déjà chargé (sortie de save)"""
+    targets = data['outputs'] if MULTI_OUTPUT_MODEL in data else list(data)
+    group = next(g for g, names in GROUP_MODELS.items() if names[0] in targets)
+    preprocessor = CompiledPreprocessor.from_audio_preprocessor(data['preprocessor'])
+    if not preprocessor.matches(data['preprocessor'], preprocessor.probe_rows()):
+        raise ValueError("Préprocesseur compilé différent de sklearn")
+    models, outputs = group_models(data, group)
+    predictors = {name: compile_verified(model) for name, model in models.items()}
+    return write_group_artifact(out_path, group, preprocessor, predictors, version,
+                                source=source, outputs=outputs, source_sha256=source_sha256)
+
+def publish_version(slice_data, file_data, registry_dir=MODEL_REGISTRY_DIR, version=None):
+    """Publie une nouvelle version dans le registre, de façon atomique
+
+    Les deux artefacts sont écrits dans <version>.tmp puis le répertoire est
+    renommé en <version> : un observateur du registre ne voit jamais une
+    version incomplète. Retourne le chemin de la version publiée.
+    """
+    version = version or new_version()
+    final_dir = os.path.join(registry_dir, version)
+    suffix = 0
+    while os.path.exists(final_dir):  # deux publications dans la même seconde
+        suffix += 1
+        final_dir = os.path.join(registry_dir, f"{version}.{suffix}")
+    version = os.path.basename(final_dir)
+    tmp_dir = final_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    slice_path, file_path = shared_artifact_paths(tmp_dir)
+    export_group_artifact(slice_data, slice_path, version, source='slice_models')
+    export_group_artifact(file_data, file_path, version, source='file_models')
+    os.replace(tmp_dir, final_dir)
+    print(f"📤 Version {version} publiée dans '{registry_dir}'")
+    return final_dir
+
+
+def get_engine():
+    """Moteur courant du processus (registre de modèles, rechargé à chaud)
+
+    À relire à chaque requête : après une nouvelle version publiée, l'appel
+    suivant rend le nouveau moteur.
+    """
+    from model_registry import get_registry  # model_registry importe ce module
+    return get_registry().engine
+
+def loaded_engine():
+    """Moteur courant s'il a déjà été créé, None sinon (ne charge rien : pour /status)"""
+    from model_registry import current_registry
+    registry = current_registry()
+    return registry.engine if registry is not None else None
+
+def score_analysis(analysis_result, ai_url=None):
+    """Score une analyse en mémoire ; repli HTTP si les modèles ne sont pas disponibles ici"""
+    engine = get_engine()
+    if engine.models_loaded:
+        return engine.analyze(analysis_result["detail"], analysis_result["summary"])
+
+    if ai_url is None:
+        return {"error": "Modèles non chargés correctement", "percent": 0}
+    try:
+        r = requests.post(f"{ai_url}/danger-alert-advanced", json=analysis_result)
+        if r.status_code == 200:
+            return r.json()
+        return {"error": f"Erreur API IA: {r.status_code}"}
+    except Exception as e:
+        return {"error": f"Erreur connexion IA: {str(e)}"}
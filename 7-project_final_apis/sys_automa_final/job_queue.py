@@ -0,0 +1,133 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+File de jobs d'enregistrement/analyse pour audio_api_system
+
+Un POST crée un job exécuté sur un pool dédié et rend immédiatement son
+identifiant ; le client interroge ensuite l'état du job (ou attend son
+résultat avec un délai). Le nombre de jobs en attente est borné : au-delà,
+la soumission est refusée (backpressure, HTTP 429 côté API).
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Trop de jobs en attente ou en cours"""
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"     # queued -> running -> done | error
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    def snapshot(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """Pool de workers dédié + file bornée de jobs (queued + running <= max_pending)"""
+
+    def __init__(self, max_workers=1, max_pending=8, keep_finished=100):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _active(self):
+        return sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+
+    def _prune(self):
+        """Oublie les plus anciens jobs terminés au-delà de keep_finished"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "error")]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def submit(self, kind, fn, *args):
+        """Planifie fn(*args) ; lève QueueFullError si la file est pleine"""
+        with self._lock:
+            if self._active() >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f"{self.max_pending} jobs déjà en attente")
+            self._prune()
+            job = Job(kind)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = fn(*args)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "error"
+        finally:
+            job.finished = time.time()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def position(self, job):
+        """Rang du job parmi ceux en attente (0 : en cours ou terminé)"""
+        queued = [j for j in list(self._jobs.values()) if j.status == "queued"]
+        return queued.index(job) + 1 if job in queued else 0
+
+    async def wait(self, job, timeout):
+        """Attend la fin du job (au plus timeout secondes, None : sans limite) sans bloquer la boucle"""
+        if (timeout is None or timeout > 0) and job.status in ("queued", "running"):
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def stats(self):
+        jobs = list(self._jobs.values())
+        counts = {status: sum(1 for j in jobs if j.status == status)
+                  for status in ("queued", "running", "done", "error")}
+        return {"max_workers": self.max_workers, "max_pending": self.max_pending,
+                "rejected": self.rejected, **counts}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,143 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Flux de danger en direct : une fenêtre analysée -> un événement poussé
+
+Un thread de capture (StreamingCapture) extrait les features de chaque
+fenêtre, les score avec le moteur d'inférence et diffuse le résultat à tous
+les abonnés (SSE, WebSocket). La capture démarre avec le premier abonné et
+s'arrête avec le dernier : plusieurs tableaux de bord partagent le même micro.
+Une capture en cours d'arrêt n'est plus réutilisée : un abonné qui arrive
+pendant l'arrêt en démarre une nouvelle, qui attend que le micro soit libéré
+(record.reserve_microphone, partagé avec les jobs d'enregistrement).
+"""
+import asyncio
+import threading
+import numpy as np
+from record import StreamingCapture, window_duration, sample_rate
+from analyze import AudioFeatureExtractor
+from spectral_engine import StreamingPCEN
+from inference_engine import get_engine
+
+SUBSCRIBER_QUEUE_SIZE = 16  # événements gardés pour un client lent (les plus anciens sont perdus)
+
+
+class LiveDangerStream:
+    """Capture continue -> features par fenêtre -> danger, diffusés aux abonnés"""
+
+    def __init__(self, source_factory=None, window_seconds=window_duration, hop_seconds=None):
+        self.source_factory = source_factory  # None : micro par défaut
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.extractor = AudioFeatureExtractor(sample_rate=sample_rate, window_size=window_seconds)
+        self._subscribers = {}   # asyncio.Queue -> boucle asyncio de l'abonné
+        self._lock = threading.Lock()
+        self._capture = None     # capture servant les abonnés (None : aucune, ou en cours d'arrêt)
+
+    @property
+    def running(self):
+        return self._capture is not None
+
+    def subscribe(self):
+        """Nouvelle file d'événements ; démarre la capture si c'est le premier abonné"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+            if self._capture is None:
+                source = self.source_factory() if self.source_factory else None
+                self._capture = StreamingCapture(source=source, window_seconds=self.window_seconds,
+                                                 hop_seconds=self.hop_seconds)
+                threading.Thread(target=self._run, args=(self._capture,), daemon=True).start()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+            if not self._subscribers and self._capture is not None:
+                self._capture.stop()
+                self._capture = None
+
+    def score_window(self, index, start, view, pcen_state=None):
+        """Features de la fenêtre + pourcentages de danger des modèles tranches"""
+        features = self.extractor.extract_batch_features(view[np.newaxis, :], pcen_state=pcen_state)[0]
+        event = {
+            "tranche_id": index,
+            "start_time": round(start / sample_rate, 3),
+            "features": features
+        }
+        engine = get_engine()
+        if not engine.models_loaded:
+            event["error"] = "Modèles non chargés correctement"
+            return event
+        danger, moy_danger = engine.predict_slices([features])
+        event["danger_percent"] = float(danger[0])
+        event["moy_danger"] = float(moy_danger[0])
+        return event
+
+    def _run(self, capture):
+        index = 0
+        # PCEN continu (pcen_mean_warm, hors modèle) seulement si les fenêtres se suivent sans recouvrement
+        contiguous = capture.hop_samples == capture.window_samples
+        pcen_state = StreamingPCEN(sample_rate=sample_rate) if contiguous else None
+        try:
+            capture.start()
+            for start, view in capture.windows():
+                index += 1
+                try:
+                    event = self.score_window(index, start, view, pcen_state)
+                except Exception as e:
+                    event = {"tranche_id": index, "error": f"Erreur d'analyse: {str(e)}"}
+                self._publish(capture, event)
+        except Exception as e:
+            self._publish(capture, {"error": f"Erreur de capture: {str(e)}"})
+        finally:
+            capture.stop()
+            if capture.ring.overruns:
+                print(f"⚠️ {capture.ring.overruns} fenêtre(s) écrasée(s) avant analyse")
+            self._publish(capture, None)  # fin du flux
+
+    def _publish(self, capture, event):
+        """Diffuse event si capture sert encore les abonnés (None : fin du flux, la capture est retirée)"""
+        with self._lock:
+            if self._capture is not capture:
+                return
+            if event is None:
+                self._capture = None
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:  # boucle de l'abonné déjà fermée
+                pass
+
+    @staticmethod
+    def _put(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    async def events(self):
+        """Générateur asynchrone des événements, jusqu'à la fin de la capture"""
+        queue = self.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.unsubscribe(queue)
@@ -3,6 +3,7 @@ import time
 import os
 import sys
 from analyze import AudioFeatureExtractor
+from inference_engine import score_analysis
 
 def start_analysis_cycle_advanced(base_url="http://localhost:8000", ai_url="http://localhost:8001"):
     """Cycle d'analyse avancé avec IA et modèles ML"""
@@ -47,37 +48,32 @@ def start_analysis_cycle_advanced(base_url="http://localhost:8000", ai_url="http
             print(f"✅ Analyse réussie: {len(analysis_result['detail'])} tranches analysées")
             all_analysis_data.append(analysis_result)
 
-            # 3. Envoi à l'IA pour détection de danger avancée
-            try:
-                r3 = requests.post(f"{ai_url}/danger-alert-advanced", json=analysis_result)
-                if r3.status_code == 200:
-                    ai_result = r3.json()
-                    print(f"🤖 IA Danger: {ai_result['percent']}%")
-                    
-                    # Afficher les détails des prédictions
-                    if "slice_predictions" in ai_result:
-                        slice_pred = ai_result["slice_predictions"]
-                        print(f"   - Danger moyen: {slice_pred['average_danger']:.1f}%")
-                        print(f"   - Danger max: {slice_pred['max_danger']:.1f}%")
-                        print(f"   - Danger min: {slice_pred['min_danger']:.1f}%")
-                    
-                    if "file_predictions" in ai_result:
-                        file_pred = ai_result["file_predictions"]
-                        if not isinstance(file_pred, dict) or "error" not in file_pred:
-                            print(f"   - Prédiction fichier: max={file_pred.get('danger_max', 'N/A'):.1f}%, moy={file_pred.get('danger_moy', 'N/A'):.1f}%")
-                    
-                    if "analysis_summary" in ai_result:
-                        summary = ai_result["analysis_summary"]
-                        print(f"   - Cris détectés: {summary.get('nb_cris_detectes', 0)}")
-                        if summary.get('cri_types') and summary['cri_types'] != ['aucun']:
-                            print(f"   - Types de cris: {', '.join(summary['cri_types'])}")
-                    
-                    danger_scores.append(ai_result["percent"])
-                else:
-                    print(f"❌ Erreur API IA: {r3.status_code}")
-                    
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Erreur de connexion à l'IA: {str(e)}")
+            # 3. Détection de danger avancée (moteur en mémoire, repli HTTP)
+            ai_result = score_analysis(analysis_result, ai_url=ai_url)
+            if "error" not in ai_result:
+                print(f"🤖 IA Danger: {ai_result['percent']}%")
+                
+                # Afficher les détails des prédictions
+                if "slice_predictions" in ai_result:
+                    slice_pred = ai_result["slice_predictions"]
+                    print(f"   - Danger moyen: {slice_pred['average_danger']:.1f}%")
+                    print(f"   - Danger max: {slice_pred['max_danger']:.1f}%")
+                    print(f"   - Danger min: {slice_pred['min_danger']:.1f}%")
+                
+                if "file_predictions" in ai_result:
+                    file_pred = ai_result["file_predictions"]
+                    if not isinstance(file_pred, dict) or "error" not in file_pred:
+                        print(f"   - Prédiction fichier: max={file_pred.get('danger_max', 'N/A'):.1f}%, moy={file_pred.get('danger_moy', 'N/A'):.1f}%")
+                
+                if "analysis_summary" in ai_result:
+                    summary = ai_result["analysis_summary"]
+                    print(f"   - Cris détectés: {summary.get('nb_cris_detectes', 0)}")
+                    if summary.get('cri_types') and summary['cri_types'] != ['aucun']:
+                        print(f"   - Types de cris: {', '.join(summary['cri_types'])}")
+                
+                danger_scores.append(ai_result["percent"])
+            else:
+                print(f"❌ Erreur IA: {ai_result['error']}")
                 # Fallback sur l'analyse simple
                 fallback_result = analyze_simple_fallback(audio_path)
                 if fallback_result:
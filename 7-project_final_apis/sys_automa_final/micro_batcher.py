@@ -0,0 +1,171 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Regroupement (micro-batching) des requêtes concurrentes vers les modèles
+
+Les requêtes arrivant dans une fenêtre de quelques millisecondes sont
+fusionnées en un seul appel vectorisé, puis chaque résultat est rendu à la
+requête qui l'attend.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class Histogram:
+    """Histogramme cumulatif simple (bornes supérieures, + débordement)"""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class MicroBatcher:
+    """Collecte les analyses pendant max_wait_ms (ou jusqu'à max_batch_rows tranches)
+
+    score_batch(liste d'analyses) -> liste de résultats est exécuté dans un
+    thread dédié, pour que la boucle asyncio continue de recevoir les requêtes
+    du lot suivant pendant le calcul.
+    """
+
+    def __init__(self, score_batch, max_wait_ms=5.0, max_batch_rows=64):
+        self.score_batch = score_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_rows = max_batch_rows
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_rows = Histogram(BATCH_SIZE_BUCKETS)
+        self.batch_requests = Histogram(BATCH_SIZE_BUCKETS)
+        self._queue = None
+        self._worker = None
+        self._pending = []   # lot en cours de calcul (résolu même si le worker est annulé)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batch")
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Démarre la tâche de regroupement (à appeler depuis la boucle asyncio)"""
+        if not self.running:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Arrête le regroupement ; les requêtes en attente reçoivent une erreur"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        stopped = RuntimeError("Micro-batching arrêté avant le traitement de la requête")
+        waiting = list(self._pending)
+        while self._queue is not None and not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        for _, future, _ in waiting:
+            if not future.done():
+                future.set_exception(stopped)
+        self._pending = []
+
+    async def submit(self, analysis):
+        """Ajoute une analyse au prochain lot et attend son résultat"""
+        if not self.running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((analysis, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Premier élément bloquant, puis tout ce qui arrive avant l'échéance"""
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0].get("detail") or [])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            rows += len(item[0].get("detail") or [])
+        return batch, rows
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, rows = await self._collect()
+            self._pending = batch
+            analyses = [analysis for analysis, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.score_batch, analyses)
+            except Exception as e:
+                print(f"⚠️ Échec du lot de {len(batch)} requête(s) ({str(e)}), évaluation séparée")
+                results = await loop.run_in_executor(self._executor, self._score_separately, analyses)
+
+            self.batch_rows.observe(rows)
+            self.batch_requests.observe(len(batch))
+            now = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                self.latency_ms.observe((now - submitted) * 1000.0)
+                if not future.done():
+                    future.set_result(result)
+            self._pending = []
+
+    def _score_separately(self, analyses):
+        """Repli après l'échec d'un lot : chaque requête est évaluée seule"""
+        results = []
+        for analysis in analyses:
+            try:
+                results.extend(self.score_batch([analysis]))
+            except Exception as e:
+                results.append({"error": f"Erreur d'analyse: {str(e)}", "percent": 0})
+        return results
+
+    def stats(self):
+        return {
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_rows": self.max_batch_rows,
+            "latency_ms": self.latency_ms.snapshot(),
+            "batch_rows": self.batch_rows.snapshot(),
+            "batch_requests": self.batch_requests.snapshot()
+        }
@@ -0,0 +1,135 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Format de modèle versionné, chargé par np.memmap (sans pickle)
+
+Disposition d'un fichier .dmodel :
+  - 8 octets  : signature ARTIFACT_MAGIC
+  - 4 octets  : longueur de l'en-tête (uint32 little-endian)
+  - en-tête   : JSON UTF-8 (version du schéma, ordre des features, métadonnées,
+                table des tableaux : dtype, forme, décalage)
+  - données   : tableaux bruts little-endian, alignés sur ALIGNMENT octets,
+                décalages relatifs au début de la zone de données
+
+Les tableaux lus sont des vues sur une seule projection mémoire du fichier :
+aucune copie, et plusieurs processus partagent les mêmes pages.
+"""
+import os
+import json
+import time
+import struct
+import hashlib
+import numpy as np
+
+ARTIFACT_MAGIC = b'DNGRMDL\x00'
+SCHEMA_VERSION = 2  # 2 : une seule table de feuilles par ensemble (leaf_value)
+ALIGNMENT = 64
+ARTIFACT_EXTENSION = '.dmodel'
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _little_endian(array):
+    array = np.ascontiguousarray(array)
+    if array.dtype.byteorder == '>' or (array.dtype.byteorder == '=' and not np.little_endian):
+        array = array.astype(array.dtype.newbyteorder('<'))
+    return array
+
+def new_version():
+    """Identifiant de version par défaut (horodatage, triable)"""
+    return time.strftime('%Y%m%d-%H%M%S')
+
+def file_sha256(path):
+    """Empreinte SHA-256 du contenu d'un fichier (pickle source d'un artefact)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_artifact(path, header, arrays):
+    """Écrit header (dict JSON) et arrays (nom -> ndarray) dans path
+
+    L'écriture passe par un fichier temporaire puis os.replace : un lecteur
+    ne voit jamais un fichier à moitié écrit.
+    """
+    arrays = {name: _little_endian(a) for name, a in arrays.items()}
+    table, offset = {}, 0
+    for name, array in arrays.items():
+        table[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = {**header, 'schema_version': SCHEMA_VERSION, 'arrays': table}
+    header.setdefault('version', new_version())
+    encoded = json.dumps(header).encode('utf-8')
+    prefix = ARTIFACT_MAGIC + struct.pack('<I', len(encoded)) + encoded
+    data_start = _align(len(prefix))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix)
+        f.write(b'\x00' * (data_start - len(prefix)))
+        for name, array in arrays.items():
+            f.seek(data_start + table[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_header(path):
+    """Lit seulement l'en-tête (vérifie signature et version du schéma)"""
+    with open(path, 'rb') as f:
+        magic = f.read(len(ARTIFACT_MAGIC))
+        if magic != ARTIFACT_MAGIC:
+            raise ValueError(f"'{path}' n'est pas un modèle {ARTIFACT_EXTENSION}")
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length).decode('utf-8'))
+    # Disposition des tableaux propre à chaque schéma : pas de lecture d'un autre schéma
+    if header.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(f"Schéma {header.get('schema_version')} non supporté (attendu {SCHEMA_VERSION}), "
+                         f"réexporter avec model_artifact.py")
+    header['data_start'] = _align(len(ARTIFACT_MAGIC) + 4 + length)
+    return header
+
+def read_artifact(path):
+    """(en-tête, nom -> tableau) ; les tableaux sont des vues np.memmap en lecture seule"""
+    header = read_header(path)
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        start = header['data_start'] + entry['offset']
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        arrays[name] = mapped[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+    return header, arrays
+
+
+if __name__ == "__main__":
+    # Conversion des pickles livrés : slice_models.pkl -> slice_models.dmodel, etc.
+    import sys
+    from inference_engine import export_pickle_artifacts
+
+    paths = sys.argv[1:] or ['slice_models.pkl', 'file_models.pkl']
+    for pkl_path in paths:
+        out_path = os.path.splitext(pkl_path)[0] + ARTIFACT_EXTENSION
+        t0 = time.perf_counter()
+        export_pickle_artifacts(pkl_path, out_path)
+        print(f"💾 {pkl_path} -> {out_path} ({(time.perf_counter() - t0) * 1e3:.0f} ms)")
@@ -0,0 +1,269 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Registre de modèles surveillé : rechargement à chaud sans redémarrage
+
+Les versions sont publiées par train_model_zeta.py (publish_version) dans
+<registre>/<version>/ ; un répertoire <version>.tmp est une publication en
+cours et n'est jamais lu. Un thread de fond relève périodiquement la version
+la plus récente, la charge dans un nouveau moteur, la valide sur un lot
+canari (dernières requêtes servies, ou CANARY_ANALYSIS) puis remplace la
+référence `engine` d'une seule affectation. Une requête en cours garde le
+moteur qu'elle a lu au départ : elle se termine sur l'ancienne version.
+
+Supprimer la dernière version la retire : le registre revient à la
+précédente au prochain relevé.
+
+get_registry() donne le registre du processus : danger_alert comme les
+services qui évaluent en mémoire (audio_api_system, live_stream,
+logic_controller_advanced, via inference_engine.get_engine) servent donc la
+même version. Au démarrage, des pickles plus récents que la dernière version
+publiée sont préférés (entraînement complet sans --publish) ; ils ne sont
+relus qu'au redémarrage, seul le registre est surveillé.
+"""
+import os
+import re
+import time
+import threading
+from collections import deque
+import numpy as np
+from inference_engine import DangerInferenceEngine, MODEL_REGISTRY_DIR, shared_artifact_paths
+
+MODEL_REGISTRY_POLL_SECONDS = float(os.environ.get("DANGER_MODEL_REGISTRY_POLL", 5))
+MODEL_REGISTRY_WATCH = os.environ.get("DANGER_MODEL_REGISTRY_WATCH", "1") != "0"
+CANARY_SIZE = 8  # requêtes récentes rejouées sur une nouvelle version
+MODEL_LOAD_RETRY_SECONDS = 10  # délai entre deux tentatives quand le chargement initial a échoué
+
+# Analyse de référence quand aucune requête n'a encore été servie
+CANARY_ANALYSIS = {
+    "detail": [
+        {'amplitude': 0.12, 'rms': 0.15, 'dB': -16.5, 'Peak': 0.9, 'Score': 15.0, 'env': 2,
+         'centroid_mean': 1800.0, 'bandwidth_mean': 1900.0, 'flatness_mean': 0.02,
+         'mfcc_mean': -20.0, 'pcen_mean': 0.4, 'zcr_mean': 0.08, 'cri': False, 'cri_type': 'aucun'},
+        {'amplitude': 0.35, 'rms': 0.42, 'dB': -7.5, 'Peak': 1.0, 'Score': 42.0, 'env': 2,
+         'centroid_mean': 2700.0, 'bandwidth_mean': 2300.0, 'flatness_mean': 0.05,
+         'mfcc_mean': -8.0, 'pcen_mean': 0.9, 'zcr_mean': 0.15, 'cri': True, 'cri_type': 'bebe'}
+    ],
+    "summary": {'nb_tranches': 2, 'nb_cris': 1, 'env_moy': 2.0, 'rms_moy': 0.285, 'peak_moy': 0.95,
+                'centroid_moy': 2250.0, 'bandwidth_moy': 2100.0, 'mfcc_moy': -14.0, 'pcen_moy': 0.65,
+                'cri_type_dom': 'bebe'}
+}
+
+
+def version_mtime(directory, version):
+    """Date de publication d'une version (artefacts écrits avant le renommage)"""
+    return max(os.path.getmtime(p) for p in shared_artifact_paths(os.path.join(directory, version)))
+
+def natural_key(name):
+    """Clé de tri naturel : '20260101-000000.10' après '20260101-000000.2', 'v10' après 'v2'"""
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part) for part in re.split(r'(\d+)', name)]
+
+def list_versions(directory=MODEL_REGISTRY_DIR):
+    """Versions complètes du registre, de la plus ancienne à la plus récente
+
+    Ordre de publication (date des artefacts), pas ordre des noms : un nom
+    choisi à la publication (version=) ne passe pas devant les versions
+    publiées après lui. À date égale, tri naturel des noms (suffixes .2, .10).
+    """
+    if not os.path.isdir(directory):
+        return []
+    versions = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith('.tmp') or not os.path.isdir(path):
+            continue
+        if all(os.path.exists(p) for p in shared_artifact_paths(path)):
+            versions.append(name)
+    return sorted(versions, key=lambda v: (version_mtime(directory, v), natural_key(v)))
+
+def pickles_mtime(engine):
+    """Date des pickles du moteur (None s'ils n'existent pas)"""
+    paths = [engine.slice_models_path, engine.file_models_path]
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    return max(os.path.getmtime(p) for p in paths)
+
+def validate(engine, analyses):
+    """Message d'erreur si le moteur échoue sur le lot canari, None sinon"""
+    if not engine.models_loaded:
+        return "modèles incomplets"
+    for result in engine.analyze_batch(analyses):
+        file_predictions = result.get("file_predictions", {})
+        if "error" in result or "error" in file_predictions:
+            return result.get("error", file_predictions.get("error"))
+        values = [result["percent"], *file_predictions.values()]
+        if not np.all(np.isfinite(np.asarray(values, dtype=float))):
+            return "prédiction non finie"
+    return None
+
+
+class ModelRegistry:
+    """Moteur courant + surveillance du registre (chargement, canari, échange)"""
+
+    def __init__(self, engine, directory=MODEL_REGISTRY_DIR, poll_seconds=MODEL_REGISTRY_POLL_SECONDS):
+        self.engine = engine       # lu une fois par requête ; remplacé d'un bloc
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.version = None        # version du registre servie (None : pickles ou cache mmap)
+        self.loaded_mtime = None   # date des pickles servis : seules les versions plus récentes les remplacent
+        self.swaps = 0
+        self.last_error = None
+        self._recent = deque(maxlen=CANARY_SIZE)
+        self._rejected = set()     # versions refusées, pas rechargées à chaque relevé
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load_attempt = None  # date de la dernière tentative de load_initial
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def record(self, analysis):
+        """Garde une requête servie pour le lot canari des prochaines versions"""
+        if analysis.get("detail"):
+            self._recent.append(analysis)
+
+    def canary_batch(self):
+        return list(self._recent) or [CANARY_ANALYSIS]
+
+    def load_version(self, version):
+        """Nouveau moteur chargé et validé pour version (None si refusé)"""
+        candidate = DangerInferenceEngine()
+        if not candidate.load_shared(os.path.join(self.directory, version)):
+            self.last_error = f"{version}: chargement impossible"
+            return None
+        error = validate(candidate, self.canary_batch())
+        if error:
+            self.last_error = f"{version}: canari en échec ({error})"
+            return None
+        return candidate
+
+    def check(self):
+        """Passe à la dernière version du registre si elle diffère ; vrai si échangé"""
+        with self._check_lock:
+            versions = [v for v in list_versions(self.directory) if v not in self._rejected]
+            if not versions or versions[-1] == self.version:
+                return False
+            version = versions[-1]
+            if self.version is None and self.loaded_mtime is not None and \
+                    version_mtime(self.directory, version) <= self.loaded_mtime:
+                return False
+            print(f"🔄 Nouvelle version de modèles détectée: {version}")
+            candidate = self.load_version(version)
+            if candidate is None:
+                print(f"❌ Version {self.last_error}, version {self.version or 'initiale'} conservée")
+                self._rejected.add(version)
+                return False
+            self.engine = candidate
+            self.version = version
+            self.loaded_mtime = None
+            self.swaps += 1
+            print(f"✅ Modèles version {version} en service")
+            return True
+
+    def _fresh_engine(self):
+        """Moteur vide, mêmes chemins et options que le moteur servi"""
+        engine = self.engine
+        return DangerInferenceEngine(engine.slice_models_path, engine.file_models_path,
+                                     compiled_trees=engine.compiled_trees,
+                                     slice_artifact_path=engine.slice_artifact_path,
+                                     file_artifact_path=engine.file_artifact_path)
+
+    def load_initial(self, cache_dir=None):
+        """Moteur de départ : dernière version publiée, sauf si les pickles sont plus récents
+
+        cache_dir : artefacts mmap exportés des pickles par start_system.py.
+        Comme pour une version du registre, les modèles sont chargés dans un
+        nouveau moteur puis échangés d'une affectation : une requête en cours
+        ne voit jamais un moteur à moitié chargé (nouvelle tentative comprise).
+        """
+        self._load_attempt = time.monotonic()
+        mtime = pickles_mtime(self.engine)
+        versions = [v for v in list_versions(self.directory) if v not in self._rejected]
+        if versions and (mtime is None or version_mtime(self.directory, versions[-1]) >= mtime):
+            if self.check():
+                return True
+        elif versions:
+            print(f"💡 Pickles plus récents que la version publiée {versions[-1]}, pickles chargés")
+        candidate = self._fresh_engine()
+        if not (cache_dir and candidate.load_shared(cache_dir)) and not candidate.load_models():
+            return False
+        with self._check_lock:
+            if self.version is None:  # pas de version du registre mise en service entre-temps
+                self.engine = candidate
+                self.loaded_mtime = mtime
+        return True
+
+    def retry_due(self):
+        """Vrai si aucun modèle n'est servi et que le délai depuis le dernier essai est écoulé"""
+        return not self.engine.models_loaded and \
+            time.monotonic() - self._load_attempt >= MODEL_LOAD_RETRY_SECONDS
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Erreur de surveillance du registre: {str(e)}")
+
+    def start(self):
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="model-registry")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {"directory": self.directory, "version": self.version, "running": self.running,
+                "source": "registre" if self.version else "pickles",
+                "versions": list_versions(self.directory), "swaps": self.swaps,
+                "rejected": sorted(self._rejected), "last_error": self.last_error}
+
+
+# Registre du processus (créé et chargé au premier appel)
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry(cache_dir=None, watch=MODEL_REGISTRY_WATCH):
+    """Registre partagé du processus ; le premier appel charge le moteur et lance la surveillance
+
+    Un chargement en échec (pickles absents ou illisibles) n'est pas définitif :
+    il est retenté au plus toutes les MODEL_LOAD_RETRY_SECONDS secondes.
+    """
+    global _registry
+    registry = _registry
+    if registry is not None and not registry.retry_due():
+        return registry  # cas courant : sans verrou
+    with _registry_lock:
+        if _registry is None:
+            registry = ModelRegistry(DangerInferenceEngine())
+            registry.load_initial(cache_dir)
+            if watch:
+                registry.start()
+            _registry = registry
+        elif _registry.retry_due():
+            print("🔄 Modèles non chargés, nouvelle tentative")
+            _registry.load_initial(cache_dir)
+        return _registry
+
+def current_registry():
+    """Registre du processus s'il existe déjà, sans déclencher de chargement"""
+    return _registry
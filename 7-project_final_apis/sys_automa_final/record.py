@@ -1,9 +1,17 @@
-import sounddevice as sd
 import numpy as np
 import scipy.io.wavfile as wav
+import soundfile as sf
 import os
 import time
-from analyze import analyze_audio_chunk
+import threading
+from analyze import analyze_audio_chunk, AudioFeatureExtractor
+from incremental_features import IncrementalFeatureState
+from spectral_engine import StreamingPCEN
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # pas de PortAudio (CI, serveur sans carte son)
+    sd = None
 
 sample_rate = 44100
 chunk_duration = 10  # sec
@@ -11,6 +19,24 @@ max_duration = 15   # sec
 chunk_dir = "audio_chunks"
 os.makedirs(chunk_dir, exist_ok=True)
 
+# Capture continue
+window_duration = 5     # sec, taille d'une fenêtre d'analyse
+update_interval = 0.5   # sec, pas de mise à jour du mode incrémental
+buffer_duration = 30    # sec, capacité du tampon circulaire
+block_size = 1024       # échantillons par callback
+
+# Micro : un seul utilisateur à la fois (enregistrement par chunks ou capture continue)
+MICROPHONE_WAIT = 30    # sec, attente maximale du micro tenu par un autre utilisateur
+_microphone = threading.Lock()
+
+def reserve_microphone(timeout=MICROPHONE_WAIT):
+    """Réserve le micro (rendu par release_microphone) ; RuntimeError s'il reste occupé"""
+    if not _microphone.acquire(timeout=timeout):
+        raise RuntimeError(f"Micro occupé depuis {timeout}s (flux en direct ou enregistrement en cours)")
+
+def release_microphone():
+    _microphone.release()
+
 def record_chunk(filename, duration=chunk_duration):
     print(f"Recording {duration}s to {filename}")
     audio = sd.rec(int(duration * sample_rate), samplerate=sample_rate, channels=1)
@@ -22,11 +48,282 @@ def start_recording():
     total_chunks = int(max_duration / chunk_duration)
     analysis_results = []
 
-    for i in range(total_chunks):
-        fname = os.path.join(chunk_dir, f"chunk_{i}.wav")
-        record_chunk(fname)
-        analysis = analyze_audio_chunk(fname)
-        analysis_results.append(analysis)
-        time.sleep(0.5)  # petite pause entre les chunks (optionnel)
+    # Micro réservé pour tout le cycle : le flux en direct attend la fin de l'enregistrement
+    reserve_microphone()
+    try:
+        for i in range(total_chunks):
+            fname = os.path.join(chunk_dir, f"chunk_{i}.wav")
+            record_chunk(fname)
+            analysis = analyze_audio_chunk(fname)
+            analysis_results.append(analysis)
+            time.sleep(0.5)  # petite pause entre les chunks (optionnel)
+    finally:
+        release_microphone()
+
+    return analysis_results
+
+
+class AudioRingBuffer:
+    """Tampon circulaire préalloué, un producteur (callback audio) / un consommateur
+
+    Chaque échantillon est écrit deux fois (position p et p + capacité) : toute
+    fenêtre de longueur <= capacité est donc contiguë et rendue comme une vue
+    NumPy sans copie. Le producteur publie l'index d'écriture après les données,
+    aucun verrou n'est nécessaire entre le callback et l'analyse.
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(2 * self.capacity, dtype=dtype)
+        self.write_index = 0  # nombre total d'échantillons écrits
+        self.overruns = 0     # fenêtres écrasées avant la fin de leur analyse
+
+    def write(self, block):
+        """Ajoute un bloc (appelé depuis le callback audio)"""
+        block = np.asarray(block, dtype=self._buffer.dtype).reshape(-1)
+        if len(block) > self.capacity:
+            self.write_index += len(block) - self.capacity
+            block = block[-self.capacity:]
+        n = len(block)
+        pos = self.write_index % self.capacity
+        end = pos + n
+        self._buffer[pos:end] = block
+        if end <= self.capacity:
+            self._buffer[pos + self.capacity:end + self.capacity] = block
+        else:
+            split = self.capacity - pos
+            self._buffer[pos + self.capacity:] = block[:split]
+            self._buffer[:end - self.capacity] = block[split:]
+        self.write_index += n
+
+    def available(self, start):
+        """Vrai si les échantillons à partir de start sont encore dans le tampon"""
+        return self.write_index - start <= self.capacity
+
+    def window(self, start, length):
+        """Vue sans copie sur [start, start + length), ou None si pas encore écrite / écrasée"""
+        if length > self.capacity or start + length > self.write_index or not self.available(start):
+            return None
+        pos = start % self.capacity
+        return self._buffer[pos:pos + length]
+
+    def release(self, start):
+        """À appeler après l'analyse d'une vue : vérifie qu'elle n'a pas été écrasée"""
+        if not self.available(start):
+            self.overruns += 1
+            return False
+        return True
+
+
+class MicrophoneSource:
+    """Source micro : sounddevice.InputStream avec callback vers le tampon"""
+
+    lossless = False  # le micro n'attend pas : un retard d'analyse devient un overrun
+
+    def __init__(self, samplerate=sample_rate, blocksize=block_size, device=None):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.device = device
+        self._stream = None
+        self._stop_lock = threading.Lock()
+
+    def start(self, on_block):
+        if sd is None:
+            raise RuntimeError("sounddevice/PortAudio indisponible, utiliser WavFileSource")
+
+        def callback(indata, frames, time_info, status):
+            if status:
+                print(f"⚠️ Statut audio: {status}")
+            on_block(indata[:, 0])
+
+        reserve_microphone()
+        try:
+            self._stream = sd.InputStream(samplerate=self.samplerate, channels=1, dtype='float32',
+                                          blocksize=self.blocksize, device=self.device, callback=callback)
+            self._stream.start()
+        except Exception:
+            self._stream = None
+            release_microphone()
+            raise
+
+    def stop(self):
+        # stop() peut être appelé deux fois en parallèle (dernier abonné, fin de capture)
+        with self._stop_lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.stop()
+                stream.close()
+            finally:
+                release_microphone()
+
+    @property
+    def finished(self):
+        return False
+
+
+class WavFileSource:
+    """Rejoue un fichier WAV par blocs comme s'il venait du micro (tests, CI)"""
+
+    def __init__(self, path, samplerate=sample_rate, blocksize=block_size, realtime=False, loop=False):
+        self.path = path
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.realtime = realtime
+        self.loop = loop
+        self.lossless = not realtime
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _run(self, on_block):
+        data, sr = sf.read(self.path, dtype='float32', always_2d=True)
+        data = np.mean(data, axis=1)
+        if sr != self.samplerate:
+            import librosa
+            data = librosa.resample(data, orig_sr=sr, target_sr=self.samplerate).astype(np.float32)
+        while not self._stop.is_set():
+            for i in range(0, len(data), self.blocksize):
+                if self._stop.is_set():
+                    return
+                on_block(data[i:i + self.blocksize])
+                if self.realtime:
+                    time.sleep(self.blocksize / self.samplerate)
+            if not self.loop:
+                return
+
+    def start(self, on_block):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_block,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    @property
+    def finished(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+
+class StreamingCapture:
+    """Capture continue sans trou : source -> tampon circulaire -> fenêtres d'analyse"""
+
+    def __init__(self, source=None, window_seconds=window_duration, hop_seconds=None,
+                 buffer_seconds=buffer_duration, samplerate=sample_rate):
+        self.source = source or MicrophoneSource(samplerate=samplerate)
+        self.samplerate = samplerate
+        self.window_samples = int(window_seconds * samplerate)
+        self.hop_samples = int((hop_seconds or window_seconds) * samplerate)
+        self.ring = AudioRingBuffer(max(int(buffer_seconds * samplerate), 2 * self.window_samples))
+        self._data_ready = threading.Event()
+        self._stopped = False
+        self.next_start = 0
+
+    def _on_block(self, block):
+        if self.source.lossless:
+            # Source rejouable : on attend l'analyse plutôt que d'écraser le tampon
+            while (self.ring.write_index + len(block) - self.next_start > self.ring.capacity
+                   and not self._stopped):
+                time.sleep(0.001)
+        self.ring.write(block)
+        self._data_ready.set()
+
+    def start(self):
+        self._stopped = False
+        self.next_start = self.ring.write_index
+        self.source.start(self._on_block)
+
+    def stop(self):
+        self._stopped = True
+        self.source.stop()
+
+    def windows(self, max_windows=None, timeout=None):
+        """Générateur de (index_debut, vue) pour chaque fenêtre complète
+
+        La vue pointe dans le tampon : elle doit être analysée avant de
+        demander la fenêtre suivante.
+        """
+        count = 0
+        while (max_windows is None or count < max_windows) and not self._stopped:
+            self._data_ready.clear()
+            view = self.ring.window(self.next_start, self.window_samples)
+            if view is None:
+                if not self.ring.available(self.next_start):
+                    # Analyse trop lente : on saute à la fenêtre la plus ancienne disponible
+                    self.ring.overruns += 1
+                    self.next_start = self.ring.write_index - self.window_samples
+                    continue
+                if self.source.finished:
+                    # Le dernier bloc a pu arriver entre la lecture du tampon et celle de finished
+                    if self.ring.window(self.next_start, self.window_samples) is None:
+                        return
+                    continue
+                if not self._data_ready.wait(timeout if timeout is not None else 1.0) and timeout is not None:
+                    return
+                continue
+            start = self.next_start
+            yield start, view
+            self.ring.release(start)
+            self.next_start += self.hop_samples
+            count += 1
+
+
+def start_streaming_analysis(source=None, max_windows=12, on_window=None):
+    """Capture continue + analyse de chaque fenêtre de 5s, sans écriture sur disque"""
+    extractor = AudioFeatureExtractor(sample_rate=sample_rate, window_size=window_duration)
+    capture = StreamingCapture(source=source)
+    pcen_state = StreamingPCEN(sample_rate=sample_rate)  # fenêtres consécutives : PCEN continu (pcen_mean_warm)
+    analysis_results = []
+
+    capture.start()
+    try:
+        for start, view in capture.windows(max_windows=max_windows):
+            features = extractor.extract_batch_features(view[np.newaxis, :], pcen_state=pcen_state)[0]
+            features['tranche_id'] = len(analysis_results) + 1
+            features['start_time'] = round(start / sample_rate, 3)
+            analysis_results.append(features)
+            if on_window is not None:
+                on_window(features)
+    finally:
+        capture.stop()
 
+    if capture.ring.overruns:
+        print(f"⚠️ {capture.ring.overruns} fenêtre(s) écrasée(s) avant analyse")
     return analysis_results
+
+
+def start_incremental_analysis(source=None, max_updates=None, on_update=None,
+                               update_seconds=update_interval, window_seconds=window_duration):
+    """Features de la fenêtre glissante de 5s publiées toutes les update_seconds
+
+    Chaque bloc reçu n'est traité qu'une fois (IncrementalFeatureState) : les
+    FFT et le mel d'une mise à jour ne portent que sur le bloc ; les features
+    sont celles d'extract_slice_features sur la fenêtre.
+    """
+    extractor = AudioFeatureExtractor(sample_rate=sample_rate, window_size=window_seconds)
+    state = IncrementalFeatureState(sample_rate=sample_rate, window_seconds=window_seconds,
+                                    engine=extractor.engine)
+    capture = StreamingCapture(source=source, window_seconds=update_seconds)
+    updates = []
+
+    capture.start()
+    try:
+        for start, view in capture.windows():
+            state.ingest(view)
+            if not state.window_ready:
+                continue
+            features = state.features()
+            features['tranche_id'] = len(updates) + 1
+            features['end_time'] = round((start + len(view)) / sample_rate, 3)
+            updates.append(features)
+            if on_update is not None:
+                on_update(features)
+            if max_updates is not None and len(updates) >= max_updates:
+                break
+    finally:
+        capture.stop()
+
+    if capture.ring.overruns:
+        print(f"⚠️ {capture.ring.overruns} bloc(s) écrasé(s) avant analyse")
+    return updates
@@ -0,0 +1,324 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import numpy as np
+import librosa
+import scipy.fft
+from scipy.signal import get_window
+from scipy.ndimage import gaussian_filter1d
+from cry_events import detect_cry_events, cry_type_from_centroid
+
+# Paramètres par défaut de librosa (identiques aux appels y=... historiques)
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+
+# Bande de fréquences des cris et paramètres du spectrogramme scipy d'origine
+CRI_FREQ_MIN = 1500
+CRI_FREQ_MAX = 6000
+CRI_NPERSEG_ORIGINE = 1024
+CRI_SIGMA_ORIGINE = 2
+
+
+class SpectralFrameEngine:
+    """Moteur spectral : une seule STFT par tranche, toutes les features en dérivent
+
+    Le spectre d'amplitude est calculé une fois ; centroid, bandwidth, flatness,
+    mel/PCEN, MFCC et ratio de cri (1.5-6 kHz) sont dérivés de ce même spectre.
+    Les tableaux peuvent avoir des dimensions de tête (plusieurs tranches).
+    """
+
+    def __init__(self, sample_rate=44100, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                 n_mels=N_MELS, n_mfcc=N_MFCC):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mfcc = n_mfcc
+
+        # Précalculs réutilisés pour chaque tranche
+        self.freqs = librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+        self.mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels)
+        self.cry_mask = (self.freqs >= CRI_FREQ_MIN) & (self.freqs <= CRI_FREQ_MAX)
+
+        # Mise à l'échelle "density" (comme scipy.signal.spectrogram) pour que
+        # l'epsilon du ratio de cri garde le même poids qu'avant
+        window = get_window('hann', n_fft)
+        self.density_scale = np.full(len(self.freqs), 2.0 / (sample_rate * np.sum(window ** 2)))
+        self.density_scale[0] /= 2
+        if n_fft % 2 == 0:
+            self.density_scale[-1] /= 2
+
+        # Lissage temporel équivalent à sigma=2 trames du spectrogramme d'origine
+        hop_origine = CRI_NPERSEG_ORIGINE - CRI_NPERSEG_ORIGINE // 8
+        self.cry_sigma = CRI_SIGMA_ORIGINE * hop_origine / hop_length
+        self.frame_duration = hop_length / sample_rate
+
+    def magnitude(self, y):
+        """Spectre d'amplitude |STFT| (unique transformée de la tranche)"""
+        return np.abs(librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    def mel(self, power):
+        """Spectrogramme mel à partir du spectre de puissance partagé"""
+        return np.einsum('...ft,mf->...mt', power, self.mel_basis, optimize=True)
+
+    def power_to_db(self, mel, amin=1e-10, top_db=80.0):
+        """power_to_db de librosa, avec le plafond top_db calculé par tranche"""
+        log_spec = 10.0 * np.log10(np.maximum(amin, mel))
+        plancher = np.max(log_spec, axis=(-2, -1), keepdims=True) - top_db
+        return np.maximum(log_spec, plancher)
+
+    def mfcc(self, mel):
+        """MFCC (DCT-II orthonormée du mel en dB)"""
+        return scipy.fft.dct(self.power_to_db(mel), axis=-2, type=2, norm='ortho')[..., :self.n_mfcc, :]
+
+    def pcen(self, mel, state=None, gain=1.0):
+        """PCEN sur le mel partagé ; state (StreamingPCEN) garde le lisseur entre fenêtres"""
+        if state is not None:
+            return state.process(mel, gain)
+        return librosa.pcen(mel, sr=self.sample_rate, hop_length=self.hop_length)
+
+    def band_energy(self, power):
+        """Densités moyennes (bande cri, totale) de chaque trame"""
+        density = power * self.density_scale[:, None]
+        return np.stack([np.mean(density[..., self.cry_mask, :], axis=-2), np.mean(density, axis=-2)])
+
+    def cry_ratio(self, power):
+        """Ratio d'énergie 1.5-6 kHz / énergie totale, lissé dans le temps"""
+        energy = self.band_energy(power)
+        return gaussian_filter1d(energy[0] / (energy[1] + 1e-6), sigma=self.cry_sigma, axis=-1)
+
+    def cry_events(self, cry_ratio, centroid_mean, offset=0.0):
+        """Événements de cri (CryEvent) d'une suite de trames, type d'après le centroïde moyen de la tranche"""
+        return detect_cry_events(cry_ratio, self.frame_duration, offset=offset,
+                                 cri_type=cry_type_from_centroid(centroid_mean))
+
+    def frame_features(self, y, S=None, pcen_state=None, gain=1.0):
+        """Features par trame (dernier axe = temps) à partir d'une seule STFT
+
+        'pcen' est toujours le PCEN à froid de la tranche, celui vu par les
+        modèles à l'entraînement ; avec pcen_state, le PCEN continu entre
+        fenêtres est ajouté à part sous 'pcen_warm'.
+        """
+        if S is None:
+            S = self.magnitude(y)
+        power = S ** 2
+        mel = self.mel(power)
+
+        frames = {
+            'centroid': librosa.feature.spectral_centroid(S=S, sr=self.sample_rate, freq=self.freqs)[..., 0, :],
+            'bandwidth': librosa.feature.spectral_bandwidth(S=S, sr=self.sample_rate, freq=self.freqs)[..., 0, :],
+            'flatness': librosa.feature.spectral_flatness(S=S)[..., 0, :],
+            'mfcc': np.mean(self.mfcc(mel), axis=-2),
+            'pcen': np.mean(self.pcen(mel), axis=-2),
+            'zcr': librosa.feature.zero_crossing_rate(y, frame_length=self.n_fft, hop_length=self.hop_length)[..., 0, :],
+            'cry_ratio': self.cry_ratio(power),
+        }
+        if pcen_state is not None:
+            frames['pcen_warm'] = np.mean(self.pcen(mel, pcen_state, gain), axis=-2)
+        return frames
+
+    def slice_features_batch(self, y, gain=None, pcen_state=None):
+        """Features spectrales moyennes de n tranches (y de forme (n, échantillons))
+
+        gain (n,) applique la normalisation de chaque tranche directement au
+        spectre (la STFT est linéaire), sans recopier le signal. pcen_state
+        (StreamingPCEN) enchaîne le PCEN avec l'appel précédent : chaque
+        ligne de y est alors un canal suivi d'un appel à l'autre, et la
+        moyenne continue est rendue sous 'pcen_warm_mean' ('pcen_mean' reste
+        à froid).
+        """
+        S = self.magnitude(y)
+        if gain is not None:
+            S *= np.asarray(gain)[:, None, None]
+        frames = self.frame_features(y, S=S, pcen_state=pcen_state, gain=1.0 if gain is None else gain)
+        n_frames = frames['cry_ratio'].shape[-1]
+        centroid_mean = np.mean(frames['centroid'], axis=-1)
+        cry_events = [self.cry_events(ratio, centroid) for ratio, centroid in
+                      zip(frames['cry_ratio'].reshape(-1, n_frames), centroid_mean.reshape(-1))]
+        return {
+            'centroid_mean': centroid_mean,
+            'bandwidth_mean': np.mean(frames['bandwidth'], axis=-1),
+            'flatness_mean': np.mean(frames['flatness'], axis=-1),
+            'mfcc_mean': np.mean(frames['mfcc'], axis=-1),
+            'pcen_mean': np.mean(frames['pcen'], axis=-1),
+            'zcr_mean': np.mean(frames['zcr'], axis=-1),
+            'cry_ratio_max': np.max(frames['cry_ratio'], axis=-1),
+            'cry_events': cry_events,
+            'pcen_warm_mean': np.mean(frames['pcen_warm'], axis=-1) if pcen_state is not None else None
+        }
+
+    def window_features(self, y, window_length, hop, gain, window_batch=32):
+        """Features spectrales moyennes de fenêtres glissantes (longueur et pas en échantillons)
+
+        Chaque fenêtre donne exactement les features d'une tranche isolée
+        normalisée par son propre gain (gain : un par fenêtre) ; pas = longueur
+        reproduit donc les tranches disjointes. Les trames intérieures d'une
+        fenêtre (sans padding) ne dépendent que de son début modulo hop_length :
+        une STFT par phase, partagée par toutes les fenêtres de cette phase (une
+        seule si le pas est un multiple de hop_length). Les trames de bord sont
+        recalculées sur les extrémités de chaque fenêtre ; mfcc (plancher
+        top_db), pcen (départ à froid) et ratio de cri (epsilon) sont repris par
+        fenêtre sur le mel et les énergies déjà calculés, sans nouvelle FFT.
+        Une fenêtre seule dans sa phase ne partage rien : elle passe par
+        slice_features_batch, par lots de window_batch fenêtres.
+        """
+        starts = np.arange(1 + (len(y) - window_length) // hop) * hop
+        gain = np.broadcast_to(np.asarray(gain, dtype=np.float64), starts.shape)
+        half = self.n_fft // 2
+        edge = -(-half // self.hop_length)                           # trames de bord à gauche
+        last = window_length // self.hop_length                      # dernière trame (centre <= longueur)
+        right = (window_length - half) // self.hop_length + 1        # première trame de bord à droite
+
+        features = {key: np.empty(len(starts)) for key in
+                    ('centroid_mean', 'bandwidth_mean', 'flatness_mean', 'mfcc_mean', 'pcen_mean',
+                     'zcr_mean', 'cry_ratio_max')}
+        features['cry_events'] = [None] * len(starts)
+        phases, counts = np.unique(starts % self.hop_length, return_counts=True)
+        alone = np.isin(starts % self.hop_length, phases[counts == 1])
+        if right <= edge:  # fenêtre trop courte pour avoir des trames intérieures
+            alone[:] = True
+        for phase in phases[counts > 1] if right > edge else []:
+            indices = np.flatnonzero(starts % self.hop_length == phase)
+            group = self._phase_frames(y, starts[indices], gain[indices], window_length, edge, right)
+            for i, offset in zip(indices, group['offsets']):
+                self._window_aggregate(features, i, y[starts[i]:starts[i] + window_length], gain[i],
+                                       group, offset, edge, right, last)
+
+        windows = np.lib.stride_tricks.sliding_window_view(y, window_length)
+        alone = np.flatnonzero(alone)
+        for batch in range(0, len(alone), window_batch):
+            indices = alone[batch:batch + window_batch]
+            spectral = self.slice_features_batch(windows[starts[indices]], gain[indices])
+            for key, values in features.items():
+                for i, value in zip(indices, spectral[key]):
+                    values[i] = value
+        return features
+
+    def _phase_frames(self, y, starts, gain, window_length, edge, right):
+        """Trames intérieures des fenêtres d'une même phase : une STFT sur leur étendue"""
+        origin = starts[0] + edge * self.hop_length - self.n_fft // 2
+        span = y[origin:starts[-1] + window_length]
+        S = np.abs(librosa.stft(span, n_fft=self.n_fft, hop_length=self.hop_length, center=False))
+        offsets = (starts - starts[0]) // self.hop_length   # première trame intérieure de chaque fenêtre
+        # flatness n'est pas invariante d'échelle (seuil amin) : gain de la dernière fenêtre couvrant la trame
+        frame_gain = np.ones(S.shape[-1])
+        for offset, g in zip(offsets, gain):
+            frame_gain[offset:offset + right - edge] = g
+        cumulative = lambda values: np.concatenate([[0.0], np.cumsum(values)])
+        return {
+            'offsets': offsets,
+            'centroid': cumulative(librosa.feature.spectral_centroid(S=S, sr=self.sample_rate, freq=self.freqs)[0]),
+            'bandwidth': cumulative(librosa.feature.spectral_bandwidth(S=S, sr=self.sample_rate, freq=self.freqs)[0]),
+            'flatness': cumulative(librosa.feature.spectral_flatness(S=S * frame_gain)[0]),
+            'zcr': cumulative(librosa.feature.zero_crossing_rate(span, frame_length=self.n_fft,
+                                                                 hop_length=self.hop_length, center=False)[0]),
+            'mel': self.mel(S ** 2),
+            'energy': self.band_energy(S ** 2),
+        }
+
+    def _window_aggregate(self, features, i, window, gain, group, offset, edge, right, last):
+        """Features de la fenêtre i : trames intérieures partagées + trames de bord propres"""
+        # Bords : même padding qu'une tranche isolée (début, et fin alignée sur la grille des trames)
+        tail_frame = max(0, right - edge - self.n_fft // self.hop_length)  # première trame de la fin
+        head = window[:edge * self.hop_length + self.n_fft] * gain
+        tail = window[tail_frame * self.hop_length:] * gain
+        S_head = self.magnitude(head)[:, :edge]
+        S_tail = self.magnitude(tail)[:, right - tail_frame:]
+        zcr_head = librosa.feature.zero_crossing_rate(head, frame_length=self.n_fft, hop_length=self.hop_length)[0, :edge]
+        zcr_tail = librosa.feature.zero_crossing_rate(tail, frame_length=self.n_fft,
+                                                      hop_length=self.hop_length)[0, right - tail_frame:]
+        S_edges = np.concatenate([S_head, S_tail], axis=1)
+        n_frames = last + 1
+        inner = slice(offset, offset + right - edge)
+
+        def mean(name, edge_values):
+            values = group[name]
+            return (values[inner.stop] - values[inner.start] + np.sum(edge_values)) / n_frames
+
+        centroid = mean('centroid', librosa.feature.spectral_centroid(S=S_edges, sr=self.sample_rate, freq=self.freqs)[0])
+        features['centroid_mean'][i] = centroid
+        features['bandwidth_mean'][i] = mean('bandwidth', librosa.feature.spectral_bandwidth(
+            S=S_edges, sr=self.sample_rate, freq=self.freqs)[0])
+        features['flatness_mean'][i] = mean('flatness', librosa.feature.spectral_flatness(S=S_edges)[0])
+        features['zcr_mean'][i] = mean('zcr', np.concatenate([zcr_head, zcr_tail]))
+
+        # Features de toute la fenêtre, au gain de la fenêtre
+        mel = np.concatenate([self.mel(S_head ** 2), group['mel'][:, inner] * gain ** 2,
+                              self.mel(S_tail ** 2)], axis=1)
+        energy = np.concatenate([self.band_energy(S_head ** 2), group['energy'][:, inner] * gain ** 2,
+                                 self.band_energy(S_tail ** 2)], axis=1)
+        cry_ratio = gaussian_filter1d(energy[0] / (energy[1] + 1e-6), sigma=self.cry_sigma)
+        features['mfcc_mean'][i] = np.mean(self.mfcc(mel))
+        features['pcen_mean'][i] = np.mean(self.pcen(mel))
+        features['cry_ratio_max'][i] = np.max(cry_ratio)
+        features['cry_events'][i] = self.cry_events(cry_ratio, centroid)
+
+    def slice_features(self, y):
+        """Features spectrales moyennes d'une tranche (clés attendues par danger_alert)"""
+        frames = self.frame_features(y)
+        centroid_mean = float(np.mean(frames['centroid']))
+        return {
+            'centroid_mean': centroid_mean,
+            'bandwidth_mean': float(np.mean(frames['bandwidth'])),
+            'flatness_mean': float(np.mean(frames['flatness'])),
+            'mfcc_mean': float(np.mean(frames['mfcc'])),
+            'pcen_mean': float(np.mean(frames['pcen'])),
+            'zcr_mean': float(np.mean(frames['zcr'])),
+            'cry_ratio_max': float(np.max(frames['cry_ratio'])),
+            'cry_events': self.cry_events(frames['cry_ratio'], centroid_mean)
+        }
+
+
+class StreamingPCEN:
+    """PCEN dont le lisseur IIR continue d'une fenêtre à l'autre
+
+    L'état final (zf de librosa.pcen) d'une fenêtre sert d'état initial (zi) à
+    la suivante : plus de redémarrage à froid à chaque tranche, et la moyenne
+    ne dépend plus de l'emplacement des coupures. Chaque dimension de tête
+    (canal) a son propre état. Le mel est celui, déjà calculé, du moteur
+    spectral. Les modèles sont entraînés sur le PCEN à froid de tranches
+    isolées : la valeur continue est une feature à part (pcen_mean_warm),
+    jamais substituée à pcen_mean.
+    """
+
+    def __init__(self, sample_rate=44100, hop_length=HOP_LENGTH):
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length
+        self.zi = None
+        self.gain = None
+
+    def reset(self):
+        self.zi = None
+        self.gain = None
+
+    def process(self, mel, gain=1.0):
+        """PCEN de mel (..., n_mels, t) ; gain : normalisation (scalaire ou par canal) déjà appliquée à mel"""
+        gain = np.asarray(gain, dtype=np.float64)
+        if gain.ndim:
+            gain = gain[..., None, None]
+        zi = None
+        if self.zi is not None and self.zi.shape[:-2] == mel.shape[:-2]:
+            # L'état est une énergie lissée : il suit le changement de normalisation
+            zi = self.zi * (gain / self.gain) ** 2
+        out, self.zi = librosa.pcen(mel, sr=self.sample_rate, hop_length=self.hop_length,
+                                    zi=zi, return_zf=True)
+        self.gain = gain
+        return out
+
+    def pcen_mean(self, mel, gain=1.0):
+        """Feature pcen_mean (moyenne sur mels et trames) de chaque canal"""
+        return np.mean(self.process(mel, gain), axis=(-2, -1))
@@ -3,12 +3,17 @@
 Script de lancement du système complet d'analyse audio avec IA
 """
 
+import argparse
 import subprocess
 import time
 import sys
 import requests
 import os
 
+# Mode production : modèles compilés exportés une fois, partagés en mmap par les workers
+MODEL_CACHE_DIR = "model_cache"
+DEFAULT_WORKERS = 4
+
 def check_port(port):
     """Vérifier si un port est utilisé"""
     try:
@@ -17,7 +22,21 @@ def check_port(port):
     except:
         return False
 
-def start_danger_alert_api():
+def export_model_cache(directory=MODEL_CACHE_DIR):
+    """Charger les pickles une seule fois et exporter les modèles compilés"""
+    from inference_engine import DangerInferenceEngine
+
+    engine = DangerInferenceEngine()
+    if not engine.load_models():
+        return False
+    try:
+        engine.export_shared(directory)
+        return True
+    except Exception as e:
+        print(f"⚠️ Export des modèles impossible ({e}), chaque worker chargera les pickles")
+        return False
+
+def start_danger_alert_api(prod=False, workers=DEFAULT_WORKERS):
     """Démarrer l'API danger_alert sur le port 8001"""
     print("🚀 Démarrage de l'API danger_alert (port 8001)...")
     
@@ -26,14 +45,24 @@ def start_danger_alert_api():
         print("⚠️ API danger_alert déjà en cours sur le port 8001")
         return None
     
-    # Démarrer l'API
-    process = subprocess.Popen([
+    command = [
         sys.executable, "-m", "uvicorn", 
         "danger_alert:app", 
         "--host", "0.0.0.0", 
-        "--port", "8001",
-        "--reload"
-    ], cwd=os.getcwd())
+        "--port", "8001"
+    ]
+    env = os.environ.copy()
+    # Pas de --reload : les nouvelles versions de modèles publiées dans le
+    # registre sont rechargées à chaud par l'API (model_registry.py)
+    if prod:
+        # Plusieurs processus ; les poids sont partagés via mmap
+        command += ["--workers", str(workers)]
+        if export_model_cache():
+            env["DANGER_MODEL_CACHE"] = os.path.abspath(MODEL_CACHE_DIR)
+        print(f"🏭 Mode production: {workers} workers")
+    
+    # Démarrer l'API
+    process = subprocess.Popen(command, cwd=os.getcwd(), env=env)
     
     # Attendre que l'API soit prête
     for _ in range(30):  # 30 secondes max
@@ -105,6 +134,13 @@ def test_system():
 
 def main():
     """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Lancement du système d'analyse audio")
+    parser.add_argument("--prod", action="store_true",
+                        help="API IA multi-workers sans --reload (modèles partagés en mmap)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Nombre de workers de l'API IA en mode production")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("🎵 SYSTÈME D'ANALYSE AUDIO AVEC IA - DÉMARRAGE")
     print("=" * 60)
@@ -113,7 +149,7 @@ def main():
     
     try:
         # 1. Démarrer l'API danger_alert
-        danger_process = start_danger_alert_api()
+        danger_process = start_danger_alert_api(prod=args.prod, workers=args.workers)
         if danger_process:
             processes.append(danger_process)
         
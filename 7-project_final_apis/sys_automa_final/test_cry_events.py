@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Tests du détecteur de cris par hystérésis (cry_events.py)"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from cry_events import (CryEvent, cry_segments, detect_cry_events, dominant_event,
+                        cry_type_from_centroid, SEUIL_CRI_HAUT)
+
+FRAME = 0.1  # secondes par trame dans ces tests
+
+
+def segments(ratio, **kwargs):
+    starts, ends = cry_segments(np.array(ratio, dtype=float), **kwargs)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def test_low_threshold_extends_an_event_started_above_high():
+    # seuil haut 0.3, seuil bas 0.15 : la plage au-dessus de 0.15 entoure le pic
+    assert segments([0.0, 0.2, 0.4, 0.2, 0.2, 0.0]) == [(1, 5)]
+
+
+def test_range_never_above_high_threshold_is_not_an_event():
+    assert segments([0.0, 0.2, 0.25, 0.2, 0.0]) == []
+
+
+def test_drop_below_low_threshold_splits_events():
+    assert segments([0.4, 0.4, 0.1, 0.4, 0.0, 0.2]) == [(0, 2), (3, 4)]
+
+
+def test_events_touching_the_edges():
+    assert segments([0.5, 0.5, 0.0, 0.0, 0.5]) == [(0, 2), (4, 5)]
+
+
+def test_explicit_low_threshold():
+    assert segments([0.0, 0.12, 0.4, 0.12, 0.0], seuil_bas=0.1) == [(1, 4)]
+    assert segments([0.0, 0.12, 0.4, 0.12, 0.0], seuil_bas=0.2) == [(2, 3)]
+
+
+def test_minimum_duration_filters_short_bursts():
+    ratio = [0.4, 0.4, 0.0, 0.4, 0.4, 0.4, 0.0]
+    assert segments(ratio, min_frames=3) == [(3, 6)]
+    events = detect_cry_events(np.array(ratio), FRAME, duree_min=0.3, cri_type="bebe")
+    assert events == [CryEvent(0.3, 0.3, "bebe")]
+
+
+def test_event_onsets_in_seconds_with_offset():
+    events = detect_cry_events(np.array([0.0, 0.0, 0.5, 0.5, 0.5, 0.0]), FRAME,
+                               duree_min=0.1, cri_type="adulte", offset=2.0)
+    assert events == [CryEvent(2.2, 0.3, "adulte")]
+
+
+def test_silence_has_no_event():
+    assert detect_cry_events(np.zeros(50), FRAME) == []
+    assert dominant_event([]) is None
+
+
+def test_dominant_event_is_the_longest():
+    events = [CryEvent(0.0, 0.4, "bebe"), CryEvent(1.0, 0.9, "bebe"), CryEvent(3.0, 0.5, "bebe")]
+    assert dominant_event(events).onset == 1.0
+
+
+def test_threshold_is_strictly_above():
+    assert segments([SEUIL_CRI_HAUT] * 3) == []
+
+
+@pytest.mark.parametrize("centroid, kind", [(3000, "bebe"), (2200, "enfant"), (1000, "adulte")])
+def test_cry_type_from_centroid(centroid, kind):
+    assert cry_type_from_centroid(centroid) == kind
+
+
+def test_slice_type_uses_slice_mean_centroid():
+    from spectral_engine import SpectralFrameEngine
+    engine = SpectralFrameEngine()
+    ratio = np.array([0.0] * 60 + [0.5] * 40 + [0.0] * 60)
+    # Centroïde élevé pendant l'événement, bas sur le reste de la tranche
+    centroid = np.where(ratio > 0, 3000.0, 500.0)
+    events = engine.cry_events(ratio, float(np.mean(centroid)))
+    assert [e.type for e in events] == ["adulte"]
+
+
+def test_extracted_slices_keep_slice_type_without_event_list():
+    from analyze import AudioFeatureExtractor
+    sr = 22050
+    t = np.arange(sr * 5) / sr
+    rng = np.random.default_rng(0)
+    tone = 0.5 * np.sin(2 * np.pi * 3000 * t) * ((t > 1.0) & (t < 2.5))
+    audio = tone + 0.05 * np.sin(2 * np.pi * 200 * t) + 0.001 * rng.standard_normal(len(t))
+    extractor = AudioFeatureExtractor(sample_rate=sr)
+    batched = extractor.extract_file_features(audio)[0]
+    single = extractor.extract_slice_features(audio)
+
+    for features in (batched, single):
+        assert 'cri_events' not in features
+        assert features['cri']
+        assert features['cri_type'] == cry_type_from_centroid(features['centroid_mean'])
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Tests de l'API IA : un gros lot ne bloque pas les requêtes concurrentes"""
+
+import os
+import sys
+import time
+import copy
+import asyncio
+import httpx
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import danger_alert
+from model_registry import CANARY_ANALYSIS
+
+BATCH_SECONDS = 1.0  # durée simulée du calcul d'un gros lot
+
+
+def slow_score_batch(analyses):
+    """Calcul bloquant (comme les arbres) proportionnel à la taille du lot"""
+    time.sleep(BATCH_SECONDS if len(analyses) > 1 else 0)
+    return [{"percent": 0} for _ in analyses]
+
+
+async def timed_post(client, url, payload, finished):
+    response = await client.post(url, json=payload)
+    finished[url] = time.perf_counter()
+    return response
+
+
+@pytest.mark.parametrize("micro_batching", [True, False], ids=["micro-batching", "direct"])
+def test_single_request_not_blocked_by_large_batch(monkeypatch, micro_batching):
+    monkeypatch.setattr(danger_alert, 'score_batch', slow_score_batch)
+    monkeypatch.setattr(danger_alert.batcher, 'score_batch', slow_score_batch)
+    monkeypatch.setattr(danger_alert, 'MICRO_BATCHING', micro_batching)
+    analysis = copy.deepcopy(CANARY_ANALYSIS)
+    batch = {"analyses": [analysis] * 500}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=danger_alert.app)
+        finished = {}
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            large = asyncio.create_task(timed_post(client, "/danger-alert-advanced/batch", batch, finished))
+            await asyncio.sleep(0.1)  # le lot est en cours de calcul
+            single = await asyncio.wait_for(
+                timed_post(client, "/danger-alert-advanced", analysis, finished), BATCH_SECONDS / 2)
+            assert single.status_code == 200
+            assert (await large).json()["nb_fichiers"] == 500
+        await danger_alert.batcher.stop()
+        assert finished["/danger-alert-advanced"] < finished["/danger-alert-advanced/batch"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Tests du cache de features : invalidation par FEATURE_VERSION, mémo d'empreintes borné"""
+
+import os
+import sys
+import threading
+import numpy as np
+import soundfile as sf
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import analyze
+import feature_cache
+from analyze import AudioFeatureExtractor
+from feature_cache import FeatureCache
+
+SR = 22050
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    monkeypatch.setattr(feature_cache, 'FEATURE_CACHE_ENABLED', True)
+    monkeypatch.setattr(feature_cache, '_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def wav(tmp_path):
+    t = np.arange(SR * 6) / SR
+    path = tmp_path / 'son.wav'
+    sf.write(path, 0.5 * np.sin(2 * np.pi * 440 * t), SR)
+    return str(path)
+
+
+def test_feature_version_change_invalidates_entries(cache, wav, monkeypatch):
+    extractor = AudioFeatureExtractor(sample_rate=SR)
+    calls = []
+    analyze_file = extractor.analyze_file
+    monkeypatch.setattr(extractor, 'analyze_file', lambda path: calls.append(path) or analyze_file(path))
+
+    first = extractor.process_audio_file(wav)
+    assert extractor.process_audio_file(wav) == first
+    assert len(calls) == 1 and cache.hits == 1
+
+    monkeypatch.setattr(analyze, 'FEATURE_VERSION', analyze.FEATURE_VERSION + 1)
+    extractor.process_audio_file(wav)
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 2
+
+
+def test_hash_memo_is_bounded(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_cache, 'HASH_MEMO_SIZE', 2)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"f{i}.bin"
+        path.write_bytes(bytes([i]) * 10)
+        paths.append(str(path))
+        cache.file_hash(str(path))
+    assert len(cache._hashes) == 2
+    # le plus ancien est sorti, les empreintes restent justes
+    assert all(key[0] != os.path.abspath(paths[0]) for key in cache._hashes)
+    assert cache.file_hash(paths[0]) == FeatureCache(str(tmp_path / 'autre')).file_hash(paths[0])
+
+
+def test_counters_are_exact_across_threads(cache):
+    cache.put('present', 1)
+    n_threads, n_calls = 8, 200
+
+    def worker():
+        for i in range(n_calls):
+            cache.get('present' if i % 2 else 'absent')
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.hits == cache.misses == n_threads * n_calls // 2
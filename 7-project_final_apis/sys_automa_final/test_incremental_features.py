@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Tests de l'état incrémental : mêmes features que l'extracteur hors ligne"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from analyze import AudioFeatureExtractor
+from incremental_features import IncrementalFeatureState
+
+SR = 22050
+WINDOW_SECONDS = 2
+
+
+@pytest.fixture(scope="module")
+def audio():
+    rng = np.random.default_rng(2)
+    t = np.arange(SR * 7) / SR
+    # bruit de fond, voix grave, puis un cri aigu plus fort au milieu
+    signal = 0.02 * rng.standard_normal(len(t)) + 0.2 * np.sin(2 * np.pi * 220 * t)
+    burst = (t > 3.2) & (t < 4.4)
+    signal[burst] += 0.8 * np.sin(2 * np.pi * 3200 * t[burst])
+    return signal
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return AudioFeatureExtractor(sample_rate=SR, window_size=WINDOW_SECONDS)
+
+
+def stream(audio, extractor, block):
+    """(features incrémentales, features hors ligne) à chaque bloc, fenêtre complète"""
+    state = IncrementalFeatureState(sample_rate=SR, window_seconds=WINDOW_SECONDS, engine=extractor.engine)
+    pairs = []
+    for start in range(0, len(audio), block):
+        state.ingest(audio[start:start + block])
+        if not state.window_ready:
+            assert state.features() is None
+            continue
+        end = state.n_steps * state.hop
+        offline = extractor.extract_slice_features(audio[end - state.window_steps * state.hop:end])
+        pairs.append((state.features(), offline))
+    return pairs
+
+
+@pytest.mark.parametrize("block", [SR // 2, 3001, 512])
+def test_matches_offline_slice_features(audio, extractor, block):
+    pairs = stream(audio, extractor, block)
+    assert len(pairs) > 3
+    assert any(offline['cri'] for _, offline in pairs)
+    for live, offline in pairs:
+        for key, value in offline.items():
+            if isinstance(value, (str, bool)):
+                assert live[key] == value, key
+            elif key == 'flatness_mean':  # trames intérieures au gain courant (seuil amin)
+                assert live[key] == pytest.approx(value, rel=1e-2), key
+            else:
+                assert live[key] == pytest.approx(value, rel=1e-6, abs=1e-9), key
+
+
+def test_block_size_does_not_change_features(audio, extractor):
+    whole = IncrementalFeatureState(sample_rate=SR, window_seconds=WINDOW_SECONDS, engine=extractor.engine)
+    whole.ingest(audio)
+    pieces = IncrementalFeatureState(sample_rate=SR, window_seconds=WINDOW_SECONDS, engine=extractor.engine)
+    for start in range(0, len(audio), 777):
+        pieces.ingest(audio[start:start + 777])
+    expected = whole.features()
+    # pcen_mean_warm et flatness suivent le gain courant au moment de chaque bloc
+    for key, value in pieces.features().items():
+        if key == 'pcen_mean_warm':
+            continue
+        rel = 1e-2 if key == 'flatness_mean' else 1e-9
+        assert value == pytest.approx(expected[key], rel=rel, abs=1e-12), key
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Tests du moteur d'inférence : isolation des fichiers invalides dans un lot"""
+
+import os
+import sys
+import copy
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from inference_engine import DangerInferenceEngine
+from model_registry import CANARY_ANALYSIS
+
+
+@pytest.fixture(scope="module", params=[True, False], ids=["compile", "sklearn"])
+def engine(request):
+    engine = DangerInferenceEngine(os.path.join(HERE, 'slice_models.pkl'),
+                                   os.path.join(HERE, 'file_models.pkl'),
+                                   compiled_trees=request.param)
+    if not engine._load_pickles():
+        pytest.skip("Modèles pickles indisponibles")
+    return engine
+
+
+def analysis_with(field, value, level="detail"):
+    analysis = copy.deepcopy(CANARY_ANALYSIS)
+    target = analysis["detail"][0] if level == "detail" else analysis["summary"]
+    if value is KeyError:
+        del target[field]
+    else:
+        target[field] = value
+    return analysis
+
+
+@pytest.mark.parametrize("value, message", [
+    ("abc", "could not convert string to float: 'abc'"),
+    (None, "Input X contains NaN."),
+    (KeyError, "Input X contains NaN."),
+    (float("inf"), "Input X contains infinity"),
+])
+def test_invalid_slice_fails_only_its_file(engine, value, message):
+    valid = copy.deepcopy(CANARY_ANALYSIS)
+    expected = engine.analyze(valid["detail"], valid["summary"])
+    results = engine.analyze_batch([valid, analysis_with("rms", value), valid])
+
+    assert results[0] == expected
+    assert results[2] == expected
+    assert results[1]["percent"] == 0
+    assert results[1]["error"].startswith("Erreur prédictions tranches: " + message)
+
+
+def test_invalid_slice_same_error_as_single_request(engine):
+    bad = analysis_with("rms", "abc")
+    single = engine.analyze(bad["detail"], bad["summary"])
+    batched = engine.analyze_batch([CANARY_ANALYSIS, bad])[1]
+    assert batched == single
+
+
+def test_invalid_summary_fails_only_its_file_predictions(engine):
+    valid = copy.deepcopy(CANARY_ANALYSIS)
+    expected = engine.analyze(valid["detail"], valid["summary"])
+    results = engine.analyze_batch([valid, analysis_with("rms_moy", None, level="summary"), valid])
+
+    assert results[0] == expected
+    assert results[2] == expected
+    assert results[1]["slice_predictions"] == expected["slice_predictions"]
+    assert results[1]["file_predictions"] == {"error": "Erreur prédictions fichier: Input X contains NaN."}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Tests du flux de danger en direct : abonnés qui arrivent pendant l'arrêt d'une capture"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from live_stream import LiveDangerStream
+
+
+class SlowStopSource:
+    """Source continue (blocs de zéros) dont l'arrêt prend du temps, comme un micro"""
+
+    lossless = True
+    finished = False
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self, on_block):
+        while not self._stop.is_set():
+            on_block(np.zeros(1024, dtype=np.float32))
+            time.sleep(0.005)
+
+    def start(self, on_block):
+        self._thread = threading.Thread(target=self._run, args=(on_block,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        time.sleep(0.2)
+        self._thread.join()
+
+
+def test_subscriber_during_stop_gets_a_new_capture(monkeypatch):
+    stream = LiveDangerStream(source_factory=SlowStopSource, window_seconds=0.1)
+    monkeypatch.setattr(stream, 'score_window', lambda index, start, view, pcen_state=None: {"tranche_id": index})
+
+    async def scenario():
+        first = stream.subscribe()
+        assert (await asyncio.wait_for(first.get(), 5))["tranche_id"] == 1
+        stream.unsubscribe(first)
+        second = stream.subscribe()
+        # nouvelle capture : ni la fin de l'ancienne ni ses dernières fenêtres
+        event = await asyncio.wait_for(second.get(), 5)
+        assert event is not None and event["tranche_id"] == 1
+        stream.unsubscribe(second)
+
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Tests du format .dmodel : aller-retour, ordre des features, artefact à jour des pickles"""
+
+import os
+import sys
+import copy
+import shutil
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import inference_engine
+from inference_engine import DangerInferenceEngine, export_pickle_artifacts, read_group_artifact
+import model_artifact
+from model_artifact import read_artifact, write_artifact
+from model_registry import CANARY_ANALYSIS
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    for name in ('slice_models.pkl', 'file_models.pkl'):
+        if not os.path.exists(os.path.join(HERE, name)):
+            pytest.skip("Modèles pickles indisponibles")
+        shutil.copy(os.path.join(HERE, name), tmp_path / name)
+        export_pickle_artifacts(str(tmp_path / name), str(tmp_path / name.replace('.pkl', '.dmodel')))
+    return tmp_path
+
+
+def make_engine(workdir):
+    return DangerInferenceEngine(str(workdir / 'slice_models.pkl'), str(workdir / 'file_models.pkl'),
+                                 slice_artifact_path=str(workdir / 'slice_models.dmodel'),
+                                 file_artifact_path=str(workdir / 'file_models.dmodel'))
+
+
+def test_artifacts_predict_like_pickles(workdir):
+    from_artifacts = make_engine(workdir)
+    assert from_artifacts.load_models()
+    assert from_artifacts.model_version is not None
+    from_pickles = make_engine(workdir)
+    assert from_pickles._load_pickles()
+    analysis = copy.deepcopy(CANARY_ANALYSIS)
+    assert from_artifacts.analyze(analysis["detail"], analysis["summary"]) == \
+        from_pickles.analyze(analysis["detail"], analysis["summary"])
+
+
+def test_one_leaf_table_per_ensemble(workdir):
+    header, arrays = read_artifact(str(workdir / 'slice_models.dmodel'))
+    for name in header['models']:
+        assert f"{name}.leaf_value" in arrays
+        assert f"{name}.value" not in arrays
+
+
+def test_feature_order_must_match_exactly(workdir, monkeypatch):
+    permuted = dict(inference_engine.GROUP_FEATURES)
+    permuted['slice'] = permuted['slice'][1::-1] + permuted['slice'][2:]
+    monkeypatch.setattr(inference_engine, 'GROUP_FEATURES', permuted)
+    with pytest.raises(ValueError, match="incompatibles"):
+        read_group_artifact(str(workdir / 'slice_models.dmodel'), 'slice')
+
+
+def test_artifact_currency_follows_pickle_content(workdir):
+    engine = make_engine(workdir)
+    # une date plus récente (copie, checkout) ne périme pas l'artefact
+    os.utime(workdir / 'slice_models.pkl')
+    os.utime(workdir / 'slice_models.dmodel', (0, 0))
+    assert engine._artifacts_current()
+    # un pickle au contenu différent, même daté d'avant l'artefact, le périme
+    with open(workdir / 'slice_models.pkl', 'ab') as f:
+        f.write(b'\0')
+    os.utime(workdir / 'slice_models.pkl', (0, 0))
+    assert not engine._artifacts_current()
+
+
+def test_older_schema_is_rejected(workdir, monkeypatch):
+    # schéma 1 : tableaux value + leaf_value
+    path = str(workdir / 'ancien.dmodel')
+    monkeypatch.setattr(model_artifact, 'SCHEMA_VERSION', 1)
+    write_artifact(path, {'kind': 'danger_models', 'group': 'slice'}, {'m.value': np.zeros((2, 1))})
+    monkeypatch.undo()
+    with pytest.raises(ValueError, match="Schéma 1 non supporté"):
+        read_group_artifact(path, 'slice')
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Tests du registre de modèles : pickles contre versions publiées, moteur partagé"""
+
+import os
+import sys
+import time
+import shutil
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import model_registry
+import inference_engine
+from inference_engine import DangerInferenceEngine, publish_version, load_model_pickle
+from model_registry import ModelRegistry
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    for name in ('slice_models.pkl', 'file_models.pkl'):
+        if not os.path.exists(os.path.join(HERE, name)):
+            pytest.skip("Modèles pickles indisponibles")
+        shutil.copy(os.path.join(HERE, name), tmp_path / name)
+    return tmp_path
+
+
+def make_registry(workdir):
+    engine = DangerInferenceEngine(str(workdir / 'slice_models.pkl'), str(workdir / 'file_models.pkl'),
+                                   compiled_trees=False)
+    return ModelRegistry(engine, directory=str(workdir / 'registry'), poll_seconds=60)
+
+
+def publish(workdir, version):
+    slice_data = load_model_pickle(str(workdir / 'slice_models.pkl'))
+    file_data = load_model_pickle(str(workdir / 'file_models.pkl'))
+    return publish_version(slice_data, file_data, str(workdir / 'registry'), version)
+
+
+def touch_pickles(workdir, when):
+    for name in ('slice_models.pkl', 'file_models.pkl'):
+        os.utime(workdir / name, (when, when))
+
+
+def test_published_version_newer_than_pickles_is_served(workdir):
+    touch_pickles(workdir, time.time() - 3600)
+    publish(workdir, '20260101-000000')
+    registry = make_registry(workdir)
+    assert registry.load_initial()
+    assert registry.version == '20260101-000000'
+
+
+def test_newer_pickles_win_over_old_version(workdir):
+    publish(workdir, '20260101-000000')
+    touch_pickles(workdir, time.time() + 3600)  # entraînement complet sans --publish
+    registry = make_registry(workdir)
+    assert registry.load_initial()
+    assert registry.version is None
+    assert registry.status()["source"] == "pickles"
+    # la version plus ancienne que les pickles n'est pas reprise au relevé suivant
+    assert not registry.check()
+
+
+def test_version_published_after_pickles_replaces_them(workdir):
+    touch_pickles(workdir, time.time() - 3600)
+    registry = make_registry(workdir)
+    assert registry.load_initial()
+    assert registry.version is None
+    publish(workdir, '20260101-000000')
+    assert registry.check()
+    assert registry.version == '20260101-000000'
+
+
+def test_get_engine_follows_the_process_registry(workdir, monkeypatch):
+    registry = make_registry(workdir)
+    registry.load_initial()
+    monkeypatch.setattr(model_registry, '_registry', registry)
+    first = inference_engine.get_engine()
+    assert first is registry.engine
+    publish(workdir, '20990101-000000')
+    assert registry.check()
+    assert inference_engine.get_engine() is registry.engine
+    assert inference_engine.get_engine() is not first
+
+
+def test_failed_load_is_retried(workdir, monkeypatch):
+    monkeypatch.setattr(model_registry, 'MODEL_LOAD_RETRY_SECONDS', 0)
+    os.rename(workdir / 'file_models.pkl', workdir / 'file_models.bak')
+    registry = make_registry(workdir)
+    registry.load_initial()
+    monkeypatch.setattr(model_registry, '_registry', registry)
+    assert inference_engine.loaded_engine() is registry.engine
+    assert not inference_engine.get_engine().models_loaded
+
+    os.rename(workdir / 'file_models.bak', workdir / 'file_models.pkl')
+    failed = registry.engine
+    assert inference_engine.get_engine().models_loaded
+    # nouveau moteur échangé d'un bloc : celui servi pendant le chargement n'est pas modifié
+    assert registry.engine is not failed
+    assert failed.slice_models is None and not failed.models_loaded
+
+
+def test_loaded_registry_is_returned_without_lock(workdir, monkeypatch):
+    registry = make_registry(workdir)
+    assert registry.load_initial()
+
+    class Held:
+        def __enter__(self):
+            raise AssertionError("verrou pris alors que les modèles sont chargés")
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(model_registry, '_registry', registry)
+    monkeypatch.setattr(model_registry, '_registry_lock', Held())
+    assert model_registry.get_registry() is registry
+
+
+def test_loaded_engine_does_not_load(monkeypatch):
+    monkeypatch.setattr(model_registry, '_registry', None)
+    assert inference_engine.loaded_engine() is None
+    assert model_registry.current_registry() is None
+
+
+def test_versions_ordered_by_publication(workdir):
+    directory = str(workdir / 'registry')
+    for i, version in enumerate(['v10', '20260101-000000', '20260101-000000.2', '20260101-000000.10']):
+        path = publish(workdir, version)
+        for artifact in os.listdir(path):
+            os.utime(os.path.join(path, artifact), (1000 + i, 1000 + i))
+    assert model_registry.list_versions(directory) == \
+        ['v10', '20260101-000000', '20260101-000000.2', '20260101-000000.10']
+    # même date : tri naturel des suffixes
+    for version in ('20260101-000000.2', '20260101-000000.10'):
+        path = os.path.join(directory, version)
+        for artifact in os.listdir(path):
+            os.utime(os.path.join(path, artifact), (2000, 2000))
+    assert model_registry.list_versions(directory)[-2:] == ['20260101-000000.2', '20260101-000000.10']
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Tests de la capture continue : fenêtres rendues jusqu'à la fin de la source, micro partagé"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from record import StreamingCapture, reserve_microphone, release_microphone
+
+SR = 1000
+
+
+class LateBlockSource:
+    """Source dont le dernier bloc arrive pendant la lecture de finished
+
+    Reproduit la course : le consommateur voit le tampon incomplet, puis la
+    source écrit son dernier bloc et se déclare terminée.
+    """
+
+    lossless = True
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self._on_block = None
+        self._done = False
+
+    def start(self, on_block):
+        self._on_block = on_block
+        for block in self.blocks[:-1]:
+            on_block(block)
+
+    def stop(self):
+        pass
+
+    @property
+    def finished(self):
+        if not self._done:
+            self._on_block(self.blocks[-1])
+            self._done = True
+        return True
+
+
+def test_last_window_after_finished_is_not_dropped():
+    audio = np.arange(3 * SR, dtype=np.float32)
+    source = LateBlockSource(np.split(audio, 6))
+    capture = StreamingCapture(source=source, window_seconds=1, buffer_seconds=4, samplerate=SR)
+    capture.start()
+    windows = [(start, view.copy()) for start, view in capture.windows(timeout=0.1)]
+
+    assert [start for start, _ in windows] == [0, SR, 2 * SR]
+    np.testing.assert_array_equal(windows[-1][1], audio[2 * SR:])
+
+
+def test_microphone_is_reserved_by_one_user_at_a_time():
+    reserve_microphone()
+    try:
+        with pytest.raises(RuntimeError, match="Micro occupé"):
+            reserve_microphone(timeout=0.05)
+    finally:
+        release_microphone()
+    reserve_microphone(timeout=0.05)
+    release_microphone()
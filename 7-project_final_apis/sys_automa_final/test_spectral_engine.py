@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Tests du moteur spectral : features de tranches, fenêtres, PCEN continu"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from analyze import AudioFeatureExtractor
+from spectral_engine import StreamingPCEN
+
+SR = 22050
+
+
+@pytest.fixture(scope="module")
+def audio():
+    rng = np.random.default_rng(1)
+    t = np.arange(SR * 15) / SR
+    envelope = 0.2 + 0.8 * (np.sin(2 * np.pi * 0.3 * t) > 0)
+    return (envelope * np.sin(2 * np.pi * 900 * t) + 0.05 * rng.standard_normal(len(t))) * 0.5
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return AudioFeatureExtractor(sample_rate=SR)
+
+
+def test_warm_pcen_is_separate_from_model_feature(audio, extractor):
+    state = StreamingPCEN(sample_rate=SR)
+    for window in extractor.slice_view(audio):
+        warm = extractor.extract_batch_features(window[np.newaxis, :], pcen_state=state)[0]
+        cold = extractor.extract_batch_features(window[np.newaxis, :])[0]
+        assert warm['pcen_mean'] == pytest.approx(cold['pcen_mean'])
+        assert 'pcen_mean_warm' not in cold
+    # après la première fenêtre, le lisseur continu diverge de la valeur à froid
+    assert warm['pcen_mean_warm'] != pytest.approx(warm['pcen_mean'])
+
+
+def assert_same_features(window, expected):
+    for key, value in expected.items():
+        if key in ('tranche_id', 'start_time'):
+            continue
+        if key == 'flatness_mean':
+            assert window[key] == pytest.approx(value, rel=1e-3), key
+        elif isinstance(value, float):
+            assert window[key] == pytest.approx(value, rel=1e-6, abs=1e-9), key
+        else:
+            assert window[key] == value, key
+
+
+def test_sliding_hop_equal_window_matches_disjoint_slices(audio, extractor):
+    sliding = AudioFeatureExtractor(sample_rate=SR, window_size=extractor.window_size,
+                                    hop_size=extractor.window_size)
+    windows = sliding.extract_sliding_features(audio)
+    slices = extractor.extract_file_features(audio)
+    assert len(windows) == len(slices)
+    for window, expected in zip(windows, slices):
+        assert_same_features(window, expected)
+
+
+# pas multiple de hop_length : trames partagées entre fenêtres ; sinon fenêtres traitées en lot
+@pytest.mark.parametrize("window_size, hop_size", [(2, 20 * 512 / SR), (2, 0.5), (2, 0.37)])
+def test_sliding_window_matches_isolated_slice(audio, window_size, hop_size):
+    sliding = AudioFeatureExtractor(sample_rate=SR, window_size=window_size, hop_size=hop_size)
+    windows = sliding.extract_sliding_features(audio)
+    length, hop = sliding.samples_per_window, sliding.samples_per_hop
+    for i, window in enumerate(windows):
+        start = i * hop
+        assert_same_features(window, sliding.extract_slice_features(audio[start:start + length]))
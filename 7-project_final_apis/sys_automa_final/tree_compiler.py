@@ -0,0 +1,199 @@
+# Copyright 2025 Montassar Nawara
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+Compilation des ensembles d'arbres sklearn en tableaux plats
+
+Tous les arbres d'un modèle (GradientBoosting, RandomForest, DecisionTree)
+sont concaténés dans des tableaux de nœuds (feature, seuil, fils, valeur) ;
+l'évaluation avance tous les couples (échantillon, arbre) d'un niveau à la
+fois, en max_depth opérations NumPy vectorisées.
+
+Les valeurs manquantes ne sont pas routées : comme les modèles sklearn
+entraînés ici (StandardScaler en amont), predict refuse une entrée NaN.
+"""
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor, ExtraTreesRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+TREE_LEAF = -1  # convention sklearn pour children_left/right d'une feuille
+
+
+class CompiledTreeEnsemble:
+    """Ensemble d'arbres sous forme de tableaux de nœuds, évaluation vectorisée
+
+      - GradientBoosting : constante de init_ + somme des learning_rate * feuille
+      - RandomForest     : somme des feuilles / n_arbres
+    Les sommes sont faites arbre par arbre dans l'ordre de sklearn, les
+    prédictions sont donc identiques au bit près.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_value, roots,
+                 max_depth, base, scale, n_features, averaging=False):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        # (n_noeuds, n_sorties) ; GradientBoosting : déjà multipliées par learning_rate (comme predict_stages)
+        self.leaf_value = leaf_value
+        self.roots = roots          # indice de la racine de chaque arbre
+        self.max_depth = int(max_depth)
+        self.base = np.asarray(base, dtype=np.float64)
+        self.scale = float(scale)
+        self.n_features = int(n_features)
+        self.averaging = averaging
+
+    @property
+    def n_outputs(self):
+        return self.leaf_value.shape[1]
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Convertit un régresseur sklearn entraîné"""
+        if isinstance(model, GradientBoostingRegressor):
+            trees = [est.tree_ for est in model.estimators_[:, 0]]
+            if model.init_ == 'zero':
+                base = np.zeros(1)
+            elif hasattr(model.init_, 'constant_'):
+                base = np.ravel(model.init_.constant_)
+            else:
+                raise ValueError(f"init_ non supporté: {type(model.init_).__name__}")
+            return cls.from_trees(trees, base, model.learning_rate, model.n_features_in_)
+        elif isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+            trees = [est.tree_ for est in model.estimators_]
+        elif isinstance(model, DecisionTreeRegressor):
+            trees = [model.tree_]
+        else:
+            raise ValueError(f"Modèle non supporté: {type(model).__name__}")
+        return cls.from_trees(trees, np.zeros(model.n_outputs_), 1.0, model.n_features_in_, averaging=True)
+
+    @classmethod
+    def from_trees(cls, trees, base, scale, n_features, averaging=False):
+        """Concatène les tableaux de nœuds de plusieurs sklearn.tree._tree.Tree"""
+        offsets = np.cumsum([0] + [t.node_count for t in trees])
+        n_nodes = offsets[-1]
+        n_outputs = trees[0].value.shape[1]
+
+        feature = np.zeros(n_nodes, dtype=np.int32)
+        threshold = np.zeros(n_nodes, dtype=np.float64)
+        left = np.zeros(n_nodes, dtype=np.int32)
+        right = np.zeros(n_nodes, dtype=np.int32)
+        value = np.zeros((n_nodes, n_outputs), dtype=np.float64)
+
+        for tree, offset in zip(trees, offsets[:-1]):
+            nodes = np.arange(offset, offset + tree.node_count)
+            is_leaf = tree.children_left == TREE_LEAF
+            # Une feuille pointe sur elle-même : la descente devient idempotente
+            feature[nodes] = np.where(is_leaf, 0, tree.feature)
+            threshold[nodes] = np.where(is_leaf, np.inf, tree.threshold)
+            left[nodes] = np.where(is_leaf, nodes, tree.children_left + offset)
+            right[nodes] = np.where(is_leaf, nodes, tree.children_right + offset)
+            value[nodes] = tree.value[:, :, 0]
+
+        max_depth = max(t.max_depth for t in trees)
+        leaf_value = value if averaging else scale * value
+        return cls(feature, threshold, left, right, leaf_value,
+                   offsets[:-1].astype(np.int32), max_depth, base, scale, n_features, averaging)
+
+    def to_arrays(self):
+        """Tableaux de nœuds + métadonnées scalaires (pour un stockage partagé / mmap)"""
+        arrays = {
+            'feature': self.feature, 'threshold': self.threshold,
+            'left': self.left, 'right': self.right,
+            'leaf_value': self.leaf_value,
+            'roots': self.roots, 'base': self.base
+        }
+        meta = {'max_depth': self.max_depth, 'scale': self.scale,
+                'n_features': self.n_features, 'averaging': bool(self.averaging)}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Reconstruit l'ensemble sans copie (les tableaux peuvent être des memmap)"""
+        return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                   arrays['leaf_value'], arrays['roots'], meta['max_depth'],
+                   arrays['base'], meta['scale'], meta['n_features'], meta['averaging'])
+
+    def leaves(self, X):
+        """Indice de feuille (n_échantillons, n_arbres) pour chaque couple"""
+        X = np.asarray(X, dtype=np.float32)
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            nodes = np.where(x <= self.threshold[nodes], self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, X):
+        """Même sortie que model.predict(X) (1-D si une seule sortie)"""
+        values = self.leaf_value[self.leaves(X)]      # (n, n_arbres, n_sorties)
+        start = np.broadcast_to(self.base, (values.shape[0], 1, self.n_outputs))
+        # cumsum est séquentiel : même ordre d'accumulation que sklearn
+        out = np.cumsum(np.concatenate([start, values], axis=1), axis=1)[:, -1]
+        if self.averaging:
+            out = out / len(self.roots)
+        return out[:, 0] if self.n_outputs == 1 else out
+
+
+def verify_against_sklearn(compiled, model, X, rtol=1e-9, atol=1e-6):
+    """Vrai si la version compilée reproduit model.predict(X) à la tolérance près"""
+    return np.allclose(compiled.predict(X), model.predict(X), rtol=rtol, atol=atol)
+
+def random_probe(n_features, n_rows=256, seed=0):
+    """Matrice de contrôle (features standardisées) couvrant largement les seuils"""
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=2.0, size=(n_rows, n_features)).astype(np.float32)
+
+def compile_verified(model, X_probe=None):
+    """Compile un modèle et le vérifie contre sklearn ; None si impossible ou différent"""
+    try:
+        compiled = CompiledTreeEnsemble.from_sklearn(model)
+        if X_probe is None:
+            X_probe = random_probe(compiled.n_features)
+        if verify_against_sklearn(compiled, model, X_probe):
+            return compiled
+        print(f"⚠️ {type(model).__name__} compilé différent de sklearn, predict sklearn conservé")
+    except Exception as e:
+        print(f"⚠️ {type(model).__name__} non compilable ({str(e)}), predict sklearn conservé")
+    return None
+
+
+if __name__ == "__main__":
+    # Vérification et mesure sur les modèles livrés
+    import time
+    import warnings
+    warnings.filterwarnings('ignore')
+    from inference_engine import DangerInferenceEngine
+
+    engine = DangerInferenceEngine(compiled_trees=False)
+    engine.load_models()
+    for group in (engine.slice_models, engine.file_models):
+        for name, model in group.items():
+            if name == 'preprocessor':
+                continue
+            compiled = CompiledTreeEnsemble.from_sklearn(model)
+            X = random_probe(compiled.n_features, n_rows=3)
+            t0 = time.perf_counter()
+            for _ in range(200):
+                model.predict(X)
+            t1 = time.perf_counter()
+            for _ in range(200):
+                compiled.predict(X)
+            t2 = time.perf_counter()
+            print(f"{name}: identique={verify_against_sklearn(compiled, model, random_probe(compiled.n_features))} "
+                  f"sklearn={(t1 - t0) / 200 * 1e3:.3f}ms compilé={(t2 - t1) / 200 * 1e3:.3f}ms")